@@ -0,0 +1,366 @@
+"""
+Vectorized sequence analysis.
+
+K-mer spectra, sliding-window GC / GC-skew / CpG profiles and CpG observed/expected,
+computed with NumPy over 2-bit base codes (rolling k-mer codes, `bincount` and
+cumulative sums) instead of Python loops. Sequences are read chunk by chunk, each
+chunk overlapping the previous one by what a k-mer or window needs, so memory
+stays bounded on sequences of hundreds of megabases.
+
+Each analysis is a consumer of those chunks (`KmerCounter`, `CpgCounter`,
+`WindowProfiler`), so `fused_pass` can run several of them over a single read of
+the sequence, decoding every chunk to base codes once for all of them.
+"""
+import math
+
+import numpy as np
+
+from app import seqfile
+
+# largest k for k-mer spectra: 4**12 counters take 128 MiB
+MAX_K = 12
+
+CHUNK_SIZE = seqfile.CHUNK_SIZE
+
+_C, _G = seqfile.BASES.index(b"C"), seqfile.BASES.index(b"G")
+
+
+class Chunk:
+    """
+    One step of a pass over a sequence: `data` holds the bases from `offset` on, the
+    first `fresh` of them repeating the end of the previous chunk. Base codes and the
+    A/C/G/T mask are computed on first use and shared by every consumer.
+    """
+
+    def __init__(self, data, offset, fresh):
+        self.data = data
+        self.offset = offset
+        self.fresh = fresh
+        self._codes = None
+        self._mask = None
+
+    @property
+    def codes(self):
+        if self._codes is None:
+            self._codes = seqfile.base_codes(self.data)
+        return self._codes
+
+    @property
+    def mask(self):
+        if self._mask is None:
+            self._mask = seqfile.base_mask(self.data)
+        return self._mask
+
+    def skip(self, overlap):
+        # where a consumer that needs `overlap` bases of the previous chunk starts reading
+        return self.fresh - min(self.fresh, overlap)
+
+
+def fused_pass(stored, consumers, chunk_size=CHUNK_SIZE):
+    """
+    Read `stored` once, passing every Chunk to each consumer's `update`; chunks repeat
+    as many previous bases as the largest consumer `overlap`.
+    """
+    overlap = max((consumer.overlap for consumer in consumers), default=0)
+    tail = b""
+    offset = 0
+    for chunk in stored.iter_chunks(chunk_size):
+        data = tail + chunk
+        step = Chunk(data, offset - len(tail), len(tail))
+        for consumer in consumers:
+            consumer.update(step)
+        tail = data[max(len(data) - overlap, 0):] if overlap else b""
+        offset += len(chunk)
+
+
+def _prefix_sum(values, dtype=np.int64):
+    # prefix[i] = values[:i].sum(), so any range sum is a single subtraction
+    out = np.zeros(len(values) + 1, dtype=dtype)
+    np.cumsum(values, dtype=dtype, out=out[1:])
+    return out
+
+
+def kmer_codes(codes, mask, k):
+    """
+    Rolling 2k-bit codes of every k-mer in `codes` made only of A/C/G/T.
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint32)
+    kmers = np.zeros(n, dtype=np.uint32)
+    for j in range(k):
+        kmers <<= 2
+        kmers |= codes[j:j + n]
+    # a k-mer is valid when none of its k positions is an N or other non-ACGT symbol
+    invalid = _prefix_sum(~mask)
+    return kmers[invalid[k:] == invalid[:n]]
+
+
+def canonical_kmer_codes(codes, mask, k):
+    """
+    Rolling uint64 codes (k <= 32) of every A/C/G/T-only k-mer, each the smaller of
+    the k-mer's code and its reverse complement's, so both strands give the same code.
+    Window codes are built by doubling (codes of length-p windows combine into
+    length-2p ones), so this takes O(log k) passes over the chunk instead of k.
+    """
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    # forward / reverse-complement codes of windows of `width` bases
+    power_fwd = codes.astype(np.uint64)
+    power_rev = np.uint64(3) - power_fwd  # the complement of base code c is 3 - c
+    width = 1
+    forward = reverse = None
+    size = 0
+    remaining = k
+    while True:
+        if remaining & 1:
+            if forward is None:
+                forward, reverse, size = power_fwd, power_rev, width
+            else:
+                count = len(forward) - width
+                forward = forward[:count] << np.uint64(2 * width)
+                forward |= power_fwd[size:size + count]
+                reverse = reverse[:count] | (power_rev[size:size + count] << np.uint64(2 * size))
+                size += width
+        remaining >>= 1
+        if not remaining:
+            break
+        count = len(power_fwd) - width
+        shifted = power_fwd[:count] << np.uint64(2 * width)
+        shifted |= power_fwd[width:]
+        power_fwd = shifted
+        shifted = power_rev[width:] << np.uint64(2 * width)
+        shifted |= power_rev[:count]
+        power_rev = shifted
+        width *= 2
+    canonical = np.minimum(forward, reverse, out=forward)
+    if mask.all():
+        return canonical
+    invalid = _prefix_sum(~mask)
+    return canonical[invalid[k:] == invalid[:n]]
+
+
+def kmer_string(code, k):
+    return "".join(chr(seqfile.BASES[(int(code) >> (2 * (k - 1 - j))) & 3]) for j in range(k))
+
+
+class KmerCounter:
+    """
+    Count every k-mer of the chunks it is fed; `totals` holds the 4**k counts indexed
+    by k-mer code. K-mers spanning non-ACGT symbols are skipped.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.overlap = k - 1
+        self.totals = np.zeros(4 ** k, dtype=np.int64)
+
+    def update(self, chunk):
+        start = chunk.skip(self.overlap)
+        kmers = kmer_codes(chunk.codes[start:], chunk.mask[start:], self.k)
+        size = len(self.totals)
+        if len(kmers) >= size:
+            self.totals += np.bincount(kmers, minlength=size)
+        elif len(kmers):
+            # sparse chunk: counting the distinct codes beats a dense 4**k histogram
+            values, counts = np.unique(kmers, return_counts=True)
+            self.totals[values] += counts
+
+
+def kmer_counts(stored, k, chunk_size=CHUNK_SIZE):
+    """
+    Count every k-mer of `stored` (a PackedSequence or TextSequence); returns an
+    int64 array of 4**k counts indexed by k-mer code. K-mers spanning non-ACGT
+    symbols are skipped.
+    """
+    counter = KmerCounter(k)
+    fused_pass(stored, [counter], chunk_size)
+    return counter.totals
+
+
+def _top_codes(totals, top):
+    """
+    Codes of the `top` highest non-zero counts, highest first (ties broken by code).
+    Linear time: the cut-off count comes from a histogram of the counts, not a sort.
+    """
+    highest = int(totals.max())
+    if highest == 0:
+        return np.empty(0, dtype=np.int64)
+    if highest > len(totals):
+        # few k-mers with huge counts (small k): a partial sort is cheap
+        cutoff = int(np.partition(totals, len(totals) - top)[len(totals) - top])
+    else:
+        # at_least[c] = number of k-mers seen at least c times
+        at_least = np.cumsum(np.bincount(totals)[::-1])[::-1]
+        cutoff = int(np.flatnonzero(at_least >= top)[-1])
+    cutoff = max(cutoff, 1)
+    best = np.flatnonzero(totals > cutoff)
+    best = np.concatenate((best, np.flatnonzero(totals == cutoff)[:top - len(best)]))
+    return best[np.lexsort((best, -totals[best]))]
+
+
+def kmer_summary(totals, k, top=20, max_multiplicity=100):
+    """
+    Summarize k-mer counts: totals, the `top` most frequent k-mers and the spectrum
+    (how many distinct k-mers occur m times, for m up to `max_multiplicity`).
+    """
+    total = int(totals.sum())
+    best = _top_codes(totals, min(top, len(totals)))
+    spectrum = np.bincount(np.minimum(totals, max_multiplicity + 1), minlength=max_multiplicity + 2)
+    return {
+        "k": k,
+        "total_kmers": total,
+        "distinct_kmers": int(len(totals) - spectrum[0]),
+        "possible_kmers": int(len(totals)),
+        "top": [
+            {"kmer": kmer_string(code, k), "count": int(totals[code]),
+             "percent": round(int(totals[code]) / total * 100, 3)}
+            for code in best
+        ],
+        "spectrum": [
+            {"multiplicity": m, "kmers": int(spectrum[m])}
+            for m in range(1, max_multiplicity + 1) if spectrum[m]
+        ],
+        "spectrum_overflow": int(spectrum[max_multiplicity + 1]),
+    }
+
+
+class CpgCounter:
+    """
+    Whole-sequence C, G, CpG and A/C/G/T counts of the chunks it is fed.
+    """
+
+    overlap = 1
+
+    def __init__(self):
+        self.c = self.g = self.cg = self.valid = 0
+
+    def update(self, chunk):
+        start = chunk.skip(self.overlap)
+        codes, mask, fresh = chunk.codes[start:], chunk.mask[start:], chunk.fresh - start
+        is_c = (codes == _C) & mask
+        is_g = (codes == _G) & mask
+        self.c += int(np.count_nonzero(is_c[fresh:]))
+        self.g += int(np.count_nonzero(is_g[fresh:]))
+        self.valid += int(np.count_nonzero(mask[fresh:]))
+        self.cg += int(np.count_nonzero(is_c[:-1] & is_g[1:]))
+
+    def summary(self):
+        return {"CG_count": self.cg, "obs_exp": _ratio(self.cg * self.valid, self.c * self.g)}
+
+
+def cpg_summary(stored, chunk_size=CHUNK_SIZE):
+    """
+    Whole-sequence CpG observed/expected: CG * N / (C * G), N counting A/C/G/T only.
+    """
+    counter = CpgCounter()
+    fused_pass(stored, [counter], chunk_size)
+    return counter.summary()
+
+
+def _ratio(num, den, digits=4):
+    return round(num / den, digits) if den else None
+
+
+def _column(num, den, scale=1.0, digits=4):
+    # elementwise num / den with None where the denominator is zero (JSON has no NaN)
+    return [round(float(n) / float(d) * scale, digits) if d else None for n, d in zip(num, den)]
+
+
+class WindowProfiler:
+    """
+    GC, GC-skew and CpG counts over windows of `window` bases every `step` bases, from
+    the chunks of a sequence of `length` bases. A window's counts are differences of
+    running prefix counts at its two ends, so each chunk adds the prefix values at the
+    window ends it holds to those windows' buckets and subtracts the values at window
+    starts: every base is read once, however much the windows overlap.
+    """
+
+    overlap = 1
+
+    def __init__(self, length, window, step, max_points=1000):
+        self.window = min(window, length)
+        self.step = step
+        self.n_windows = (length - self.window) // step + 1
+        self.factor = math.ceil(self.n_windows / max_points)
+        self.n_buckets = math.ceil(self.n_windows / self.factor)
+        # per bucket: G, C and A/C/G/T counts, then CpG pairs
+        self._sums = np.zeros((4, self.n_buckets), dtype=np.int64)
+        # prefix counts up to the current chunk: G, C, A/C/G/T bases before its fresh
+        # bases, and CpG pairs starting before its first base
+        self._before = np.zeros(3, dtype=np.int64)
+        self._pairs_before = np.zeros(1, dtype=np.int64)
+
+    def _accumulate(self, rows, lo, hi, prefix, origin, before, shift, sign):
+        # windows j whose point j * step + shift lies in [lo, hi] take
+        # sign * (before + prefix[:, point - origin]) into their buckets
+        first = max(0, -((shift - lo) // self.step))
+        last = min(self.n_windows - 1, (hi - shift) // self.step)
+        if first > last:
+            return
+        # the points are evenly spaced: a strided view, no gather
+        begin = first * self.step + shift - origin
+        values = prefix[:, begin:begin + (last - first) * self.step + 1:self.step]
+        # runs of consecutive windows sharing a bucket
+        bucket = first // self.factor
+        cuts = np.arange((bucket + 1) * self.factor, last + 1, self.factor) - first
+        cuts = np.concatenate(([0], cuts))
+        sizes = np.diff(cuts, append=last - first + 1)
+        totals = np.add.reduceat(values, cuts, axis=1, dtype=np.int64)
+        totals += before[:, None] * sizes
+        self._sums[rows, bucket:bucket + len(cuts)] += sign * totals
+
+    def update(self, chunk):
+        start = chunk.skip(self.overlap)
+        codes, mask, fresh = chunk.codes[start:], chunk.mask[start:], chunk.fresh - start
+        is_c = (codes == _C) & mask
+        is_g = (codes == _G) & mask
+        # fresh bases cover positions [a, b)
+        a = chunk.offset + chunk.fresh
+        b = chunk.offset + len(chunk.data)
+
+        # bases before position a + i, counted from a: points in (a, b]
+        counts = np.stack([is_g[fresh:], is_c[fresh:], mask[fresh:]])
+        prefix = np.zeros((3, counts.shape[1] + 1), dtype=np.int32)
+        np.cumsum(counts, axis=1, dtype=np.int32, out=prefix[:, 1:])
+        self._accumulate(slice(0, 3), a + 1, b, prefix, a, self._before, 0, -1)
+        self._accumulate(slice(0, 3), a + 1, b, prefix, a, self._before, self.window, 1)
+        self._before += prefix[:, -1]
+
+        # CpG pairs starting before position a - fresh + i (a pair is complete once its
+        # G is read): points in [a, b - 1]; a window holds the pairs starting in
+        # [start, end - 1)
+        pairs = _prefix_sum(is_c[:-1] & is_g[1:], np.int32)[None]
+        self._accumulate(slice(3, 4), a, b - 1, pairs, a - fresh, self._pairs_before, 0, -1)
+        self._accumulate(slice(3, 4), a, b - 1, pairs, a - fresh, self._pairs_before, self.window - 1, 1)
+        self._pairs_before += pairs[0, -1]
+
+    def profile(self):
+        g, c, valid, cg = self._sums
+        first = np.arange(self.n_buckets, dtype=np.int64) * self.factor
+        last = np.minimum(first + self.factor, self.n_windows) - 1
+        return {
+            "window": self.window,
+            "step": self.step,
+            "windows": int(self.n_windows),
+            "bucket_size": int(self.factor),
+            "points": int(self.n_buckets),
+            "start": (first * self.step + 1).tolist(),
+            "end": (last * self.step + self.window).tolist(),
+            "gc_percent": _column(g + c, valid, 100, 3),
+            "gc_skew": _column(g - c, g + c),
+            "cpg_obs_exp": _column(cg * valid, c * g),
+        }
+
+
+def window_profile(stored, window, step, max_points=1000, chunk_size=CHUNK_SIZE):
+    """
+    GC percent, GC skew (G - C) / (G + C) and CpG observed/expected over windows of
+    `window` bases every `step` bases. When there are more than `max_points` windows,
+    consecutive windows are merged into buckets (their counts summed), so the output
+    stays small enough to plot while still covering every window.
+    """
+    profiler = WindowProfiler(len(stored), window, step, max_points)
+    fused_pass(stored, [profiler], chunk_size)
+    return profiler.profile()
@@ -0,0 +1,658 @@
+"""
+SQLite-backed catalog of stored sequences.
+
+Keeps id, location (relative to DATA_DIR), optional name (e.g. a FASTA header),
+length, preview, mtime, compressed state and content hash for every sequence so that listing does not have to scan
+and read the data directory. Symbol counts are kept in a `stats` table keyed by content hash,
+filled in the same pass that writes or scans a sequence (see `app/stats.py`), as are
+MinHash sketches and their LSH buckets (`sketches`, `lsh`; see `app/sketch.py`).
+
+Sequences live in content-addressed blobs (see `app/storage.py`) that several ids may
+share; the rows pointing at a file are its references. Every row is mirrored by a
+reference file (`data/refs/ab/<id>.ref`, see `ref_path`) that survives the loss of
+the database, since a blob's name carries no id. Writes that move files run
+inside `transaction()`, which holds the database write lock across threads and
+processes. Rebuild from an existing data folder with:
+
+    python -m app.catalog rebuild
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+from app import compression, seqfile, sketch
+from app.config import BLOB_DIR, DATA_DIR, REF_DIR
+
+CATALOG_PATH = os.path.join(DATA_DIR, "catalog.db")
+
+REF_EXT = ".ref"
+
+# number of bases kept as preview
+PREVIEW_LEN = 20
+
+# columns the list endpoint may sort on
+SORT_COLUMNS = {"mtime": "mtime", "length": "length", "id": "id"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequences (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    length INTEGER,
+    preview TEXT,
+    mtime REAL NOT NULL,
+    compressed INTEGER NOT NULL DEFAULT 0,
+    content_hash TEXT,
+    name TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sequences_mtime ON sequences (mtime);
+CREATE INDEX IF NOT EXISTS idx_sequences_length ON sequences (length);
+CREATE INDEX IF NOT EXISTS idx_sequences_hash ON sequences (content_hash);
+CREATE TABLE IF NOT EXISTS stats (
+    content_hash TEXT PRIMARY KEY,
+    length INTEGER NOT NULL,
+    counts TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sketches (
+    content_hash TEXT PRIMARY KEY,
+    kmers INTEGER NOT NULL,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lsh (
+    bucket INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lsh_bucket ON lsh (bucket);
+CREATE INDEX IF NOT EXISTS idx_lsh_hash ON lsh (content_hash);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# bound parameters per SQLite statement
+_BATCH = 500
+
+# columns added after the first release: name -> definition
+_ADDED_COLUMNS = {"name": "TEXT"}
+
+
+_local = threading.local()
+
+
+def _connect():
+    conn = sqlite3.connect(CATALOG_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Run the block inside one write transaction that holds the catalog's write lock
+    (BEGIN IMMEDIATE), so file moves and the rows referencing those files change
+    atomically with respect to every other writer. Catalog writes made in the
+    block, by this thread, join the transaction. Yields the connection.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+    with closing(_connect()) as conn:
+        conn.isolation_level = None
+        conn.execute("BEGIN IMMEDIATE")
+        _local.conn = conn
+        _local.after_commit = []
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            _local.conn = None
+            callbacks, _local.after_commit = _local.after_commit, []
+    for callback in callbacks:
+        callback()
+
+
+def after_commit(callback):
+    """
+    Run `callback` once this thread's transaction has committed (right away outside
+    one), in registration order; it is dropped if the transaction rolls back. Used
+    for work other readers must not see before the new rows, such as deleting files.
+    """
+    if getattr(_local, "conn", None) is None:
+        callback()
+    else:
+        _local.after_commit.append(callback)
+
+
+@contextmanager
+def _reader():
+    # reads see this thread's open transaction, if any
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+    with closing(_connect()) as conn:
+        yield conn
+
+
+def init():
+    """
+    Create the catalog schema; populate it from the data folder on first run.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    is_new = not os.path.exists(CATALOG_PATH)
+    with closing(_connect()) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _migrate(conn)
+    if is_new:
+        rebuild()
+    elif not os.path.isdir(REF_DIR):
+        # catalogs written before reference files existed
+        with transaction() as conn:
+            for row in conn.execute("SELECT id, filename, name, mtime FROM sequences").fetchall():
+                _write_ref(row["id"], row["filename"], row["name"], row["mtime"])
+        os.makedirs(REF_DIR, exist_ok=True)
+
+
+def _migrate(conn):
+    existing = {row["name"] for row in conn.execute("PRAGMA table_info(sequences)")}
+    for column, definition in _ADDED_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE sequences ADD COLUMN {column} {definition}")
+
+
+def id_from_filename(filename):
+    """
+    Map `id.gv2`, `id.txt`, legacy `id_name.txt` (and their `.gvz` / `.gz`) to the sequence id.
+    """
+    return filename.split(".", 1)[0].split("_", 1)[0]
+
+
+def is_raw_file(filename):
+    return filename.endswith((seqfile.PACKED_EXT, seqfile.TEXT_EXT))
+
+
+def _priority(filename, seq_id):
+    # native id.gv2 > plain id.txt > legacy id_name.txt
+    if filename == seq_id + seqfile.PACKED_EXT:
+        return 2
+    if filename == seq_id + seqfile.TEXT_EXT:
+        return 1
+    return 0
+
+
+def scan_file(path):
+    """
+    Stream a stored sequence file and return (length, preview, sha256 hex, {symbol: count}, Sketch).
+    """
+    digest = hashlib.sha256()
+    hist = None
+    sketcher = sketch.Sketcher()
+    with seqfile.open_sequence(path) as seq:
+        for chunk in seq.iter_chunks():
+            digest.update(chunk)
+            hist = seqfile.byte_histogram(chunk, hist)
+            sketcher.update(chunk)
+        preview = seq.slice(0, PREVIEW_LEN)
+        length = len(seq)
+    return (length, preview.decode("ascii", "replace"), digest.hexdigest(),
+            seqfile.histogram_counts(hist), sketcher.sketch())
+
+
+def content_hash(sequence):
+    """
+    Content hash used by the catalog for an in-memory, normalized sequence (str or bytes).
+    """
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii")
+    return hashlib.sha256(sequence).hexdigest()
+
+
+def summarize(sequence):
+    """
+    Catalog summary (length, preview, sha256 hex, {symbol: count}, Sketch) of an
+    in-memory, normalized sequence (str or bytes).
+    """
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii")
+    counts = seqfile.histogram_counts(seqfile.byte_histogram(sequence))
+    sk = sketch.sketch_chunks(sequence[i:i + seqfile.CHUNK_SIZE]
+                              for i in range(0, len(sequence), seqfile.CHUNK_SIZE))
+    return len(sequence), sequence[:PREVIEW_LEN].decode("ascii"), content_hash(sequence), counts, sk
+
+
+def _upsert(conn, row):
+    conn.execute(
+        """
+        INSERT INTO sequences (id, filename, length, preview, mtime, compressed, content_hash, name)
+        VALUES (:id, :filename, :length, :preview, :mtime, :compressed, :content_hash, :name)
+        ON CONFLICT(id) DO UPDATE SET
+            filename = excluded.filename,
+            length = excluded.length,
+            preview = excluded.preview,
+            mtime = excluded.mtime,
+            compressed = excluded.compressed,
+            content_hash = excluded.content_hash,
+            name = COALESCE(excluded.name, sequences.name)
+        """,
+        row,
+    )
+
+
+def _put_stats(conn, digest, length, counts):
+    conn.execute(
+        "INSERT OR REPLACE INTO stats (content_hash, length, counts) VALUES (?, ?, ?)",
+        (digest, length, json.dumps(counts, sort_keys=True)),
+    )
+
+
+def _put_sketch(conn, digest, sk):
+    conn.execute(
+        "INSERT OR REPLACE INTO sketches (content_hash, kmers, signature) VALUES (?, ?, ?)",
+        (digest, sk.kmers, sketch.to_bytes(sk.signature)),
+    )
+    conn.execute("DELETE FROM lsh WHERE content_hash = ?", (digest,))
+    conn.executemany(
+        "INSERT INTO lsh (bucket, content_hash) VALUES (?, ?)",
+        [(bucket, digest) for bucket in sketch.buckets(sk.signature)],
+    )
+
+
+def ref_path(seq_id):
+    """
+    Path of the reference file of `seq_id`: its row's filename, name and mtime as JSON.
+    """
+    return os.path.join(REF_DIR, seq_id[:2], seq_id + REF_EXT)
+
+
+def _write_ref(seq_id, filename, name, mtime):
+    path = ref_path(seq_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"filename": filename, "name": name, "mtime": mtime}, f)
+    os.replace(tmp, path)
+
+
+def refs():
+    """
+    Yield (id, filename, name, mtime) for every reference file; unreadable ones are skipped.
+    """
+    for root, _, files in os.walk(REF_DIR):
+        for file in files:
+            if not file.endswith(REF_EXT):
+                continue
+            try:
+                with open(os.path.join(root, file)) as f:
+                    ref = json.load(f)
+                yield file[:-len(REF_EXT)], ref["filename"], ref.get("name"), ref.get("mtime")
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+
+
+def _prune_stats(conn, digest):
+    # drop the stats and sketch of a content hash no sequence refers to any more
+    if digest is None:
+        return
+    unused = conn.execute("SELECT 1 FROM sequences WHERE content_hash = ?", (digest,)).fetchone() is None
+    if unused:
+        for table in ("stats", "sketches", "lsh"):
+            conn.execute(f"DELETE FROM {table} WHERE content_hash = ?", (digest,))
+
+
+def _old_hash(conn, seq_id):
+    row = conn.execute("SELECT content_hash FROM sequences WHERE id = ?", (seq_id,)).fetchone()
+    return row["content_hash"] if row else None
+
+
+def record(seq_id, path, sequence=None, compressed=False, name=None, summary=None, mtime=None):
+    """
+    Insert or refresh the catalog entry (and content stats) for a sequence stored at `path`.
+    Pass the normalized `sequence` when it is already in memory, or a precomputed
+    (length, preview, sha256 hex, {symbol: count}, Sketch) `summary` from a streaming
+    writer, to avoid rereading the file. A `name` of None keeps the existing name.
+    `mtime` is when the id was written (default: now), not the file's mtime, which
+    a shared blob keeps from its first writer.
+    """
+    if summary is None:
+        summary = scan_file(path) if sequence is None else summarize(sequence)
+    length, preview, digest, counts, sk = summary
+    row = {
+        "id": seq_id,
+        "filename": os.path.relpath(path, DATA_DIR),
+        "length": length,
+        "preview": preview,
+        "mtime": time.time() if mtime is None else mtime,
+        "compressed": int(compressed),
+        "content_hash": digest,
+        "name": name,
+    }
+    with transaction() as conn:
+        previous = _old_hash(conn, seq_id)
+        _upsert(conn, row)
+        # ids sharing a file share its compressed state
+        conn.execute("UPDATE sequences SET compressed = :compressed WHERE filename = :filename", row)
+        _put_stats(conn, digest, length, counts)
+        _put_sketch(conn, digest, sk)
+        if previous != digest:
+            _prune_stats(conn, previous)
+        current = conn.execute("SELECT name, mtime FROM sequences WHERE id = ?", (seq_id,)).fetchone()
+        _write_ref(seq_id, row["filename"], current["name"], current["mtime"])
+
+
+def set_compressed(path, compressed=True):
+    # the compressed artifact belongs to the file, so every id sharing it changes
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE sequences SET compressed = ? WHERE filename = ?",
+            (int(compressed), os.path.relpath(path, DATA_DIR)),
+        )
+
+
+def ids_at(path):
+    """
+    Ids of the catalogued sequences stored at `path`.
+    """
+    with _reader() as conn:
+        rows = conn.execute(
+            "SELECT id FROM sequences WHERE filename = ? ORDER BY id", (os.path.relpath(path, DATA_DIR),)
+        ).fetchall()
+    return [row["id"] for row in rows]
+
+
+def references(path):
+    """
+    Number of catalogued ids whose sequence is stored at `path`.
+    """
+    with _reader() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM sequences WHERE filename = ?", (os.path.relpath(path, DATA_DIR),)
+        ).fetchone()[0]
+
+
+def remove(seq_id):
+    with transaction() as conn:
+        previous = _old_hash(conn, seq_id)
+        conn.execute("DELETE FROM sequences WHERE id = ?", (seq_id,))
+        _prune_stats(conn, previous)
+        try:
+            os.remove(ref_path(seq_id))
+        except FileNotFoundError:
+            pass
+
+
+def count():
+    """
+    Number of catalogued sequences.
+    """
+    with _reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM sequences").fetchone()[0]
+
+
+def rebuilt_at():
+    """
+    Time of the last `rebuild`, or None.
+    """
+    with _reader() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'rebuilt_at'").fetchone()
+    return float(row["value"]) if row else None
+
+
+def get(seq_id):
+    with _reader() as conn:
+        row = conn.execute("SELECT * FROM sequences WHERE id = ?", (seq_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def get_stats(seq_id):
+    """
+    Return {content_hash, filename, length, counts} for a sequence; counts is None when
+    no stats were stored for its content yet. None if the id is not catalogued.
+    """
+    with _reader() as conn:
+        row = conn.execute(
+            """
+            SELECT s.content_hash, s.filename, t.length, t.counts
+            FROM sequences s LEFT JOIN stats t ON t.content_hash = s.content_hash
+            WHERE s.id = ?
+            """,
+            (seq_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    stats = dict(row)
+    if stats["counts"] is not None:
+        stats["counts"] = json.loads(stats["counts"])
+    return stats
+
+
+def scan_stats(seq_id, path):
+    """
+    Rescan the sequence file at `path` and store its length, hash and stats
+    (for entries catalogued before stats existed). Returns the same dict as `get_stats`.
+    """
+    length, preview, digest, counts, sk = scan_file(path)
+    filename = os.path.relpath(path, DATA_DIR)
+    with transaction() as conn:
+        previous = _old_hash(conn, seq_id)
+        conn.execute(
+            "UPDATE sequences SET length = ?, preview = ?, content_hash = ? WHERE id = ? AND filename = ?",
+            (length, preview, digest, seq_id, filename),
+        )
+        _put_stats(conn, digest, length, counts)
+        _put_sketch(conn, digest, sk)
+        if previous != digest:
+            _prune_stats(conn, previous)
+    return {"content_hash": digest, "filename": filename, "length": length, "counts": counts}
+
+
+def get_sketch(digest):
+    """
+    The stored Sketch of a content hash, or None.
+    """
+    with _reader() as conn:
+        row = conn.execute("SELECT kmers, signature FROM sketches WHERE content_hash = ?", (digest,)).fetchone()
+    return sketch.Sketch(row["kmers"], sketch.from_bytes(row["signature"])) if row else None
+
+
+def scan_sketch(digest, path):
+    """
+    Sketch the sequence file at `path` (content hash `digest`) and store the sketch,
+    for content catalogued before sketches were kept. Returns the Sketch.
+    """
+    sketcher = sketch.Sketcher()
+    with seqfile.open_sequence(path) as seq:
+        for chunk in seq.iter_chunks():
+            sketcher.update(chunk)
+    sk = sketcher.sketch()
+    with transaction() as conn:
+        _put_sketch(conn, digest, sk)
+    return sk
+
+
+def sketch_candidates(buckets, exclude=None):
+    """
+    (content_hash, kmers, signature) of every sketch sharing at least one LSH bucket
+    in `buckets`, except the content hash `exclude`.
+    """
+    with _reader() as conn:
+        hashes = set()
+        for i in range(0, len(buckets), _BATCH):
+            batch = buckets[i:i + _BATCH]
+            marks = ",".join("?" * len(batch))
+            hashes.update(row[0] for row in conn.execute(
+                f"SELECT DISTINCT content_hash FROM lsh WHERE bucket IN ({marks})", batch))
+        hashes.discard(exclude)
+        hashes = sorted(hashes)
+        candidates = []
+        for i in range(0, len(hashes), _BATCH):
+            batch = hashes[i:i + _BATCH]
+            marks = ",".join("?" * len(batch))
+            candidates += [
+                (row["content_hash"], row["kmers"], sketch.from_bytes(row["signature"]))
+                for row in conn.execute(
+                    f"SELECT content_hash, kmers, signature FROM sketches WHERE content_hash IN ({marks})", batch)
+            ]
+    return candidates
+
+
+def ids_by_hash(hashes):
+    """
+    {content_hash: [{id, name, length}, ...]} for the catalogued sequences with those content hashes.
+    """
+    hashes = list(hashes)
+    found = {}
+    with _reader() as conn:
+        for i in range(0, len(hashes), _BATCH):
+            batch = hashes[i:i + _BATCH]
+            marks = ",".join("?" * len(batch))
+            for row in conn.execute(
+                f"SELECT id, name, length, content_hash FROM sequences WHERE content_hash IN ({marks}) ORDER BY id",
+                batch,
+            ):
+                found.setdefault(row["content_hash"], []).append(
+                    {"id": row["id"], "name": row["name"], "length": row["length"]})
+    return found
+
+
+def entries():
+    """
+    Yield (id, filename, compressed) for every catalogued sequence.
+    """
+    with _reader() as conn:
+        rows = conn.execute("SELECT id, filename, compressed FROM sequences").fetchall()
+    for row in rows:
+        yield row["id"], row["filename"], bool(row["compressed"])
+
+
+def list_page(limit=100, offset=0, sort="mtime", order="desc"):
+    """
+    Return (rows, total) for one page of the catalog.
+    """
+    column = SORT_COLUMNS[sort]
+    direction = "ASC" if order == "asc" else "DESC"
+    with _reader() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM sequences").fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM sequences ORDER BY {column} {direction}, id {direction} LIMIT ? OFFSET ?",
+            (limit, offset),
+        ).fetchall()
+    return [dict(r) for r in rows], total
+
+
+def _scan_row(seq_id, path):
+    try:
+        length, preview, digest, counts, sk = scan_file(path)
+    except (OSError, seqfile.FormatError):
+        length, preview, digest, counts, sk = None, None, None, None, None
+    return {
+        "id": seq_id,
+        "filename": os.path.relpath(path, DATA_DIR),
+        "length": length,
+        "preview": preview,
+        "mtime": os.path.getmtime(path),
+        "compressed": 0,
+        "content_hash": digest,
+        "counts": counts,
+        "sketch": sk,
+    }
+
+
+def rebuild():
+    """
+    Drop all entries and reindex every sequence file in the data folder, including
+    shard subdirectories and legacy `id_*.txt` names (exact `id.gv2` / `id.txt` win).
+    Blobs carry no id, so the ids referencing a file, and when each was written, are
+    taken from the reference files, and from the current catalog for ids without one
+    (both win over per-id files, whose mtime is the file's). Rewrites every reference
+    file and, when it found any sequence, records the time of the rebuild (see
+    `storage.collect_garbage`). Returns the number of sequences indexed.
+    """
+    rows = {}
+    priorities = {}
+    compressed = set()
+    skipped = {os.path.basename(BLOB_DIR), os.path.basename(REF_DIR)}
+    for root, dirs, files in os.walk(DATA_DIR):
+        if root == DATA_DIR:
+            dirs[:] = [d for d in dirs if d not in skipped]
+        for file in files:
+            seq_id = id_from_filename(file)
+            if file.endswith((".gz", compression.COMPRESSED_EXT)):
+                compressed.add(seq_id)
+            if not is_raw_file(file):
+                continue
+            priority = _priority(file, seq_id)
+            if seq_id in rows and priorities[seq_id] >= priority:
+                continue
+            rows[seq_id] = _scan_row(seq_id, os.path.join(root, file))
+            priorities[seq_id] = priority
+
+    with closing(_connect()) as conn:
+        conn.executescript(_SCHEMA)
+        _migrate(conn)
+        # names and blob references only live in the catalog and the reference files, so carry them over
+        names = dict(conn.execute("SELECT id, name FROM sequences WHERE name IS NOT NULL").fetchall())
+        references = conn.execute("SELECT id, filename, mtime FROM sequences").fetchall()
+    for seq_id, filename, name, mtime in refs():
+        references.append((seq_id, filename, mtime))
+        if name is not None:
+            names[seq_id] = name
+    scanned = {}
+    for seq_id, filename, mtime in references:
+        path = os.path.join(DATA_DIR, filename)
+        if os.path.commonpath([os.path.abspath(path), os.path.abspath(BLOB_DIR)]) != os.path.abspath(BLOB_DIR):
+            continue
+        if not os.path.exists(path):
+            continue
+        if filename not in scanned:
+            scanned[filename] = _scan_row(None, path)
+        rows[seq_id] = dict(scanned[filename], id=seq_id)
+        if mtime is not None:
+            rows[seq_id]["mtime"] = mtime
+        if os.path.exists(os.path.splitext(path)[0] + compression.COMPRESSED_EXT):
+            compressed.add(seq_id)
+
+    with transaction() as conn:
+        conn.execute("DELETE FROM sequences")
+        for table in ("stats", "sketches", "lsh"):
+            conn.execute(f"DELETE FROM {table}")
+        for row in rows.values():
+            counts = row.pop("counts")
+            sk = row.pop("sketch")
+            row["compressed"] = int(row["id"] in compressed)
+            row["name"] = names.get(row["id"])
+            _upsert(conn, row)
+            _write_ref(row["id"], row["filename"], row["name"], row["mtime"])
+            if counts is not None:
+                _put_stats(conn, row["content_hash"], row["length"], counts)
+                _put_sketch(conn, row["content_hash"], sk)
+        if rows:
+            # an empty result is already refused by gc as an empty catalog
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rebuilt_at', ?)", (str(time.time()),))
+    os.makedirs(REF_DIR, exist_ok=True)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the GENOVISTA sequence catalog.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="reindex all sequences in the data folder")
+    args = parser.parse_args(argv)
+    if args.command == "rebuild":
+        os.makedirs(DATA_DIR, exist_ok=True)
+        count = rebuild()
+        print(f"Indexed {count} sequences from {os.path.abspath(DATA_DIR)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""
+Pluggable compression codecs for stored sequences.
+
+Every codec compresses a block of ASCII bases to bytes and back. Compressed
+artifacts (`id.gvz`) are a BGZF-style container: the sequence is split into
+independently compressed blocks with an offset index at the end, so a region can
+be read by decompressing only the blocks that overlap it. The header records
+which codec wrote the file, so decompression never has to be told:
+
+    header  <4s Q I B>  magic b"GVZ\\x02", length in bases, crc32 of the text, codec name length
+            codec name (ASCII)
+    blocks  <I I I>     bases in block, payload bytes, crc32 of the block text; codec payload
+    index   <Q Q>       per block: first base, file offset of the block
+    footer  <Q I 4s>    index offset, block count, b"GVZI"
+
+Plain gzip files written by older versions (`id.txt.gz`) are still readable, sequentially.
+
+Registered codecs:
+    gzip-1/6/9, zlib-1/6/9, lzma, bz2        general-purpose, on the ASCII text
+    2bit, 2bit-huffman, 2bit-lzma            2-bit packing, optionally entropy coded
+    cm2, cm12                                order-k context model + arithmetic coder
+"""
+import bisect
+import bz2
+import gzip
+import lzma
+import os
+import struct
+import zlib
+
+from app import metrics, seqfile
+
+COMPRESSED_EXT = ".gvz"
+DEFAULT_CODEC = "gzip-9"
+
+MAGIC = b"GVZ\x02"
+INDEX_MAGIC = b"GVZI"
+GZIP_MAGIC = b"\x1f\x8b"
+_HEADER = struct.Struct("<4sQIB")
+_BLOCK = struct.Struct("<III")
+_INDEX = struct.Struct("<QQ")
+_FOOTER = struct.Struct("<QI4s")
+_EXCEPTION = struct.Struct("<IIB")
+
+# default bases per block: small enough that a region read touches little data
+BLOCK_SIZE = 1 << 16
+
+# largest block of the context-model codecs: their model holds a Python list per
+# context seen in the block (~200 MB for cm12 on a 1 MiB block)
+CM_MAX_BLOCK_SIZE = int(os.environ.get("GENOVISTA_CM_MAX_BLOCK", str(1 << 18)))
+
+CODECS = {}
+
+
+class CodecError(ValueError):
+    pass
+
+
+class Codec:
+    def __init__(self, name, compress, decompress, description, max_block_size=None):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+        self.description = description
+        self.max_block_size = max_block_size
+
+    def check_block_size(self, block_size):
+        if self.max_block_size is not None and block_size > self.max_block_size:
+            raise CodecError(f"Codec '{self.name}' takes blocks of at most {self.max_block_size} bases.")
+
+
+def register(name, compress, decompress, description="", max_block_size=None):
+    """
+    Register a codec. `compress(data) -> bytes`, `decompress(payload, length) -> bytes`;
+    `max_block_size` bounds the bases per block for codecs whose memory grows with it.
+    """
+    CODECS[name] = Codec(name, compress, decompress, description, max_block_size)
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise CodecError(f"Unknown codec '{name}'. Available: {', '.join(CODECS)}")
+
+
+# --- general-purpose codecs on the ASCII text ---
+
+for _level in (1, 6, 9):
+    register(
+        f"gzip-{_level}",
+        lambda data, level=_level: gzip.compress(data, compresslevel=level, mtime=0),
+        lambda payload, length: gzip.decompress(payload),
+        f"gzip level {_level} on ASCII text",
+    )
+    register(
+        f"zlib-{_level}",
+        lambda data, level=_level: zlib.compress(data, level),
+        lambda payload, length: zlib.decompress(payload),
+        f"zlib level {_level} on ASCII text",
+    )
+
+register("lzma", lambda data: lzma.compress(data, preset=6), lambda payload, length: lzma.decompress(payload),
+         "LZMA (xz preset 6) on ASCII text")
+register("bz2", lambda data: bz2.compress(data, 9), lambda payload, length: bz2.decompress(payload),
+         "bzip2 level 9 on ASCII text")
+
+
+# --- 2-bit codecs: exception table + packed (or coded) bases ---
+
+def _split_exceptions(data):
+    runs = seqfile.exception_runs(data)
+    table = struct.pack("<I", len(runs)) + b"".join(_EXCEPTION.pack(*run) for run in runs)
+    return table, runs
+
+
+def _read_exceptions(payload):
+    (count,) = struct.unpack_from("<I", payload, 0)
+    offset = 4
+    runs = []
+    for _ in range(count):
+        runs.append(_EXCEPTION.unpack_from(payload, offset))
+        offset += _EXCEPTION.size
+    return runs, payload[offset:]
+
+
+def _two_bit(encode, decode):
+    def compress(data):
+        table, _ = _split_exceptions(data)
+        return table + encode(seqfile.pack_bases(data))
+
+    def decompress(payload, length):
+        runs, body = _read_exceptions(payload)
+        return seqfile.unpack_bases(decode(body), length, runs)
+
+    return compress, decompress
+
+
+def _huffman(data):
+    coder = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_HUFFMAN_ONLY)
+    return coder.compress(data) + coder.flush()
+
+
+register("2bit", *_two_bit(bytes, bytes), "2-bit packing")
+register("2bit-huffman", *_two_bit(_huffman, lambda body: zlib.decompress(body, -15)),
+         "2-bit packing + Huffman coding of packed bytes")
+register("2bit-lzma", *_two_bit(lambda body: lzma.compress(body, preset=6), lzma.decompress),
+         "2-bit packing + LZMA")
+
+
+# --- order-k context model with a binary arithmetic coder ---
+
+_TOP = (1 << 32) - 1
+_HALF = 1 << 31
+_QUARTER = 1 << 30
+# adaptive counts: increment per observation and total at which a context is halved
+_INCREMENT = 2
+_MAX_TOTAL = 1 << 16
+
+
+def _update(freqs, sym, total):
+    freqs[sym] += _INCREMENT
+    if total + _INCREMENT > _MAX_TOTAL:
+        for i in range(4):
+            freqs[i] = (freqs[i] + 1) >> 1
+
+
+def _cm_encode(codes, order):
+    mask = (1 << (2 * order)) - 1
+    model = {}
+    ctx = 0
+    low, high, pending = 0, _TOP, 0
+    out = bytearray()
+    acc = nbits = 0
+    for sym in codes:
+        freqs = model.get(ctx)
+        if freqs is None:
+            freqs = model[ctx] = [1, 1, 1, 1]
+        total = freqs[0] + freqs[1] + freqs[2] + freqs[3]
+        cum = 0
+        for i in range(sym):
+            cum += freqs[i]
+        span = high - low + 1
+        high = low + span * (cum + freqs[sym]) // total - 1
+        low = low + span * cum // total
+        while True:
+            if high < _HALF:
+                bit = 0
+            elif low >= _HALF:
+                bit = 1
+                low -= _HALF
+                high -= _HALF
+            elif low >= _QUARTER and high < _HALF + _QUARTER:
+                pending += 1
+                low -= _QUARTER
+                high -= _QUARTER
+                low <<= 1
+                high = (high << 1) | 1
+                continue
+            else:
+                break
+            # emit the bit followed by any pending opposite bits
+            acc = (acc << (pending + 1)) | (bit << pending) | (0 if bit else (1 << pending) - 1)
+            nbits += pending + 1
+            pending = 0
+            while nbits >= 8:
+                nbits -= 8
+                out.append((acc >> nbits) & 0xFF)
+            acc &= (1 << nbits) - 1
+            low <<= 1
+            high = (high << 1) | 1
+        _update(freqs, sym, total)
+        ctx = ((ctx << 2) | sym) & mask
+    # flush: two more bits select a point inside the final interval
+    pending += 1
+    bit = 0 if low < _QUARTER else 1
+    acc = (acc << (pending + 1)) | (bit << pending) | (0 if bit else (1 << pending) - 1)
+    nbits += pending + 1
+    while nbits >= 8:
+        nbits -= 8
+        out.append((acc >> nbits) & 0xFF)
+    if nbits:
+        out.append((acc << (8 - nbits)) & 0xFF)
+    return bytes(out)
+
+
+def _cm_decode(data, length, order):
+    mask = (1 << (2 * order)) - 1
+    model = {}
+    ctx = 0
+    nbits_total = len(data) * 8
+    value = int.from_bytes(data[:4].ljust(4, b"\0"), "big")
+    pos = 32
+    low, high = 0, _TOP
+    codes = bytearray(length)
+    for n in range(length):
+        freqs = model.get(ctx)
+        if freqs is None:
+            freqs = model[ctx] = [1, 1, 1, 1]
+        total = freqs[0] + freqs[1] + freqs[2] + freqs[3]
+        span = high - low + 1
+        scaled = ((value - low + 1) * total - 1) // span
+        sym = 0
+        cum = 0
+        while cum + freqs[sym] <= scaled:
+            cum += freqs[sym]
+            sym += 1
+        high = low + span * (cum + freqs[sym]) // total - 1
+        low = low + span * cum // total
+        while True:
+            if high < _HALF:
+                pass
+            elif low >= _HALF:
+                low -= _HALF
+                high -= _HALF
+                value -= _HALF
+            elif low >= _QUARTER and high < _HALF + _QUARTER:
+                low -= _QUARTER
+                high -= _QUARTER
+                value -= _QUARTER
+            else:
+                break
+            bit = (data[pos >> 3] >> (7 - (pos & 7))) & 1 if pos < nbits_total else 0
+            pos += 1
+            low <<= 1
+            high = (high << 1) | 1
+            value = (value << 1) | bit
+        codes[n] = sym
+        _update(freqs, sym, total)
+        ctx = ((ctx << 2) | sym) & mask
+    return codes
+
+
+def _context_model(order):
+    def compress(data):
+        table, _ = _split_exceptions(data)
+        return table + _cm_encode(seqfile.base_codes(data).tobytes(), order)
+
+    def decompress(payload, length):
+        runs, body = _read_exceptions(payload)
+        out = bytearray(seqfile.codes_to_bases(_cm_decode(body, length, order)))
+        for start, run, symbol in runs:
+            out[start:start + run] = bytes([symbol]) * run
+        return bytes(out)
+
+    return compress, decompress
+
+
+for _order in (2, 12):
+    register(f"cm{_order}", *_context_model(_order),
+             f"order-{_order} nucleotide context model + arithmetic coding (pure Python, slow)",
+             max_block_size=CM_MAX_BLOCK_SIZE)
+
+
+# --- container ---
+
+class CompressedWriter:
+    """
+    Write a `.gvz` container to a seekable binary file object: one independently
+    compressed block per `block_size` bases, then the block index and footer.
+    """
+
+    def __init__(self, fileobj, codec=DEFAULT_CODEC, block_size=BLOCK_SIZE):
+        self.codec = get_codec(codec)
+        self.codec.check_block_size(block_size)
+        self.block_size = block_size
+        self.length = 0
+        self.crc32 = 0
+        self._file = fileobj
+        self._start = fileobj.tell()
+        self._pending = b""
+        self._index = []
+        self._write_header()
+
+    def _write_header(self):
+        name = self.codec.name.encode("ascii")
+        self._file.write(_HEADER.pack(MAGIC, self.length, self.crc32, len(name)) + name)
+
+    def _write_block(self, data):
+        payload = self.codec.compress(data)
+        self._index.append((self.length, self._file.tell() - self._start))
+        self._file.write(_BLOCK.pack(len(data), len(payload), zlib.crc32(data)))
+        self._file.write(payload)
+        self.length += len(data)
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        self.crc32 = zlib.crc32(chunk, self.crc32)
+        data = self._pending + chunk
+        offset = 0
+        while len(data) - offset >= self.block_size:
+            self._write_block(data[offset:offset + self.block_size])
+            offset += self.block_size
+        self._pending = data[offset:]
+
+    def close(self):
+        if self._pending:
+            self._write_block(self._pending)
+            self._pending = b""
+        index_offset = self._file.tell() - self._start
+        for entry in self._index:
+            self._file.write(_INDEX.pack(*entry))
+        self._file.write(_FOOTER.pack(index_offset, len(self._index), INDEX_MAGIC))
+        end = self._file.tell()
+        self._file.seek(self._start)
+        self._write_header()
+        self._file.seek(end)
+
+
+class CompressedReader:
+    """
+    Read a compressed artifact from a seekable binary file object, detecting the codec from its header.
+
+    `.gvz` files expose their length from the header and support random access
+    through the block index. Legacy plain-gzip files are read sequentially and
+    report codec "gzip" and an unknown (None) length.
+    """
+
+    def __init__(self, fileobj):
+        self._file = fileobj
+        self._start = fileobj.tell()
+        head = fileobj.read(_HEADER.size)
+        self.blocks = None
+        if head[:2] == GZIP_MAGIC:
+            self.codec = "gzip"
+            self.length = None
+            self.crc32 = None
+            self.version = 0
+            return
+        if len(head) < _HEADER.size or head[:4] != MAGIC:
+            raise CodecError("Unrecognized compressed file format.")
+        magic, self.length, self.crc32, name_len = _HEADER.unpack(head)
+        self.version = magic[3]
+        self.codec = fileobj.read(name_len).decode("ascii")
+        self._codec = get_codec(self.codec)
+        self._load_index()
+
+    def _load_index(self):
+        self._file.seek(-_FOOTER.size, os.SEEK_END)
+        index_offset, count, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        if magic != INDEX_MAGIC:
+            raise CodecError("Compressed file is missing its block index.")
+        self._file.seek(self._start + index_offset)
+        raw = self._file.read(count * _INDEX.size)
+        self.blocks = [_INDEX.unpack_from(raw, i * _INDEX.size) for i in range(count)]
+        self._block_starts = [base for base, _ in self.blocks]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _read_block(self, file_offset):
+        """
+        Return (text, stored crc32) for the block at `file_offset`.
+        """
+        self._file.seek(self._start + file_offset)
+        length, size, crc = _BLOCK.unpack(self._file.read(_BLOCK.size))
+        self._codec.check_block_size(length)
+        metrics.BYTES_READ.inc(_BLOCK.size + size, source="compressed")
+        return self._codec.decompress(self._file.read(size), length), crc
+
+    def _iter_sequential(self):
+        """
+        Yield (text, crc32 or None) for every block in file order.
+        """
+        self._file.seek(self._start)
+        if self.version == 0:
+            with gzip.GzipFile(fileobj=self._file, mode="rb") as f_in:
+                while True:
+                    chunk = f_in.read(BLOCK_SIZE)
+                    if not chunk:
+                        return
+                    yield chunk, None
+        for _, file_offset in self.blocks:
+            yield self._read_block(file_offset)
+
+    def iter_blocks(self):
+        """
+        Yield (text, stored crc32 or None) for every block.
+        """
+        return self._iter_sequential()
+
+    def iter_chunks(self, start=0, end=None):
+        """
+        Yield the bases in [start, end); with a block index only overlapping blocks are decompressed.
+        """
+        if self.blocks is None:
+            offset = 0
+            for text, _ in self._iter_sequential():
+                lo, hi = max(start - offset, 0), len(text) if end is None else min(end - offset, len(text))
+                if lo < hi:
+                    yield text[lo:hi]
+                offset += len(text)
+                if end is not None and offset >= end:
+                    return
+            return
+        end = self.length if end is None else min(end, self.length)
+        if start >= end:
+            return
+        i = max(bisect.bisect_right(self._block_starts, start) - 1, 0)
+        while i < len(self.blocks) and self.blocks[i][0] < end:
+            base, file_offset = self.blocks[i]
+            text, _ = self._read_block(file_offset)
+            yield text[max(start - base, 0):end - base]
+            i += 1
+
+    def read_region(self, start, end):
+        return b"".join(self.iter_chunks(start, end))
+
+
+def compress_file(path, chunks, codec=DEFAULT_CODEC, block_size=BLOCK_SIZE):
+    """
+    Compress an iterable of ASCII chunks into a `.gvz` file; returns the number of bases written.
+    """
+    with open(path, "wb") as f_out:
+        writer = CompressedWriter(f_out, codec, block_size)
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.close()
+    return writer.length
+
+
+def open_compressed(path):
+    """
+    Open a compressed artifact for reading; close the returned reader when done.
+    """
+    f_in = open(path, "rb")
+    try:
+        return CompressedReader(f_in)
+    except Exception:
+        f_in.close()
+        raise
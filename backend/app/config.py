@@ -0,0 +1,10 @@
+import os
+
+# directory to store sequence files (relative to backend/ unless overridden)
+DATA_DIR = os.environ.get("GENOVISTA_DATA_DIR", "data")
+
+# content-addressed sequence blobs (one file per distinct content, shared by every id that holds it)
+BLOB_DIR = os.path.join(DATA_DIR, "blobs")
+
+# one small file per id naming the file it references, so the catalog can be rebuilt from disk
+REF_DIR = os.path.join(DATA_DIR, "refs")
@@ -0,0 +1,223 @@
+"""
+Full-text motif index (FM-index).
+
+An optional per-sequence index persisted next to the sequence as `id.gvi`. Exact
+motifs are counted by backward search in O(pattern length) rank lookups and located
+through the stored suffix array in O(hits), instead of scanning the whole sequence.
+The suffix array is built with NumPy prefix doubling, so large builds run as
+background jobs, at most MAX_BUILDS at a time; sequences longer than MAX_LENGTH
+are not indexed.
+
+    header  <4s Q 32s I>        magic b"GVI\\x01", text length, sha256 of the text, checkpoint interval
+    counts  6 x uint64          number of text symbols smaller than each symbol (the C array)
+    occ     (n // interval + 1) x 6 uint32, symbol counts in bwt[:i * interval]
+    bwt     n + 1 bytes         Burrows-Wheeler transform of text + "$"
+    sa      n + 1 uint32        suffix array
+
+Symbols are $ (end marker), A, C, G, T and one shared code for every other letter
+(N and IUPAC codes), so patterns made of A/C/G/T can be searched exactly.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import uuid
+
+import numpy as np
+
+from app import seqfile
+
+INDEX_EXT = ".gvi"
+MAGIC = b"GVI\x01"
+_HEADER = struct.Struct("<4sQ32sI")
+
+# longest sequence indexed (bases); building needs ~40 bytes per base of memory
+MAX_LENGTH = int(os.environ.get("GENOVISTA_INDEX_MAX_LENGTH", str(1 << 26)))
+
+# background builds allowed at once (each may need up to ~40 * MAX_LENGTH bytes)
+MAX_BUILDS = int(os.environ.get("GENOVISTA_INDEX_BUILDS", "1"))
+
+# bwt positions between rank checkpoints
+INTERVAL = 128
+
+_SIGMA = 6
+_OTHER = 5
+_SYMBOLS = np.full(256, _OTHER, dtype=np.uint8)
+for _code, _base in enumerate(seqfile.BASES, start=1):
+    _SYMBOLS[_base] = _code
+
+# symbols packed into the initial sort key (3 bits each, within 63 bits)
+_PREFIX = 21
+
+
+def searchable(pattern):
+    """
+    True when an exact search for `pattern` can be answered by the index (non-empty, A/C/G/T only).
+    """
+    data = pattern.encode("ascii", "replace")
+    return bool(data) and bool(seqfile.base_mask(data).all())
+
+
+def suffix_array(text):
+    """
+    Suffix array of a symbol array that ends with a unique smallest symbol (0), by
+    prefix doubling. A suffix's rank is the start of its group of suffixes sharing
+    the first `step` symbols; each round re-sorts only the groups that are still
+    ambiguous by the rank `step` symbols further on, then doubles `step`.
+    """
+    n = len(text)
+    # initial groups from the first _PREFIX symbols of every suffix
+    key = np.zeros(n, dtype=np.int64)
+    for j in range(_PREFIX):
+        key <<= 3
+        if j < n:
+            key[:n - j] |= text[j:]
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    del key
+    head = np.empty(n, dtype=bool)
+    head[0] = True
+    head[1:] = sorted_key[1:] != sorted_key[:-1]
+    del sorted_key
+    positions = np.arange(n, dtype=np.int64)
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.maximum.accumulate(np.where(head, positions, 0))
+
+    step = _PREFIX
+    while True:
+        # positions of suffixes whose group has more than one member
+        singleton = head & np.append(head[1:], True)
+        active = positions[~singleton]
+        if active.size == 0:
+            return order
+        suffixes = order[active]
+        following = suffixes + step
+        second = np.where(following < n, rank[np.minimum(following, n - 1)], -1)
+        # groups stay where they are; within a group sort by the following rank
+        key = rank[suffixes] * (n + 1) + second + 1
+        perm = np.argsort(key, kind="stable")
+        key = key[perm]
+        order[active] = suffixes[perm]
+        new_head = np.empty(active.size, dtype=bool)
+        new_head[0] = True
+        new_head[1:] = key[1:] != key[:-1]
+        head[active] = new_head
+        rank[order[active]] = np.maximum.accumulate(np.where(new_head, active, 0))
+        step *= 2
+
+
+def build(stored, path):
+    """
+    Build the index of an open sequence and write it to `path` (via a temporary file,
+    so readers never see a partial index). The header records the sha256 of the text
+    that was actually read, so an index is never mistaken for that of newer content.
+    """
+    n = len(stored)
+    if n > MAX_LENGTH:
+        raise ValueError(f"Sequence too long to index (max {MAX_LENGTH} bases).")
+    digest = hashlib.sha256()
+    text = np.empty(n + 1, dtype=np.uint8)
+    offset = 0
+    for chunk in stored.iter_chunks():
+        digest.update(chunk)
+        text[offset:offset + len(chunk)] = _SYMBOLS[np.frombuffer(chunk, dtype=np.uint8)]
+        offset += len(chunk)
+    text[n] = 0
+    sa = suffix_array(text)
+    bwt = text[sa - 1]  # sa == 0 wraps around to the end marker
+    del text
+
+    counts = np.bincount(bwt, minlength=_SIGMA)
+    smaller = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.uint64)
+    occ = np.zeros((len(bwt) // INTERVAL + 1, _SIGMA), dtype=np.uint32)
+    for symbol in range(_SIGMA):
+        running = np.cumsum(bwt == symbol, dtype=np.uint32)
+        occ[1:, symbol] = running[INTERVAL - 1::INTERVAL][:len(occ) - 1]
+
+    # unique name: a background and an explicit build may run at the same time
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, n, digest.digest(), INTERVAL))
+        f.write(smaller.tobytes())
+        f.write(occ.tobytes())
+        f.write(bwt.tobytes())
+        f.write(sa.astype(np.uint32).tobytes())
+    os.replace(tmp, path)
+
+
+class FMIndex:
+    """
+    Read-only, memory-mapped view of a `.gvi` file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.length, digest, self.interval = _HEADER.unpack_from(self._mm, 0)
+        except (ValueError, struct.error):
+            self._file.close()
+            raise seqfile.FormatError(f"{path}: truncated index")
+        if magic != MAGIC:
+            self.close()
+            raise seqfile.FormatError(f"{path}: not a {INDEX_EXT} file")
+        self.content_hash = digest.hex()
+        size = self.length + 1
+        offset = _HEADER.size
+        self._smaller = np.frombuffer(self._mm, dtype=np.uint64, count=_SIGMA, offset=offset).astype(np.int64)
+        offset += 8 * _SIGMA
+        n_checkpoints = size // self.interval + 1
+        self._occ = np.frombuffer(self._mm, dtype=np.uint32, count=n_checkpoints * _SIGMA,
+                                  offset=offset).reshape(n_checkpoints, _SIGMA)
+        offset += 4 * n_checkpoints * _SIGMA
+        self._bwt = np.frombuffer(self._mm, dtype=np.uint8, count=size, offset=offset)
+        offset += size
+        self._sa = np.frombuffer(self._mm, dtype=np.uint32, count=size, offset=offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._smaller = self._occ = self._bwt = self._sa = None
+        if getattr(self, "_mm", None) is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # a numpy view is still alive somewhere; the map is released with it
+                pass
+            self._mm = None
+        self._file.close()
+
+    def _rank(self, symbol, i):
+        # occurrences of `symbol` in bwt[:i]
+        block = i // self.interval
+        start = block * self.interval
+        return int(self._occ[block, symbol]) + int(np.count_nonzero(self._bwt[start:i] == symbol))
+
+    def interval_of(self, pattern):
+        """
+        Suffix array range [lo, hi) of the suffixes starting with `pattern` (A/C/G/T bytes).
+        """
+        lo, hi = 0, self.length + 1
+        for byte in reversed(pattern):
+            symbol = int(_SYMBOLS[byte])
+            lo = int(self._smaller[symbol]) + self._rank(symbol, lo)
+            hi = int(self._smaller[symbol]) + self._rank(symbol, hi)
+            if lo >= hi:
+                return 0, 0
+        return lo, hi
+
+    def count(self, pattern):
+        lo, hi = self.interval_of(pattern)
+        return hi - lo
+
+    def locate(self, pattern):
+        """
+        Sorted 0-based start positions of every (possibly overlapping) occurrence of `pattern`.
+        """
+        lo, hi = self.interval_of(pattern)
+        return np.sort(self._sa[lo:hi].astype(np.int64))
@@ -0,0 +1,293 @@
+"""
+Streaming sequence ingest.
+
+Parses raw or FASTA/multi-FASTA bytes (optionally gzipped) incrementally,
+validating and normalizing each chunk with byte-level translation tables and
+writing every record straight to a `.gv2` file, so no request ever holds a
+whole sequence in memory. Records are written to temporary files and only
+become visible once the whole body has been read successfully, when each is
+moved into the content-addressed blob store (or dropped, if its content is
+already stored).
+"""
+import hashlib
+import os
+import zlib
+
+from app import catalog, seqfile, sketch, stats, storage
+
+STRICT_ALPHABET = b"ACGT"
+IUPAC_ALPHABET = b"ACGTRYSWKMBDHVN"
+
+_LOWER = IUPAC_ALPHABET.lower()
+_UPPER_TABLE = bytes.maketrans(_LOWER, IUPAC_ALPHABET)
+_WHITESPACE = b" \t\r\n"
+GZIP_MAGIC = b"\x1f\x8b"
+
+# longest FASTA header line accepted
+MAX_HEADER = 1 << 16
+
+# largest request body accepted, counted after decompression (bytes)
+MAX_BODY = int(os.environ.get("GENOVISTA_INGEST_MAX_BYTES", str(1 << 34)))
+
+# most bytes one gunzip step may produce, so a highly compressed chunk never expands in memory
+DECOMPRESS_STEP = 1 << 22
+
+
+class IngestError(ValueError):
+    pass
+
+
+def normalize(chunk, alphabet=STRICT_ALPHABET, strip_whitespace=True):
+    """
+    Uppercase `chunk`, drop whitespace and reject any symbol outside `alphabet`.
+    Runs entirely in `bytes.translate`, i.e. at C speed.
+    """
+    data = chunk.translate(_UPPER_TABLE, _WHITESPACE if strip_whitespace else b"")
+    if data.translate(None, alphabet):
+        if alphabet == STRICT_ALPHABET:
+            raise IngestError("Invalid DNA sequence. Use only A, T, C, G.")
+        raise IngestError("Invalid DNA sequence. Use only IUPAC nucleotide codes.")
+    return data
+
+
+class Decompressor:
+    """
+    Pass bytes through unchanged, or gunzip them (including multi-member files)
+    when the stream starts with the gzip magic. `feed` yields the output in pieces
+    of at most DECOMPRESS_STEP bytes and raises IngestError once more than `limit`
+    bytes came out, so a decompression bomb is stopped before it is expanded.
+    """
+
+    def __init__(self, limit=MAX_BODY):
+        self.limit = limit
+        self.total = 0
+        self._head = b""
+        self._decided = False
+        self._gzip = False
+        self._obj = None
+
+    def _count(self, data):
+        self.total += len(data)
+        if self.total > self.limit:
+            raise IngestError(f"Request body is too large (max {self.limit} bytes after decompression).")
+        return data
+
+    def feed(self, chunk):
+        if not self._decided:
+            self._head += chunk
+            if len(self._head) < len(GZIP_MAGIC):
+                return
+            self._decided = True
+            self._gzip = self._head.startswith(GZIP_MAGIC)
+            chunk, self._head = self._head, b""
+        if not self._gzip:
+            if chunk:
+                yield self._count(chunk)
+            return
+        while chunk:
+            if self._obj is None:
+                self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                data = self._obj.decompress(chunk, DECOMPRESS_STEP)
+            except zlib.error:
+                raise IngestError("Request body is not valid gzip data.")
+            if data:
+                yield self._count(data)
+            if self._obj.eof:
+                # the next gzip member (if any) starts in the unused data
+                chunk = self._obj.unused_data
+                self._obj = None
+            elif self._obj.unconsumed_tail or len(data) == DECOMPRESS_STEP:
+                # output was capped: keep going (with no input left, to drain buffered output)
+                chunk = self._obj.unconsumed_tail or b""
+                if not chunk:
+                    yield from self._drain()
+            else:
+                chunk = b""
+
+    def _drain(self):
+        while self._obj is not None:
+            data = self._obj.decompress(b"", DECOMPRESS_STEP)
+            if data:
+                yield self._count(data)
+            if self._obj.eof:
+                self._obj = None
+            elif len(data) < DECOMPRESS_STEP:
+                return
+
+    def flush(self):
+        if not self._decided:
+            # shorter than the gzip magic: plain data
+            self._decided = True
+            head, self._head = self._head, b""
+            return self._count(head)
+        if self._obj is not None:
+            # a gzip member was started but never finished
+            raise IngestError("Request body ends with a truncated gzip stream.")
+        return b""
+
+
+class FastaParser:
+    """
+    Incremental splitter for raw or FASTA text. `feed` and `close` return events:
+    ("start", name), ("data", bytes), ("end", None). Header-less input is a single
+    record whose name is None.
+    """
+
+    def __init__(self):
+        self._state = "begin"
+        self._header = b""
+        self._open = False
+
+    def feed(self, chunk):
+        events = []
+        pos, n = 0, len(chunk)
+        while pos < n:
+            if self._state == "begin":
+                rest = chunk[pos:].lstrip()
+                if not rest:
+                    break
+                pos = n - len(rest)
+                if rest[:1] == b">":
+                    self._state = "header"
+                    pos += 1
+                else:
+                    self._state = "sequence"
+                    self._open = True
+                    events.append(("start", None))
+            elif self._state == "header":
+                newline = chunk.find(b"\n", pos)
+                self._header += chunk[pos:n if newline == -1 else newline]
+                if len(self._header) > MAX_HEADER:
+                    raise IngestError("FASTA header line is too long.")
+                if newline == -1:
+                    break
+                pos = newline + 1
+                events.append(("start", self._take_header()))
+                self._open = True
+                self._state = "sequence"
+            else:
+                # '>' never occurs in sequence data, so it always starts the next header
+                marker = chunk.find(b">", pos)
+                end = n if marker == -1 else marker
+                if end > pos:
+                    events.append(("data", chunk[pos:end]))
+                if marker == -1:
+                    break
+                events.append(("end", None))
+                self._open = False
+                self._state = "header"
+                pos = marker + 1
+        return events
+
+    def _take_header(self):
+        name = self._header.strip().decode("utf-8", "replace")
+        self._header = b""
+        return name or None
+
+    def close(self):
+        events = []
+        if self._state == "header":
+            events += [("start", self._take_header()), ("end", None)]
+        elif self._open:
+            events.append(("end", None))
+        self._state = "begin"
+        self._open = False
+        return events
+
+
+class RecordWriter:
+    """
+    Stream one record into a temporary `.gv2` file in the blob store, collecting
+    the catalog summary (length, preview, content hash, symbol counts, sketch) on the way.
+    """
+
+    def __init__(self, seq_id, name=None):
+        self.seq_id = seq_id
+        self.name = name
+        self.tmp = storage.new_tmp()
+        self._writer = seqfile.PackedWriter(self.tmp)
+        self._digest = hashlib.sha256()
+        self._hist = None
+        self._sketcher = sketch.Sketcher()
+        self._preview = b""
+
+    @property
+    def length(self):
+        return self._writer.length
+
+    def write(self, data):
+        if not data:
+            return
+        self._writer.write(data)
+        self._digest.update(data)
+        self._hist = seqfile.byte_histogram(data, self._hist)
+        self._sketcher.update(data)
+        if len(self._preview) < catalog.PREVIEW_LEN:
+            self._preview += data[:catalog.PREVIEW_LEN - len(self._preview)]
+
+    def finish(self):
+        self._writer.close()
+
+    def commit(self):
+        """
+        Move the finished file into the blob store and register it.
+        """
+        self.finish()
+        summary = (self.length, self._preview.decode("ascii"), self._digest.hexdigest(),
+                   seqfile.histogram_counts(self._hist), self._sketcher.sketch())
+        storage.store(self.seq_id, summary, tmp=self.tmp, name=self.name)
+        stats.invalidate(self.seq_id)
+        return {"id": self.seq_id, "name": self.name, "length": self.length}
+
+    def abort(self):
+        self._writer.abort()
+        storage.remove_files([self.tmp])
+
+
+class IngestSession:
+    """
+    Feed a request body chunk by chunk; `close()` commits every record at once.
+    With `seq_id` the body must hold exactly one record, which replaces that sequence.
+    """
+
+    def __init__(self, alphabet=STRICT_ALPHABET, seq_id=None):
+        self.alphabet = alphabet
+        self.seq_id = seq_id
+        self._decoder = Decompressor()
+        self._parser = FastaParser()
+        self._current = None
+        self._finished = []
+
+    def feed(self, chunk):
+        for data in self._decoder.feed(chunk):
+            self._handle(self._parser.feed(data))
+
+    def _handle(self, events):
+        for kind, value in events:
+            if kind == "start":
+                if self.seq_id is not None and self._finished:
+                    raise IngestError("Expected a single sequence record.")
+                self._current = RecordWriter(self.seq_id or storage.new_id(), value)
+            elif kind == "data":
+                self._current.write(normalize(value, self.alphabet))
+            else:
+                self._current.finish()
+                self._finished.append(self._current)
+                self._current = None
+
+    def close(self):
+        """
+        Finish parsing and commit all records; returns [{id, name, length}, ...].
+        """
+        self._handle(self._parser.feed(self._decoder.flush()))
+        self._handle(self._parser.close())
+        if not self._finished:
+            raise IngestError("Request body contains no sequence data.")
+        return [record.commit() for record in self._finished]
+
+    def abort(self):
+        for record in self._finished + ([self._current] if self._current else []):
+            record.abort()
+        self._finished = []
+        self._current = None
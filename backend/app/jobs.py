@@ -0,0 +1,315 @@
+"""
+Background jobs.
+
+CPU-heavy work (compression, verification, k-mer / window / motif scans of large
+sequences) runs in a ProcessPoolExecutor, so it uses every core and never ties up
+the API's threadpool. The queue is bounded: `submit` raises QueueFull once
+MAX_QUEUED jobs are waiting or running. Progress and cancellation requests
+travel through a multiprocessing manager; task functions receive a `Progress`
+and read sequences through `track`, which reports progress and stops a
+cancelled job between chunks.
+
+`run_batch` spreads many task calls (batch endpoints) over the same pool without
+creating jobs.
+
+Jobs live in the memory of the API process that accepted them, so with several
+API workers a job is only visible to the worker that created it.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from app import seqfile
+
+# worker processes in the pool
+WORKERS = int(os.environ.get("GENOVISTA_JOB_WORKERS", str(os.cpu_count() or 1)))
+
+# jobs allowed to wait or run at once; more are refused
+MAX_QUEUED = int(os.environ.get("GENOVISTA_JOB_QUEUE", str(4 * WORKERS)))
+
+# finished jobs remembered for status queries
+HISTORY = 1000
+
+# sequences up to this many bases are processed inline by the jobs endpoint
+INLINE_MAX_LENGTH = int(os.environ.get("GENOVISTA_JOB_INLINE_LENGTH", str(1 << 20)))
+
+_jobs = OrderedDict()
+_lock = threading.Lock()
+_pool = None
+_manager = None
+_shared = None
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Progress:
+    """
+    Passed to task functions: `advance` reports work done, `check` raises
+    JobCancelled once the job was cancelled. Picklable, so it reaches worker processes.
+    """
+
+    def __init__(self, job_id, shared=None):
+        self.job_id = job_id
+        self.total = 1
+        self.done = 0
+        self._shared = shared
+
+    def start(self):
+        # runs in the worker: from now on the job is reported as running
+        self.check()
+        if self._shared is not None:
+            self._shared[self.job_id] = 0.0
+
+    def advance(self, amount):
+        self.done += amount
+        if self._shared is not None:
+            self._shared[self.job_id] = min(self.done / self.total, 1.0)
+
+    def check(self):
+        if self._shared is not None and self._shared.get("cancel:" + self.job_id):
+            raise JobCancelled()
+
+
+class _Tracked:
+    """
+    Open sequence wrapper that reports every base read to a Progress.
+    """
+
+    def __init__(self, stored, progress):
+        self._stored = stored
+        self._progress = progress
+
+    def __len__(self):
+        return len(self._stored)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._stored.close()
+
+    def slice(self, start, end):
+        self._progress.check()
+        data = self._stored.slice(start, end)
+        self._progress.advance(len(data))
+        return data
+
+    def iter_chunks(self, chunk_size=seqfile.CHUNK_SIZE, start=0, end=None):
+        for chunk in self._stored.iter_chunks(chunk_size, start, end):
+            self._progress.check()
+            yield chunk
+            self._progress.advance(len(chunk))
+
+    def read_text(self):
+        return self.slice(0, len(self)).decode("ascii")
+
+
+def track(stored, progress, passes=1):
+    """
+    Wrap an open sequence so reading it reports progress (no-op without a Progress);
+    `passes` is how many times the task reads the whole sequence.
+    """
+    if progress is None:
+        return stored
+    progress.total = max(len(stored) * passes, 1)
+    return _Tracked(stored, progress)
+
+
+def _ensure_pool():
+    global _pool, _manager, _shared
+    if _pool is None:
+        # spawn: forking a multi-threaded server process is not safe
+        context = multiprocessing.get_context("spawn")
+        _manager = context.Manager()
+        _shared = _manager.dict()
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=context)
+    return _pool
+
+
+def _run(fn, args, progress):
+    progress.start()
+    return fn(*args, progress)
+
+
+def _new_job(kind, seq_id, params, limit=None):
+    """
+    Record a new queued job. With `limit`, raise QueueFull instead when that many
+    jobs are already waiting or running; the check and the insert share the lock.
+    """
+    job = {
+        "id": uuid.uuid4().hex[:12],
+        "kind": kind,
+        "seq_id": seq_id,
+        "params": params,
+        "status": "queued",
+        "progress": 0.0,
+        "created_at": time.time(),
+        "finished_at": None,
+        "result": None,
+        "error": None,
+        "future": None,
+    }
+    with _lock:
+        if limit is not None and sum(1 for j in _jobs.values() if j["finished_at"] is None) >= limit:
+            raise QueueFull(f"Job queue is full ({limit} jobs); retry later.")
+        _jobs[job["id"]] = job
+        # forget the oldest finished jobs
+        finished = [j for j in _jobs.values() if j["finished_at"] is not None]
+        for old in finished[:max(0, len(finished) - HISTORY)]:
+            del _jobs[old["id"]]
+    return job
+
+
+def _finish(job, result=None, error=None, status="done"):
+    with _lock:
+        job.update(status=status, result=result, error=error, finished_at=time.time(), future=None)
+        if status == "done":
+            job["progress"] = 1.0
+    if _shared is not None:
+        _shared.pop(job["id"], None)
+        _shared.pop("cancel:" + job["id"], None)
+
+
+def run_inline(kind, seq_id, params, fn, *args, on_done=None):
+    """
+    Run a small job in the calling thread and record it as finished.
+    """
+    job = _new_job(kind, seq_id, params)
+    try:
+        result = fn(*args, None)
+        if on_done is not None:
+            on_done(result)
+    except Exception as e:
+        _finish(job, error=str(e), status="failed")
+    else:
+        _finish(job, result=result)
+    return view(job["id"])
+
+
+def submit(kind, seq_id, params, fn, *args, on_done=None):
+    """
+    Queue `fn(*args, progress)` in the process pool; `on_done(result)` runs in this
+    process once it succeeds (e.g. to update the catalog). Returns the job view.
+    """
+    global _pool
+    pool = _ensure_pool()
+    job = _new_job(kind, seq_id, params, limit=MAX_QUEUED)
+    try:
+        future = pool.submit(_run, fn, args, Progress(job["id"], _shared))
+    except Exception as e:
+        # a job that never reached the pool must not hold a queue slot
+        _finish(job, error=str(e) or type(e).__name__, status="failed")
+        if isinstance(e, BrokenProcessPool) and _pool is pool:
+            # a worker died: start a fresh pool for the next job
+            _pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    with _lock:
+        job["future"] = future
+
+    def done(f):
+        try:
+            result = f.result()
+            if on_done is not None:
+                on_done(result)
+        except (CancelledError, JobCancelled):
+            _finish(job, status="cancelled")
+        except Exception as e:
+            _finish(job, error=str(e) or type(e).__name__, status="failed")
+        else:
+            _finish(job, result=result)
+
+    future.add_done_callback(done)
+    return view(job["id"])
+
+
+def _outcome(future):
+    try:
+        return future.result(), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
+def run_batch(calls, inline=False, window=None):
+    """
+    Run `fn(*args, None)` for every (key, fn, args) of `calls` and yield (key, result,
+    error) as each finishes, `error` being the message of a failed call. Calls run in
+    the process pool, at most `window` (default 2 * WORKERS) at a time so a large
+    batch neither floods the pool nor waits on the slowest call, or in this thread
+    with `inline`. Closing the generator cancels the calls not started yet.
+    """
+    if inline:
+        for key, fn, args in calls:
+            try:
+                yield key, fn(*args, None), None
+            except Exception as e:
+                yield key, None, str(e) or type(e).__name__
+        return
+
+    window = window or 2 * WORKERS
+    pool = _ensure_pool()
+    pending = {}
+    try:
+        for key, fn, args in calls:
+            if len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield (pending.pop(future), *_outcome(future))
+            pending[pool.submit(fn, *args, None)] = key
+        for future in as_completed(list(pending)):
+            yield (pending.pop(future), *_outcome(future))
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def view(job_id):
+    """
+    JSON view of a job (status queued / running / done / failed / cancelled), or None.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        job = dict(job)
+    if job.pop("future") is not None and _shared is not None:
+        progress = _shared.get(job_id)
+        if progress is not None:
+            job["status"] = "running"
+            job["progress"] = round(progress, 4)
+    return job
+
+
+def list_jobs(limit=100):
+    with _lock:
+        ids = list(_jobs)[-limit:]
+    return [view(job_id) for job_id in reversed(ids)]
+
+
+def cancel(job_id):
+    """
+    Cancel a queued job, or ask a running one to stop at its next chunk.
+    Returns the job view, or None for an unknown id.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        future = job["future"] if job else None
+    if job is None:
+        return None
+    if future is not None and not future.cancel() and not future.done():
+        _shared["cancel:" + job_id] = True
+    return view(job_id)
@@ -1,11 +1,16 @@
 from fastapi import FastAPI
-from app.routers import sequences
+from fastapi.responses import Response
+from app import metrics, profiling
+from app.routers import jobs, sequences
 from fastapi.middleware.cors import CORSMiddleware
 app = FastAPI(
     title="GENOVISTA Backend",
     description="Backend for Genomic Compression & Analysis Platform",
     version="0.1"
 )
+app.router.route_class = profiling.ProfiledRoute
+# ?profile=1 (with GENOVISTA_PROFILING=1) answers with a cProfile report; see app/profiling.py
+app.add_middleware(profiling.ProfilerMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
@@ -13,9 +18,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# outermost, so every request is timed (latency histograms at GET /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
 # register router
 app.include_router(sequences.router, prefix="/sequences", tags=["Sequences"])
+app.include_router(jobs.router, prefix="/jobs", tags=["Jobs"])
 
 @app.get("/")
 def root():
     return {"message": "Welcome to GENOVISTA Backend API!"}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,178 @@
+"""
+Prometheus metrics.
+
+A small in-process registry (counters and histograms with labels) rendered in
+the Prometheus text exposition format by `GET /metrics`, so no client library
+is needed. `MetricsMiddleware` records the latency of every request by route
+template (e.g. `/sequences/{seq_id}/gc`, never the raw path), including the
+time spent streaming the body. Storage and cache code count what they read:
+sequence bases decoded, compressed bytes read, and stats-cache / motif-index
+hits. Values cover this API process only; work done by job worker processes
+is not counted.
+"""
+import math
+import threading
+import time
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter; `inc(amount, **labels)` with every label of `labelnames`.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram; `observe(value, **labels)`.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # per label set: [count per bucket..., sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(entry)) for key, entry in self._values.items())
+        for key, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = _labels(self.labelnames, key, [("le", _number(bound))])
+                yield f"{self.name}_bucket{le} {cumulative}"
+            labels = _labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_number(entry[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def render():
+    """
+    Every registered metric in the Prometheus text exposition format (version 0.0.4).
+    """
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_SECONDS = Histogram(
+    "genovista_http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response.",
+    ["method", "route", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+BYTES_READ = Counter(
+    "genovista_read_bytes_total",
+    "Bytes read from storage: decoded sequence bases or compressed container bytes.",
+    ["source"],
+)
+CACHE_LOOKUPS = Counter(
+    "genovista_cache_lookups_total",
+    "Cache lookups by cache and outcome (stats: hit = memory, catalog, miss = file scan; "
+    "motif_index: hit = current FM-index, miss = scan; motif_positions: sorted index hits for paging).",
+    ["cache", "result"],
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request by method, route template and status.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"],
+                                    route=_route_template(scope), status=str(status))
+
+
+def _route_template(scope):
+    # the router records the matched route in the scope; routes of an included
+    # router keep their own path, and FastAPI keeps the prefixed one alongside it
+    effective = (scope.get("fastapi") or {}).get("effective_route_context")
+    path = getattr(effective, "path", None)
+    if path:
+        return path
+    return getattr(scope.get("route"), "path", "unmatched")
@@ -0,0 +1,489 @@
+"""
+Motif matching.
+
+Every search mode is a generator of (start, end, match) hits (0-based, end exclusive)
+in position order, so callers can page, stream or count matches without ever
+holding the full match list. Regex patterns are checked by `check_regex` before
+use and searched under a time limit.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+import numpy as np
+
+from app import metrics, seqfile
+
+# longest regex pattern accepted
+MAX_REGEX_LENGTH = 200
+
+# seconds a single regex search may run
+REGEX_TIME_LIMIT = float(os.environ.get("GENOVISTA_REGEX_TIME_LIMIT", "10"))
+
+# longest regex match (bases); matches are searched window by window, each window
+# seeing REGEX_MAX_MATCH bases past its end, and the time limit is checked in between
+REGEX_MAX_MATCH = 1024
+REGEX_WINDOW = 1024
+
+# worst-case backtracking steps per start position a regex may imply (see `_cost`)
+REGEX_MAX_COST = 4 * (REGEX_WINDOW + REGEX_MAX_MATCH)
+
+# anchors that would also match at a window's end
+_WINDOW_ANCHORS = {sre_parse.AT_END, sre_parse.AT_END_STRING, sre_parse.AT_END_LINE,
+                   sre_parse.AT_BOUNDARY, sre_parse.AT_NON_BOUNDARY}
+
+# bytes of sorted index positions kept for paging (uint32 per hit)
+LOCATE_CACHE_BYTES = int(os.environ.get("GENOVISTA_MOTIF_CACHE_BYTES", str(256 << 20)))
+
+_located_cache = OrderedDict()
+_located_bytes = 0
+_located_lock = threading.Lock()
+
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT} | (
+    {sre_parse.POSSESSIVE_REPEAT} if hasattr(sre_parse, "POSSESSIVE_REPEAT") else set()
+)
+
+
+class MotifError(ValueError):
+    pass
+
+
+def check_regex(pattern):
+    """
+    Compile a regex motif, rejecting constructs that can backtrack catastrophically:
+    backreferences, variable repeats nested in repeats (`(A+)+`), alternatives
+    of different widths under a repeat (`(A|AA)+`) and repeats whose ranges multiply
+    past REGEX_MAX_COST (`[AC]*[AG]*`); also end anchors and word boundaries, which
+    the windowed search cannot honour. Returns the compiled bytes pattern.
+    """
+    if len(pattern) > MAX_REGEX_LENGTH:
+        raise MotifError(f"Regex pattern too long (max {MAX_REGEX_LENGTH} characters).")
+    try:
+        data = pattern.encode("ascii")
+        parsed = sre_parse.parse(data)
+        compiled = re.compile(data)
+    except (UnicodeEncodeError, re.error):
+        raise MotifError("Invalid regex pattern.")
+    _check_tree(parsed, in_repeat=False)
+    if _cost(parsed) > REGEX_MAX_COST:
+        raise MotifError("Regex pattern too complex: its variable repeats multiply the search work.")
+    return compiled
+
+
+def _check_tree(parsed, in_repeat):
+    for op, av in parsed:
+        if op in _REPEATS:
+            low, high, sub = av
+            if in_repeat and low != high:
+                raise MotifError("Nested repeats are not allowed in regex patterns.")
+            _check_tree(sub, in_repeat or high > 1)
+        elif op == sre_parse.BRANCH:
+            branches = av[1]
+            if in_repeat and len({b.getwidth() for b in branches}) > 1:
+                raise MotifError("Alternatives of different lengths are not allowed inside repeats.")
+            for branch in branches:
+                _check_tree(branch, in_repeat)
+        elif op == sre_parse.SUBPATTERN:
+            _check_tree(av[-1], in_repeat)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            _check_tree(av[1], in_repeat)
+        elif op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            raise MotifError("Backreferences are not allowed in regex patterns.")
+        elif getattr(sre_parse, "ATOMIC_GROUP", None) == op:
+            _check_tree(av, in_repeat)
+        elif op == sre_parse.AT and av in _WINDOW_ANCHORS:
+            raise MotifError("End anchors and word boundaries are not allowed in regex patterns.")
+
+
+def _cost(parsed):
+    # rough worst-case backtracking steps per start position: the range of every
+    # variable repeat (an unbounded one reaches the end of the search window) multiplies
+    cost = 1
+    for op, av in parsed:
+        if op in _REPEATS:
+            low, high, sub = av
+            cost *= (min(high, REGEX_WINDOW + REGEX_MAX_MATCH) - low + 1) * _cost(sub)
+        elif op == sre_parse.BRANCH:
+            cost *= sum(_cost(branch) for branch in av[1])
+        elif op == sre_parse.SUBPATTERN:
+            cost *= _cost(av[-1])
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            cost *= _cost(av[1])
+        elif getattr(sre_parse, "ATOMIC_GROUP", None) == op:
+            cost *= _cost(av)
+    return cost
+
+
+def _iter_scan(stored, scan, start, chunk_size):
+    # drive a chunk-by-chunk scan over an open sequence from `start`
+    tail = b""
+    offset = start
+    for chunk in stored.iter_chunks(chunk_size, start=start):
+        data = tail + chunk
+        yield from scan.feed(data, offset - len(tail), len(tail))
+        tail = data[max(len(data) - scan.overlap, 0):] if scan.overlap else b""
+        offset += len(chunk)
+    yield from scan.finish()
+
+
+class LiteralScan:
+    """
+    Overlapping occurrences of a literal `pattern`, fed chunk by chunk: `feed(data,
+    offset, fresh)` yields the hits of `data` (bases from `offset` on, the first
+    `fresh` of them fed before) that end in its new bases; `finish` yields the rest.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self._needle = pattern.encode("ascii")
+        # a match starting in the last m - 1 bases ends in the next chunk
+        self.overlap = len(self._needle) - 1
+
+    def feed(self, data, offset, fresh=0):
+        m = len(self._needle)
+        i = data.find(self._needle, max(fresh - m + 1, 0))
+        while i != -1:
+            yield offset + i, offset + i + m, self.pattern
+            i = data.find(self._needle, i + 1)
+
+    def finish(self):
+        return iter(())
+
+
+def iter_literal(stored, pattern, start=0, chunk_size=seqfile.CHUNK_SIZE):
+    """
+    Overlapping occurrences of a literal `pattern` in an open sequence at or after
+    `start`, read chunk by chunk.
+    """
+    return _iter_scan(stored, LiteralScan(pattern), start, chunk_size)
+
+
+def iter_regex(stored, compiled, start=0, time_limit=REGEX_TIME_LIMIT):
+    """
+    Non-overlapping matches of a compiled (bytes) regex at or after `start`, at most
+    REGEX_MAX_MATCH bases long. The text is searched in windows of REGEX_WINDOW start
+    positions, so even a search that backtracks without matching checks the clock
+    every window: raises MotifError once it has run longer than `time_limit` seconds.
+    """
+    text = stored.slice(0, len(stored))
+    n = len(text)
+    deadline = time.monotonic() + time_limit
+    pos = start
+    empty_at = None
+    while pos <= n:
+        if time.monotonic() > deadline:
+            raise MotifError("Regex search exceeded the time limit.")
+        stop = min(pos + REGEX_WINDOW, n)
+        for match in compiled.finditer(text, pos, min(stop + REGEX_MAX_MATCH, n)):
+            begin, end = match.span()
+            if begin >= stop and stop < n:
+                # starts in the next window, which sees further ahead
+                break
+            if begin == end == empty_at:
+                continue
+            yield begin, end, match.group().decode("ascii")
+            pos = end
+            empty_at = end if begin == end else None
+        if stop == n:
+            break
+        pos = max(pos, stop)
+
+
+def _located(index, pattern):
+    # sorted positions of `pattern`, kept per (content, pattern) so later pages only seek
+    global _located_bytes
+    key = (index.content_hash, pattern)
+    with _located_lock:
+        positions = _located_cache.get(key)
+        if positions is not None:
+            _located_cache.move_to_end(key)
+            metrics.CACHE_LOOKUPS.inc(cache="motif_positions", result="hit")
+            return positions
+    metrics.CACHE_LOOKUPS.inc(cache="motif_positions", result="miss")
+    positions = index.locate(pattern.encode("ascii")).astype(np.uint32)
+    positions.flags.writeable = False
+    if positions.nbytes <= LOCATE_CACHE_BYTES:
+        with _located_lock:
+            if key not in _located_cache:
+                _located_cache[key] = positions
+                _located_bytes += positions.nbytes
+            while _located_bytes > LOCATE_CACHE_BYTES:
+                _, old = _located_cache.popitem(last=False)
+                _located_bytes -= old.nbytes
+    return positions
+
+
+def iter_indexed(index, pattern, start=0, batch=4096):
+    """
+    Occurrences of an A/C/G/T `pattern` at or after `start`, from an FM-index. The
+    sorted positions are cached, so every page after the first is a binary search
+    to the cursor plus the hits it returns.
+    """
+    positions = _located(index, pattern)
+    m = len(pattern)
+    first = int(positions.searchsorted(start))
+    for offset in range(first, len(positions), batch):
+        for p in positions[offset:offset + batch].tolist():
+            yield p, p + m, pattern
+
+
+# IUPAC nucleotide codes as bitmasks over A=1, C=2, G=4, T=8
+IUPAC_MASKS = {
+    "A": 1, "C": 2, "G": 4, "T": 8,
+    "R": 5, "Y": 10, "S": 6, "W": 9, "K": 12, "M": 3,
+    "B": 14, "D": 13, "H": 11, "V": 7, "N": 15,
+}
+
+# longest pattern for approximate search and most mismatches / edits allowed
+MAX_APPROX_LENGTH = 64
+MAX_ERRORS = 10
+
+# stored bases as masks; ambiguous text symbols (N runs, IUPAC) never match
+_TEXT_MASKS = np.zeros(256, dtype=np.uint8)
+for _base in "ACGT":
+    _TEXT_MASKS[ord(_base)] = IUPAC_MASKS[_base]
+
+
+def pattern_masks(pattern, iupac=False):
+    """
+    Bitmask of every pattern position; IUPAC codes are only accepted with `iupac`.
+    """
+    allowed = IUPAC_MASKS if iupac else {b: IUPAC_MASKS[b] for b in "ACGT"}
+    try:
+        return np.array([allowed[ch] for ch in pattern], dtype=np.uint8)
+    except KeyError:
+        if iupac:
+            raise MotifError("Pattern may only contain IUPAC nucleotide codes.")
+        raise MotifError("Pattern may only contain A, C, G, T (set iupac to use degenerate codes).")
+
+
+def check_approximate(pattern, max_errors=0, iupac=False):
+    """
+    Validate an approximate-search pattern; returns its position masks.
+    """
+    masks = pattern_masks(pattern, iupac)
+    if len(masks) > MAX_APPROX_LENGTH:
+        raise MotifError(f"Pattern too long for approximate search (max {MAX_APPROX_LENGTH}).")
+    if not 0 <= max_errors <= MAX_ERRORS:
+        raise MotifError(f"max_mismatches must be between 0 and {MAX_ERRORS}.")
+    if max_errors >= len(masks):
+        raise MotifError("max_mismatches must be smaller than the pattern length.")
+    return masks
+
+
+def reverse_complement_masks(masks):
+    # swap A<->T and C<->G bits, then reverse
+    comp = ((masks & 1) << 3) | ((masks & 8) >> 3) | ((masks & 2) << 1) | ((masks & 4) >> 1)
+    return comp[::-1].copy()
+
+
+def _mismatch_counts(text, masks):
+    # mismatches of `masks` against every window of `text`, all windows at once
+    m = len(masks)
+    n = len(text) - m + 1
+    counts = np.zeros(max(n, 0), dtype=np.uint8)
+    for j in range(m if n > 0 else 0):
+        counts += (text[j:j + n] & masks[j]) == 0
+    return counts
+
+
+def _edit_row(text, masks, anchored=False):
+    """
+    Last row of the edit-distance DP of `masks` against `text`, computed one pattern
+    position at a time over all text positions: entry i is the best distance of the
+    whole pattern against a text substring ending before i (starting anywhere, or at
+    0 when `anchored`). Horizontal steps are resolved with a running minimum.
+    """
+    n = len(text)
+    positions = np.arange(n + 1, dtype=np.int32)
+    row = positions.copy() if anchored else np.zeros(n + 1, dtype=np.int32)
+    for j, mask in enumerate(masks, start=1):
+        best = row + 1
+        np.minimum(best[1:], row[:-1] + ((text & mask) == 0), out=best[1:])
+        best[0] = j
+        row = np.minimum.accumulate(best - positions) + positions
+    return row
+
+
+def _edit_runs(row, k, fresh):
+    """
+    Runs of consecutive ends with at most `k` edits in a row of `_edit_row` (without
+    its leading entry, so index i is end i + 1), skipping the first `fresh` ends:
+    (first, last, best, distance) per run, `best` being its first lowest-distance end.
+    """
+    ok = row <= k
+    ok[:fresh] = False
+    idx = np.flatnonzero(ok)
+    if idx.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(idx) != 1) + 1
+    runs = []
+    for run in np.split(idx, breaks):
+        best = run[np.argmin(row[run])]
+        runs.append((int(run[0]), int(run[-1]), int(best), int(row[best])))
+    return runs
+
+
+def _edit_context(stored, strands, k, span, start):
+    """
+    Where an edit-distance scan resumed at `start` has to begin reading so it finds
+    exactly the hits of a whole-sequence scan: far enough back that, on every strand,
+    some end between the reliable part of the context (`span` bases in) and `start`
+    has more than `k` edits, so no run of ends crossing `start` is cut short.
+    """
+    back = 2 * span
+    while True:
+        context = max(0, start - back)
+        if context == 0:
+            return 0
+        text = _TEXT_MASKS[np.frombuffer(stored.slice(context, start), dtype=np.uint8)]
+        if all((_edit_row(text, masks)[span:] > k).any() for _, masks in strands):
+            return context
+        back *= 2
+
+
+def _edit_start(text, masks, end, k):
+    """
+    Start of the best alignment of `masks` ending at `end` (exclusive): align the
+    reversed pattern against the reversed text leading up to `end`.
+    """
+    lo = max(0, end - len(masks) - k)
+    row = _edit_row(text[lo:end][::-1], masks[::-1], anchored=True)
+    # the shortest of the best alignments, i.e. the rightmost start
+    return end - int(np.argmin(row))
+
+
+class ApproximateScan:
+    """
+    Occurrences of `pattern` with at most `max_errors` mismatches (or edits, with
+    `indels`), on the forward and optionally the reverse-complement strand, with
+    IUPAC codes in the pattern matched as base sets, fed chunk by chunk like a
+    LiteralScan. Hits are (start, end, match, strand, distance), in start order.
+    """
+
+    def __init__(self, pattern, max_errors=0, both_strands=False, iupac=False, indels=False):
+        forward = check_approximate(pattern, max_errors, iupac)
+        self.max_errors = max_errors
+        self.indels = indels
+        self.strands = [("+", forward)]
+        if both_strands:
+            self.strands.append(("-", reverse_complement_masks(forward)))
+        self.span = len(forward) + (max_errors if indels else 0)
+        self.overlap = self.span - 1
+        self._pending = []
+        # with indels: strand -> (distance, hit) of the best end so far of a run of
+        # matching ends that reached the end of the last chunk (it may continue)
+        self._open = {}
+
+    def _feed_edits(self, text, data, base, fresh, strand, masks):
+        row = _edit_row(text, masks)[1:]
+        runs = _edit_runs(row, self.max_errors, fresh)
+        current = self._open.pop(strand, None)
+        for first, last, best, distance in runs:
+            if current is not None and first != fresh:
+                # the open run ended with the previous chunk
+                self._pending.append(current[1])
+                current = None
+            if current is None or distance < current[0]:
+                end = best + 1
+                begin = _edit_start(text, masks, end, self.max_errors)
+                current = (distance, (base + begin, base + end, data[begin:end].decode("ascii"), strand, distance))
+            if last < len(row) - 1:
+                self._pending.append(current[1])
+                current = None
+        if current is not None:
+            if runs:
+                self._open[strand] = current
+            else:
+                self._pending.append(current[1])
+
+    def feed(self, data, offset, fresh=0):
+        # keep only the previous bases an occurrence can span
+        skip = fresh - min(fresh, self.overlap)
+        data, base, fresh = data[skip:], offset + skip, fresh - skip
+        m = len(self.strands[0][1])
+        text = _TEXT_MASKS[np.frombuffer(data, dtype=np.uint8)]
+        # only report occurrences ending in the bases this chunk added
+        for strand, masks in self.strands:
+            if self.indels:
+                self._feed_edits(text, data, base, fresh, strand, masks)
+            else:
+                counts = _mismatch_counts(text, masks)
+                first = max(fresh - m + 1, 0)
+                for i in (np.flatnonzero(counts[first:] <= self.max_errors) + first).tolist():
+                    self._pending.append((base + i, base + i + m, data[i:i + m].decode("ascii"), strand, int(counts[i])))
+        self._pending.sort()
+        # later chunks only add occurrences starting at or after this point, or replace
+        # the best end of a still open run (starting no earlier than that, or at its current start)
+        safe = min([base + len(data) - self.span + 1] + [hit[0] for _, hit in self._open.values()])
+        ready = [hit for hit in self._pending if hit[0] < safe]
+        self._pending = self._pending[len(ready):]
+        return iter(ready)
+
+    def finish(self):
+        pending = self._pending + [hit for _, hit in self._open.values()]
+        self._pending, self._open = [], {}
+        return iter(sorted(pending))
+
+
+def iter_approximate(stored, pattern, max_errors=0, both_strands=False, iupac=False, indels=False,
+                     start=0, chunk_size=seqfile.CHUNK_SIZE):
+    """
+    Approximate occurrences of `pattern` in an open sequence at or after `start`
+    (see ApproximateScan), read chunk by chunk. With indels the scan starts a little
+    before `start`, so a resumed search reports the same hits as a whole-sequence one.
+    """
+    scan = ApproximateScan(pattern, max_errors, both_strands, iupac, indels)
+    if not indels or start == 0:
+        return _iter_scan(stored, scan, start, chunk_size)
+    context = _edit_context(stored, scan.strands, max_errors, scan.span, start)
+    return (hit for hit in _iter_scan(stored, scan, context, chunk_size) if hit[0] >= start)
+
+
+def scanner(pattern, use_regex=False, max_errors=0, both_strands=False, iupac=False, indels=False):
+    """
+    Validate a search and return `scan(stored, start)`, the generator of its hits in
+    an open sequence. Raises MotifError for invalid patterns or option combinations.
+    """
+    approximate = max_errors > 0 or indels or both_strands or iupac
+    if use_regex:
+        if approximate:
+            raise MotifError("Approximate, both-strand and IUPAC search cannot use regex.")
+        compiled = check_regex(pattern)
+        return lambda stored, start=0: iter_regex(stored, compiled, start)
+    if approximate:
+        check_approximate(pattern, max_errors, iupac)
+        return lambda stored, start=0: iter_approximate(
+            stored, pattern, max_errors, both_strands, iupac, indels, start)
+    return lambda stored, start=0: iter_literal(stored, pattern, start)
+
+
+def chunk_scan(pattern, use_regex=False, max_errors=0, both_strands=False, iupac=False, indels=False):
+    """
+    A new chunk-by-chunk scan (LiteralScan or ApproximateScan) for a search validated
+    by `scanner`, for passes that feed several consumers at once; None for a regex,
+    which needs the whole text.
+    """
+    if use_regex:
+        return None
+    if max_errors > 0 or indels or both_strands or iupac:
+        return ApproximateScan(pattern, max_errors, both_strands, iupac, indels)
+    return LiteralScan(pattern)
+
+
+def format_hit(hit):
+    """
+    JSON form of a hit: 1-based start, inclusive end, plus strand and distance for approximate hits.
+    """
+    start, end, match = hit[:3]
+    formatted = {"start": start + 1, "end": end, "match": match}
+    if len(hit) > 3:
+        formatted["strand"], formatted["distance"] = hit[3:]
+    return formatted
@@ -0,0 +1,149 @@
+"""
+Opt-in per-request profiling.
+
+With GENOVISTA_PROFILING=1, a request carrying `?profile=1` (or an `X-Profile: 1`
+header) runs its endpoint under cProfile and gets the report back instead of the
+normal response: a text table sorted by cumulative time (`profile=1` or
+`profile=text`) or a binary pstats dump for snakeviz / `pstats` (`profile=pstats`).
+The endpoint's own status is returned in the `X-Profiled-Status` header.
+
+FastAPI runs synchronous endpoints in a threadpool, and cProfile only records the
+thread it is enabled in, so routes are built with `ProfiledRoute`, which enables
+the request's profiler inside the endpoint call itself. The bodies of streaming
+responses are produced after the endpoint returns and are not included.
+"""
+import cProfile
+import contextvars
+import functools
+import inspect
+import io
+import marshal
+import os
+import pstats
+from urllib.parse import parse_qs
+
+from fastapi.routing import APIRoute
+
+ENABLED = os.environ.get("GENOVISTA_PROFILING", "0") == "1"
+
+# lines of the text report
+REPORT_LINES = 60
+
+_profiler = contextvars.ContextVar("genovista_profiler", default=None)
+
+
+def _enable(profiler):
+    # on Python 3.12+ only one profiler can be active at a time: concurrent profiled
+    # requests after the first run unprofiled (their report comes back empty)
+    try:
+        profiler.enable()
+    except ValueError:
+        return False
+    return True
+
+
+def profiled(endpoint):
+    """
+    Wrap an endpoint so that, during a profiled request, it runs with the request's profiler enabled.
+    """
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def run_async(*args, **kwargs):
+            profiler = _profiler.get()
+            if profiler is None or not _enable(profiler):
+                return await endpoint(*args, **kwargs)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profiler.disable()
+        return run_async
+
+    @functools.wraps(endpoint)
+    def run(*args, **kwargs):
+        profiler = _profiler.get()
+        if profiler is None or not _enable(profiler):
+            return endpoint(*args, **kwargs)
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profiler.disable()
+    return run
+
+
+class ProfiledRoute(APIRoute):
+    """
+    APIRoute whose endpoint can be profiled per request (see `profiled`).
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+
+def _requested(scope):
+    """
+    The report format a request asks for ("text" or "pstats"), or None.
+    """
+    value = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile", [None])[-1]
+    if value is None:
+        value = dict(scope["headers"]).get(b"x-profile", b"").decode("latin-1") or None
+    if value in (None, "0", "false"):
+        return None
+    return "pstats" if value == "pstats" else "text"
+
+
+def report(profiler, fmt="text"):
+    """
+    A finished profile as (body, media type).
+    """
+    profiler.create_stats()
+    if fmt == "pstats":
+        return marshal.dumps(profiler.stats), "application/octet-stream"
+    if not profiler.stats:
+        return b"No profile recorded (the route is not profiled, or another profile was running).\n", \
+            "text/plain; charset=utf-8"
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+    return out.getvalue().encode("utf-8"), "text/plain; charset=utf-8"
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware answering profiled requests with their report (see module docstring).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        fmt = _requested(scope) if ENABLED and scope["type"] == "http" else None
+        if fmt is None:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = cProfile.Profile()
+        status = 500
+
+        async def discard(message):
+            # the endpoint's response is replaced by the report
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        token = _profiler.set(profiler)
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            _profiler.reset(token)
+
+        body, media_type = report(profiler, fmt)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", media_type.encode("latin-1")),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"x-profiled-status", str(status).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
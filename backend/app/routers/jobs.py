@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from app import jobs, profiling
+
+# create a router object
+router = APIRouter(route_class=profiling.ProfiledRoute)
+
+JOB_NOT_FOUND = "Job not found."
+
+@router.get("/")
+def list_jobs(limit: int = Query(100, ge=1, le=jobs.HISTORY)):
+    """
+    List recent background jobs, newest first.
+    """
+    return jobs.list_jobs(limit)
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    """
+    Status (queued, running, done, failed or cancelled), progress (0..1) and, once done, the result of a job.
+    """
+    job = jobs.view(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=JOB_NOT_FOUND)
+    return job
+
+@router.delete("/{job_id}")
+def cancel_job(job_id: str):
+    """
+    Cancel a job: a queued job never starts, a running one stops at its next chunk.
+    """
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=JOB_NOT_FOUND)
+    return job
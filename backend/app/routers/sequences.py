@@ -1,87 +1,118 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+import functools
+import json
 import os
-import uuid
-import gzip
-import shutil
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import threading
+import time
 import re
-from typing import List
+from typing import List, Literal, Optional
+
+from app import analysis, catalog, compression, fmindex, ingest, jobs, metrics, motif, profiling, seqfile, sketch, stats, storage, tasks
+from app.config import DATA_DIR
 
 # create a router object
-router = APIRouter()
+router = APIRouter(route_class=profiling.ProfiledRoute)
 
 # directory to store sequence files
-DATA_DIR = "data"
 os.makedirs(DATA_DIR, exist_ok=True)
+catalog.init()
+
+NOT_FOUND = "Sequence file not found for this ID."
+
+def resolve_or_404(seq_id: str, detail: str = NOT_FOUND) -> storage.Artifacts:
+    """
+    Resolve a sequence id to its stored artifacts or raise 404.
+    """
+    artifacts = storage.resolve(seq_id)
+    if artifacts is None:
+        raise HTTPException(status_code=404, detail=detail)
+    return artifacts
+
+def retry_if_replaced(endpoint):
+    """
+    Run a read endpoint once more when a file it resolved was deleted before it could
+    open it: the id was updated or deleted meanwhile, and the second run resolves it afresh.
+    """
+    @functools.wraps(endpoint)
+    def run(*args, **kwargs):
+        try:
+            return endpoint(*args, **kwargs)
+        except FileNotFoundError:
+            storage.refresh(kwargs["seq_id"])
+            return endpoint(*args, **kwargs)
+    return run
+
+def resolve_compressed_or_404(seq_id: str) -> storage.Artifacts:
+    """
+    Resolve a sequence id that must have a compressed artifact or raise 404.
+    """
+    # re-stat once in case another worker compressed or removed it
+    artifacts = storage.resolve(seq_id)
+    if artifacts is not None and (artifacts.compressed is None or not os.path.exists(artifacts.compressed)):
+        artifacts = storage.refresh(seq_id)
+    if artifacts is None or artifacts.compressed is None:
+        raise HTTPException(status_code=404, detail="Compressed file not found for this ID.")
+    return artifacts
+
+def validate_payload(sequence: str) -> bytes:
+    """
+    Normalize a JSON-supplied sequence to uppercase ASCII or raise 400.
+    """
+    try:
+        return ingest.normalize(sequence.encode("ascii"), strip_whitespace=False)
+    except (UnicodeEncodeError, ingest.IngestError):
+        raise HTTPException(status_code=400, detail="Invalid DNA sequence. Use only A, T, C, G.")
 
 # Pydantic model for incoming sequence data
 class SequenceUpload(BaseModel):
     sequence: str
 
 @router.get("/")
-def list_sequences():
+def list_sequences(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    sort: Literal["mtime", "length", "id"] = "mtime",
+    order: Literal["asc", "desc"] = "desc",
+):
     """
-    List available DNA sequences stored in the data folder.
-    Returns id, preview (first bases), length, and whether a compressed file exists.
+    List available DNA sequences from the catalog (newest first by default).
+    Returns id, name, preview (first bases), length, and whether a compressed file exists.
     """
+    rows, total = catalog.list_page(limit=limit, offset=offset, sort=sort, order=order)
     items = []
-    for file in os.listdir(DATA_DIR):
-        if file.endswith(".txt"):
-            path = os.path.join(DATA_DIR, file)
-            # support both legacy id_name.txt and new id.txt
-            filename_no_ext = file[:-4]
-            if "_" in filename_no_ext:
-                seq_id = filename_no_ext.split("_", 1)[0]
-            else:
-                seq_id = filename_no_ext
-            # read to get length
-            try:
-                with open(path, "r") as f:
-                    sequence = f.read().strip().upper()
-                length = len(sequence)
-                preview = sequence[:20] + ("..." if length > 20 else "")
-            except Exception:
-                length = None
-                preview = None
-            # compressed exists?
-            compressed_exists = os.path.exists(path + ".gz")
-            items.append({
-                "id": seq_id,
-                "preview": preview,
-                "length": length,
-                "compressed": compressed_exists
-            })
-    # sort by newest first (by file mtime desc)
-    def mtime_for(item):
-        # prefer new pattern id.txt; fallback to any matching legacy file
-        path_new = os.path.join(DATA_DIR, f"{item['id']}.txt")
-        if os.path.exists(path_new):
-            return os.path.getmtime(path_new)
-        # find any file starting with id_
-        for f in os.listdir(DATA_DIR):
-            if f.startswith(item['id'] + "_") and f.endswith('.txt'):
-                return os.path.getmtime(os.path.join(DATA_DIR, f))
-        return 0
-    items.sort(key=mtime_for, reverse=True)
-    return {"items": items}
+    for row in rows:
+        preview = row["preview"]
+        if preview is not None and row["length"] is not None and row["length"] > len(preview):
+            preview += "..."
+        items.append({
+            "id": row["id"],
+            "preview": preview,
+            "name": row["name"],
+            "length": row["length"],
+            "compressed": bool(row["compressed"])
+        })
+    return {"items": items, "total": total, "limit": limit, "offset": offset}
 
 @router.post("/")
 def upload_sequence(payload: SequenceUpload):
     """
-    Upload a new DNA sequence and store it as a .txt file
+    Upload a new DNA sequence and store it in the packed .gv2 format
+    (identical content is stored once and shared between ids)
     """
     # generate a unique ID for the sequence
-    seq_id = str(uuid.uuid4())[:8]
-    file_path = os.path.join(DATA_DIR, f"{seq_id}.txt")
+    seq_id = storage.new_id()
 
     # simple validation
-    seq = payload.sequence.upper()
-    if not all(base in "ATCG" for base in seq):
-        raise HTTPException(status_code=400, detail="Invalid DNA sequence. Use only A, T, C, G.")
+    seq = validate_payload(payload.sequence)
 
-    # write to file
-    with open(file_path, "w") as f:
-        f.write(seq)
+    # write to a temporary file (unless the content is already stored), then move it into place
+    summary = catalog.summarize(seq)
+    storage.store(seq_id, summary, tmp=storage.write_blob(seq, summary[2]), data=seq)
 
     return {
         "id": seq_id,
@@ -89,29 +120,56 @@ def upload_sequence(payload: SequenceUpload):
         "message": "Sequence uploaded successfully"
     }
 
+@router.post("/ingest")
+async def ingest_sequences(request: Request, allow_iupac: bool = False):
+    """
+    Stream raw or FASTA/multi-FASTA data (optionally gzipped) from the request body
+    straight to storage. Every FASTA record becomes its own sequence; nothing is
+    stored unless the whole body is valid.
+    """
+    session = ingest.IngestSession(ingest_alphabet(allow_iupac))
+    items = await run_ingest(request, session)
+    return {"items": items, "count": len(items), "message": "Sequences ingested successfully"}
+
+def ingest_alphabet(allow_iupac: bool) -> bytes:
+    return ingest.IUPAC_ALPHABET if allow_iupac else ingest.STRICT_ALPHABET
+
+async def run_ingest(request: Request, session: ingest.IngestSession):
+    """
+    Feed the request body through an ingest session chunk by chunk (file work runs in the threadpool).
+    """
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(session.feed, chunk)
+        return await run_in_threadpool(session.close)
+    except ingest.IngestError as e:
+        await run_in_threadpool(session.abort)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        await run_in_threadpool(session.abort)
+        raise
+
 @router.get("/{seq_id}")
-def get_sequence(seq_id: str):
+@retry_if_replaced
+def get_sequence(
+    seq_id: str,
+    download: bool = False,
+    range_header: Optional[str] = Header(None, alias="Range"),
+):
     """
     Return the full stored DNA sequence for a given id and its length.
-    Supports both new pattern `id.txt` and legacy `id_*.txt`.
+    Supports packed `.gv2`, flat `id.txt` and legacy `id_*.txt` files; always returns text.
+    With `download=true` or a `Range: bytes=start-end` header the bases are streamed
+    as text/plain (206 Partial Content for a range) instead of one JSON payload.
     """
-    # try new pattern first
-    candidate = os.path.join(DATA_DIR, f"{seq_id}.txt")
-    sequence_file = None
-    if os.path.exists(candidate):
-        sequence_file = candidate
-    else:
-        # search legacy
-        for f in os.listdir(DATA_DIR):
-            if f.startswith(seq_id + "_") and f.endswith('.txt'):
-                sequence_file = os.path.join(DATA_DIR, f)
-                break
+    sequence_file = resolve_or_404(seq_id).raw
 
-    if not sequence_file:
-        raise HTTPException(status_code=404, detail="Sequence file not found for this ID.")
+    if download or range_header:
+        return stream_sequence(seq_id, sequence_file, range_header)
 
-    with open(sequence_file, "r") as f:
-        sequence = f.read().strip().upper()
+    with seqfile.open_sequence(sequence_file) as stored:
+        sequence = stored.read_text()
 
     return {
         "id": seq_id,
@@ -119,280 +177,850 @@ def get_sequence(seq_id: str):
         "length": len(sequence)
     }
 
+def parse_range(range_header: str, total: int):
+    """
+    Parse a single `bytes=` range into a half-open (start, end). Returns None for a
+    header the server ignores (RFC 9110: other units, several ranges, invalid syntax),
+    which gets the full 200 response; raises 416 for a range past the end.
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if match is None or not (match.group(1) or match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        if match.group(2) and int(match.group(2)) < start:
+            return None
+        end = min(int(match.group(2)) + 1, total) if match.group(2) else total
+    else:
+        start, end = max(total - int(match.group(2)), 0), total
+    if start >= end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable.",
+                            headers={"Content-Range": f"bytes */{total}"})
+    return start, end
+
+def iter_sequence(stored, start: int, end: int):
+    with stored:
+        yield from stored.iter_chunks(chunk_size=1 << 20, start=start, end=end)
+
+def stream_sequence(seq_id: str, sequence_file: str, range_header: Optional[str]):
+    # opened now, so the body is read from this file even if the id is updated meanwhile
+    stored = seqfile.open_sequence(sequence_file)
+    total = len(stored)
+    start, end, status = 0, total, 200
+    headers = {"Accept-Ranges": "bytes", "Content-Disposition": f'attachment; filename="{seq_id}.txt"'}
+    try:
+        byte_range = parse_range(range_header, total) if range_header else None
+    except HTTPException:
+        stored.close()
+        raise
+    if byte_range is not None:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{total}"
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(iter_sequence(stored, start, end), status_code=status,
+                             media_type="text/plain", headers=headers)
+
 class SequenceUpdate(BaseModel):
     sequence: str
 
 @router.put("/{seq_id}")
 def update_sequence(seq_id: str, payload: SequenceUpdate):
     """
-    Replace the stored DNA sequence for a given id (overwrites .txt, removes old .gz if exists).
-    Supports both new pattern `id.txt` and legacy `id_*.txt`; will write back to `id.txt`.
+    Replace the stored DNA sequence for a given id. The id is pointed at the blob of
+    the new content once it is fully written; the old content (and its compressed
+    artifact) is deleted only when no other id shares it.
+    Supports sharded, flat `id.txt` and legacy `id_*.txt`; the new content goes to the blob store.
     """
-    # ensure data dir
-    os.makedirs(DATA_DIR, exist_ok=True)
-
-    # remove any legacy txts for this id
-    for f in os.listdir(DATA_DIR):
-        if (f == f"{seq_id}.txt") or (f.startswith(seq_id + "_") and f.endswith('.txt')):
-            try:
-                os.remove(os.path.join(DATA_DIR, f))
-            except FileNotFoundError:
-                pass
-
-    # write new sequence
-    seq = payload.sequence.upper()
-    if not all(base in "ATCG" for base in seq):
-        raise HTTPException(status_code=400, detail="Invalid DNA sequence. Use only A, T, C, G.")
-    path_new = os.path.join(DATA_DIR, f"{seq_id}.txt")
-    with open(path_new, 'w') as f:
-        f.write(seq)
+    seq = validate_payload(payload.sequence)
 
-    # remove any gz for this id (since content changed)
-    gz_new = path_new + '.gz'
-    if os.path.exists(gz_new):
-        try:
-            os.remove(gz_new)
-        except FileNotFoundError:
-            pass
-    # also remove any legacy gz
-    for f in os.listdir(DATA_DIR):
-        if f.startswith(seq_id) and f.endswith('.gz'):
-            try:
-                os.remove(os.path.join(DATA_DIR, f))
-            except FileNotFoundError:
-                pass
+    summary = catalog.summarize(seq)
+    storage.store(seq_id, summary, tmp=storage.write_blob(seq, summary[2]), data=seq)
+    stats.invalidate(seq_id)
 
     return {"id": seq_id, "length": len(seq), "message": "Sequence updated successfully"}
 
+@router.put("/{seq_id}/stream")
+async def stream_update_sequence(seq_id: str, request: Request, allow_iupac: bool = False):
+    """
+    Replace the stored DNA sequence for a given id from a streamed raw or
+    single-record FASTA body (optionally gzipped). The old sequence stays in
+    place until the new one has been fully written.
+    """
+    session = ingest.IngestSession(ingest_alphabet(allow_iupac), seq_id=seq_id)
+    items = await run_ingest(request, session)
+    return {"id": seq_id, "length": items[0]["length"], "message": "Sequence updated successfully"}
+
 @router.delete("/{seq_id}")
 def delete_sequence(seq_id: str):
     """
-    Delete the stored DNA sequence (both .txt and any .gz) for a given id.
+    Delete the stored DNA sequence for a given id. Its raw file and any compressed
+    artifact are deleted once no other id shares them.
     """
-    found = False
-    # delete txts
-    for f in os.listdir(DATA_DIR):
-        if (f == f"{seq_id}.txt") or (f.startswith(seq_id + "_") and f.endswith('.txt')):
-            try:
-                os.remove(os.path.join(DATA_DIR, f))
-                found = True
-            except FileNotFoundError:
-                pass
-    # delete gz
-    for f in os.listdir(DATA_DIR):
-        if f.startswith(seq_id) and f.endswith('.gz'):
-            try:
-                os.remove(os.path.join(DATA_DIR, f))
-            except FileNotFoundError:
-                pass
-    if not found:
-        raise HTTPException(status_code=404, detail="Sequence file not found for this ID.")
+    artifacts = resolve_or_404(seq_id)
+    storage.delete(seq_id, artifacts.raw)
+    stats.invalidate(seq_id)
     return {"id": seq_id, "message": "Sequence deleted"}
 
 @router.post("/{seq_id}/compress")
-def compress_sequence(seq_id: str):
+def compress_sequence(
+    seq_id: str,
+    codec: str = compression.DEFAULT_CODEC,
+    block_size: int = Query(compression.BLOCK_SIZE, ge=1 << 12, le=1 << 24),
+):
     """
-    Compress the stored DNA sequence using gzip (lossless compression)
+    Compress the stored DNA sequence with the chosen codec (lossless compression).
+    The codec is recorded in the file header, so decompression detects it; the
+    sequence is compressed in independent blocks of `block_size` bases for random access.
+    Sequences longer than jobs.INLINE_MAX_LENGTH are compressed by a job (202).
     """
-    # find the file in data folder
-    original_file = None
-    for file in os.listdir(DATA_DIR):
-        if file.startswith(seq_id):
-            original_file = os.path.join(DATA_DIR, file)
-            break
-
-    if not original_file:
-        raise HTTPException(status_code=404, detail="Sequence ID not found.")
+    try:
+        compression.get_codec(codec).check_block_size(block_size)
+    except compression.CodecError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    compressed_file = f"{original_file}.gz"
+    original_file = resolve_or_404(seq_id, "Sequence ID not found.").raw
+    if runs_as_job(seq_id, original_file):
+        return run_as_job(seq_id, "compress", {"codec": codec, "block_size": block_size})
 
-    # compress the file
-    with open(original_file, "rb") as f_in:
-        with gzip.open(compressed_file, "wb") as f_out:
-            shutil.copyfileobj(f_in, f_out)
-
-    # get sizes
-    original_size = os.path.getsize(original_file)
-    compressed_size = os.path.getsize(compressed_file)
+    # compress the text form, streamed chunk by chunk from the stored file
+    try:
+        result = tasks.compress(original_file, codec, block_size)
+        finish_compress(original_file)
+    except tasks.TaskError as e:
+        raise HTTPException(status_code=409 if str(e) == SEQUENCE_CHANGED else 400, detail=str(e))
 
     return {
         "id": seq_id,
-        "original_size_bytes": original_size,
-        "compressed_size_bytes": compressed_size,
-        "compression_ratio": round(compressed_size / original_size, 3),
+        **result,
         "message": "Sequence compressed successfully",
-        "compressed_file": os.path.basename(compressed_file)
     }
 
+SEQUENCE_CHANGED = "Sequence changed while it was being compressed; retry."
+
+def finish_compress(original_file: str):
+    """
+    Record a freshly written compressed artifact in the catalog and the id index for
+    every id stored at `original_file`; raise TaskError when none is any more (the
+    sequence was updated or deleted while it was being compressed).
+    """
+    if not storage.mark_compressed(original_file):
+        raise tasks.TaskError(SEQUENCE_CHANGED)
+
 @router.get("/{seq_id}/decompress")
-def decompress_sequence(seq_id: str):
+@retry_if_replaced
+def decompress_sequence(seq_id: str, verify: bool = True):
     """
-    Decompress a gzip-compressed DNA sequence and verify lossless reconstruction.
+    Decompress a compressed DNA sequence (codec detected from the file header)
+    and verify lossless reconstruction block by block against the stored original.
+    With verify=false only the first block is decompressed, for the preview.
+    Verifying a sequence longer than jobs.INLINE_MAX_LENGTH runs as a verify job (202).
     """
-    # locate compressed and original files
-    original_file = None
-    compressed_file = None
+    artifacts = resolve_compressed_or_404(seq_id)
+    if verify and runs_as_job(seq_id, artifacts.raw):
+        return run_as_job(seq_id, "verify", {})
 
-    for file in os.listdir(DATA_DIR):
-        if file.startswith(seq_id) and file.endswith(".txt"):
-            original_file = os.path.join(DATA_DIR, file)
-        elif file.startswith(seq_id) and file.endswith(".gz"):
-            compressed_file = os.path.join(DATA_DIR, file)
+    try:
+        result = tasks.decompress(artifacts.compressed, artifacts.raw, verify)
+    except compression.CodecError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    if not compressed_file:
-        raise HTTPException(status_code=404, detail="Compressed file not found for this ID.")
+    return {
+        "id": seq_id,
+        **result,
+        "message": "Decompression completed successfully"
+    }
+
+# largest region returned in one response (bases)
+MAX_REGION = 10_000_000
+
+@router.get("/{seq_id}/region")
+@retry_if_replaced
+def get_region(
+    seq_id: str,
+    start: int = Query(..., ge=1),
+    end: int = Query(..., ge=1),
+    source: Literal["raw", "compressed"] = "raw",
+):
+    """
+    Return bases start..end (1-based, inclusive) of a stored sequence.
+    `source=compressed` reads the compressed artifact, decompressing only the blocks that overlap the region.
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="Region end must be >= start.")
+    if end - start + 1 > MAX_REGION:
+        raise HTTPException(status_code=400, detail=f"Region too large (max {MAX_REGION} bases).")
 
-    # decompress content
-    with gzip.open(compressed_file, "rb") as f_in:
-        decompressed_data = f_in.read().decode("utf-8")
+    if source == "compressed":
+        try:
+            with compression.open_compressed(resolve_compressed_or_404(seq_id).compressed) as reader:
+                total = reader.length
+                region = reader.read_region(start - 1, end)
+        except compression.CodecError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    else:
+        with seqfile.open_sequence(resolve_or_404(seq_id).raw) as stored:
+            total = len(stored)
+            region = stored.slice(start - 1, end)
 
-    # optional: verify against original (if exists)
-    lossless = False
-    if original_file and os.path.exists(original_file):
-        with open(original_file, "r") as f_orig:
-            original_data = f_orig.read()
-        lossless = (original_data == decompressed_data)
+    if total is not None and start > total:
+        raise HTTPException(status_code=400, detail="Region starts beyond the end of the sequence.")
 
     return {
         "id": seq_id,
-        "sequence_preview": decompressed_data[:100] + ("..." if len(decompressed_data) > 100 else ""),
-        "length": len(decompressed_data),
-        "lossless_verification": lossless,
-        "message": "Decompression completed successfully"
+        "start": start,
+        "end": start + len(region) - 1,
+        "length": len(region),
+        "source": source,
+        "sequence": region.decode("ascii"),
     }
+
 @router.get("/{seq_id}/gc")
+@retry_if_replaced
 def calculate_gc_content(seq_id: str):
     """
     Calculate GC content (percentage of G and C bases) for a stored DNA sequence.
     """
-    # find the original file
-    sequence_file = None
-    for file in os.listdir(DATA_DIR):
-        if file.startswith(seq_id) and file.endswith(".txt"):
-            sequence_file = os.path.join(DATA_DIR, file)
-            break
+    # counts come from the stats cache, computed once when the sequence was written
+    seq_stats = stats.get(seq_id, resolve_or_404(seq_id).raw)
 
-    if not sequence_file:
-        raise HTTPException(status_code=404, detail="Sequence file not found for this ID.")
-
-    # read the sequence
-    with open(sequence_file, "r") as f:
-        sequence = f.read().upper()
-
-    if len(sequence) == 0:
+    if seq_stats.length == 0:
         raise HTTPException(status_code=400, detail="Sequence file is empty.")
 
-    # compute counts
-    g_count = sequence.count("G")
-    c_count = sequence.count("C")
-    gc_content = round(((g_count + c_count) / len(sequence)) * 100, 3)
-
     return {
         "id": seq_id,
-        "length": len(sequence),
-        "G_count": g_count,
-        "C_count": c_count,
-        "GC_percent": gc_content,
+        **gc_summary(seq_stats),
         "message": "GC content calculated successfully"
     }
+
+def gc_summary(seq_stats: stats.Stats) -> dict:
+    length = seq_stats.length
+    return {
+        "length": length,
+        "G_count": seq_stats.counts.get("G", 0),
+        "C_count": seq_stats.counts.get("C", 0),
+        "N_count": stats.n_count(seq_stats),
+        "GC_percent": round((stats.gc_count(seq_stats) / length) * 100, 3),
+    }
+
 @router.get("/{seq_id}/freq")
+@retry_if_replaced
 def nucleotide_frequency(seq_id: str):
     """
     Calculate frequency (count and percentage) of each nucleotide (A, T, C, G)
     in a stored DNA sequence.
     """
-    # find the file
-    sequence_file = None
-    for file in os.listdir(DATA_DIR):
-        if file.startswith(seq_id) and file.endswith(".txt"):
-            sequence_file = os.path.join(DATA_DIR, file)
-            break
-
-    if not sequence_file:
-        raise HTTPException(status_code=404, detail="Sequence file not found for this ID.")
-
-    # read the sequence
-    with open(sequence_file, "r") as f:
-        sequence = f.read().upper()
+    # counts come from the stats cache, computed once when the sequence was written
+    seq_stats = stats.get(seq_id, resolve_or_404(seq_id).raw)
 
-    if len(sequence) == 0:
+    if seq_stats.length == 0:
         raise HTTPException(status_code=400, detail="Sequence file is empty.")
 
-    # count nucleotides
+    return {
+        "id": seq_id,
+        **freq_summary(seq_stats),
+        "message": "Nucleotide frequency calculated successfully"
+    }
+
+def freq_summary(seq_stats: stats.Stats) -> dict:
+    total = seq_stats.length
     bases = ["A", "T", "C", "G"]
-    counts = {b: sequence.count(b) for b in bases}
-    total = len(sequence)
+    counts = {b: seq_stats.counts.get(b, 0) for b in bases}
     percentages = {b: round((counts[b] / total) * 100, 3) for b in bases}
+    return {"length": total, "counts": counts, "percentages": percentages}
+
+@router.get("/{seq_id}/kmers")
+@retry_if_replaced
+def kmer_spectrum(
+    seq_id: str,
+    k: int = Query(6, ge=1, le=analysis.MAX_K),
+    top: int = Query(20, ge=1, le=1000),
+):
+    """
+    Count all k-mers of a stored sequence (k-mers containing N or other non-ACGT symbols are skipped).
+    Returns the most frequent k-mers and the k-mer spectrum (number of distinct k-mers seen m times).
+    Sequences longer than jobs.INLINE_MAX_LENGTH are counted by a job (202).
+    """
+    sequence_file = resolve_or_404(seq_id).raw
+    if runs_as_job(seq_id, sequence_file):
+        return run_as_job(seq_id, "kmers", {"k": k, "top": top})
+    try:
+        summary = tasks.kmers(sequence_file, k, top)
+    except tasks.TaskError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     return {
         "id": seq_id,
-        "length": total,
-        "counts": counts,
-        "percentages": percentages,
-        "message": "Nucleotide frequency calculated successfully"
+        **summary,
+        "message": "K-mer spectrum calculated successfully"
+    }
+
+@router.get("/{seq_id}/windows")
+@retry_if_replaced
+def window_profile(
+    seq_id: str,
+    window: int = Query(1000, ge=2, le=MAX_REGION),
+    step: Optional[int] = Query(None, ge=1, le=MAX_REGION),
+    max_points: int = Query(1000, ge=10, le=10000),
+):
+    """
+    Sliding-window GC percent, GC skew and CpG observed/expected (step defaults to the window size).
+    Returns column arrays of at most `max_points` points (windows are merged into buckets
+    when there are more), plus whole-sequence CpG observed/expected.
+    Sequences longer than jobs.INLINE_MAX_LENGTH are profiled by a job (202).
+    """
+    sequence_file = resolve_or_404(seq_id).raw
+    if runs_as_job(seq_id, sequence_file):
+        return run_as_job(seq_id, "windows", {"window": window, "step": step, "max_points": max_points})
+    try:
+        profile = tasks.windows(sequence_file, window, step, max_points)
+    except tasks.TaskError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "id": seq_id,
+        **profile,
+        "message": "Window profile calculated successfully"
+    }
+
+def open_motif_index(seq_id: str, sequence_file: str) -> Optional[fmindex.FMIndex]:
+    """
+    Open the motif index of a sequence if it was built from the current content.
+    Otherwise start building one in the background (up to fmindex.MAX_LENGTH bases) and return None.
+    """
+    seq_stats = stats.get(seq_id, sequence_file)
+    index_file = storage.index_path(sequence_file)
+    if os.path.exists(index_file):
+        try:
+            index = fmindex.FMIndex(index_file)
+        except (OSError, seqfile.FormatError):
+            index = None
+        if index is not None:
+            if index.content_hash == seq_stats.content_hash:
+                metrics.CACHE_LOOKUPS.inc(cache="motif_index", result="hit")
+                return index
+            index.close()
+    metrics.CACHE_LOOKUPS.inc(cache="motif_index", result="miss")
+    if seq_stats.length <= fmindex.MAX_LENGTH:
+        start_index_build(seq_id, sequence_file, seq_stats.content_hash)
+    return None
+
+# content hash -> id of the job building its motif index
+_index_builds = {}
+_index_lock = threading.Lock()
+
+def start_index_build(seq_id: str, sequence_file: str, content_hash: str) -> Optional[dict]:
+    """
+    Build the motif index of a sequence as a background job. Content that is already
+    being indexed is not built twice (its job is returned); with fmindex.MAX_BUILDS
+    builds running, or the job queue full, nothing is started and None is returned.
+    """
+    with _index_lock:
+        for key, job_id in list(_index_builds.items()):
+            job = jobs.view(job_id)
+            if job is None or job["finished_at"] is not None:
+                del _index_builds[key]
+        if content_hash in _index_builds:
+            return jobs.view(_index_builds[content_hash])
+        if len(_index_builds) >= fmindex.MAX_BUILDS:
+            return None
+        try:
+            job = jobs.submit("index", seq_id, {}, tasks.build_index, sequence_file, storage.index_path(sequence_file))
+        except jobs.QueueFull:
+            return None
+        _index_builds[content_hash] = job["id"]
+        return job
+
+def job_accepted(job: dict) -> JSONResponse:
+    """
+    202 response for work handed to a background job; poll GET /jobs/{job_id}.
+    """
+    return JSONResponse(status_code=202, content=job, headers={"Location": f"/jobs/{job['id']}"})
+
+@router.post("/{seq_id}/index")
+def build_motif_index(seq_id: str):
+    """
+    Build (or rebuild) the FM-index used by exact motif searches now, instead of
+    waiting for the background build triggered by the first search. Sequences of
+    more than jobs.INLINE_MAX_LENGTH bases are indexed by a background job: the
+    response is 202 with the job (the running one if this content is already being
+    indexed), or 503 while fmindex.MAX_BUILDS builds are running.
+    """
+    sequence_file = resolve_or_404(seq_id).raw
+    seq_stats = stats.get(seq_id, sequence_file)
+    if seq_stats.length == 0:
+        raise HTTPException(status_code=400, detail=tasks.EMPTY)
+    if seq_stats.length > fmindex.MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Sequence too long to index (max {fmindex.MAX_LENGTH} bases).")
+
+    if seq_stats.length > jobs.INLINE_MAX_LENGTH:
+        job = start_index_build(seq_id, sequence_file, seq_stats.content_hash)
+        if job is None:
+            raise HTTPException(status_code=503, detail="Too many motif indexes are being built; retry later.")
+        return job_accepted(job)
+
+    try:
+        result = tasks.build_index(sequence_file, storage.index_path(sequence_file))
+    except tasks.TaskError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "id": seq_id,
+        **result,
+        "message": "Motif index built successfully"
     }
 
-from typing import List
+# matches returned per page when no limit is given
+DEFAULT_MOTIF_LIMIT = 1000
+MAX_MOTIF_LIMIT = 100_000
 
 class MotifRequest(BaseModel):
     pattern: str
     use_regex: bool = False
+    use_index: bool = True
+    count_only: bool = False
+    limit: Optional[int] = Field(None, ge=1, le=MAX_MOTIF_LIMIT)
+    cursor: Optional[int] = Field(None, ge=0)
+    stream: bool = False
+    max_mismatches: int = Field(0, ge=0, le=motif.MAX_ERRORS)
+    allow_indels: bool = False
+    both_strands: bool = False
+    iupac: bool = False
 
 @router.post("/{seq_id}/motif")
+@retry_if_replaced
 def search_motif(seq_id: str, payload: MotifRequest):
     """
     Search for a DNA motif or regex pattern in a stored sequence.
-    Returns match positions and matched sequences.
+    Returns match positions and matched sequences, one page at a time: at most `limit`
+    matches (default 1000) starting at `cursor`, plus the `next_cursor` of the following page.
+    `count_only` returns just the number of matches; `stream` returns every match from
+    `cursor` on (up to `limit`, if given) as NDJSON, one object per line, ending with a summary line.
+    Exact A/C/G/T motifs are answered from the sequence's FM-index when one is
+    current; otherwise the sequence is scanned (and an index is built in the background).
+    `max_mismatches` (edits, with `allow_indels`), `both_strands` and `iupac` switch to an
+    approximate scan; its matches also report `strand` and `distance`.
     """
-    # locate file
-    sequence_file = None
-    for file in os.listdir(DATA_DIR):
-        if file.startswith(seq_id) and file.endswith(".txt"):
-            sequence_file = os.path.join(DATA_DIR, file)
-            break
-
-    if not sequence_file:
-        raise HTTPException(status_code=404, detail="Sequence file not found for this ID.")
-
-    # read sequence
-    with open(sequence_file, "r") as f:
-        sequence = f.read().upper()
+    sequence_file = resolve_or_404(seq_id).raw
 
-    if len(sequence) == 0:
+    if stats.get(seq_id, sequence_file).length == 0:
         raise HTTPException(status_code=400, detail="Sequence file is empty.")
 
     pattern = payload.pattern.upper()
+    if not pattern:
+        raise HTTPException(status_code=400, detail="Pattern must not be empty.")
 
-    # if regex enabled
-    if payload.use_regex:
+    approximate = payload.max_mismatches > 0 or payload.allow_indels or payload.both_strands or payload.iupac
+
+    # scan(stored, cursor) -> hits, for when no index answers the search
+    try:
+        scan = motif.scanner(pattern, **motif_options(payload))
+    except motif.MotifError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    index = None
+    if payload.use_index and not payload.use_regex and not approximate and fmindex.searchable(pattern):
+        index = open_motif_index(seq_id, sequence_file)
+    if index is None and runs_as_job(seq_id, sequence_file):
+        # a scan of a large sequence runs as a motif job
+        return run_as_job(seq_id, "motif", payload.model_dump(exclude={"stream", "count_only"}, exclude_none=True))
+    source = index if index is not None else seqfile.open_sequence(sequence_file)
+    cursor = payload.cursor or 0
+
+    if payload.stream and not payload.count_only:
+        return StreamingResponse(ndjson_matches(source, iter_motif(source, pattern, scan, cursor), payload.limit),
+                                 media_type="application/x-ndjson")
+
+    limit = payload.limit or DEFAULT_MOTIF_LIMIT
+    page, next_cursor = [], None
+    with source:
         try:
-            matches = list(re.finditer(pattern, sequence))
-        except re.error:
-            raise HTTPException(status_code=400, detail="Invalid regex pattern.")
-    else:
-        # simple literal search
-        matches = []
-        start = 0
-        while True:
-            idx = sequence.find(pattern, start)
-            if idx == -1:
-                break
-            matches.append({"start": idx + 1, "end": idx + len(pattern), "match": pattern})
-            start = idx + 1
-
-    # if regex mode used, extract matches
-    if payload.use_regex:
-        formatted_matches = [
-            {"start": m.start() + 1, "end": m.end(), "match": m.group()} for m in matches
-        ]
-    else:
-        formatted_matches = matches
+            if index is not None:
+                # an index counts in O(pattern length)
+                total = index.count(pattern.encode("ascii"))
+            elif payload.count_only:
+                # consume the hits without keeping them
+                total = sum(1 for _ in iter_motif(source, pattern, scan, 0))
+            if not payload.count_only:
+                page, next_cursor = take_page(iter_motif(source, pattern, scan, cursor), limit)
+                # without an index the overall total is only known when the first page holds every match
+                if index is None:
+                    total = len(page) if cursor == 0 and next_cursor is None else None
+        except motif.MotifError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     return {
         "id": seq_id,
         "pattern": payload.pattern,
         "use_regex": payload.use_regex,
-        "total_matches": len(formatted_matches),
-        "matches": formatted_matches,
+        "indexed": index is not None,
+        "total_matches": total,
+        "returned": len(page),
+        "next_cursor": next_cursor,
+        "matches": [motif.format_hit(hit) for hit in page],
         "message": "Motif search completed successfully"
     }
+
+def iter_motif(source, pattern: str, scan, cursor: int):
+    """
+    Hits (0-based start, end, match[, strand, distance]) at or after `cursor` from an
+    FM-index or, through `scan`, an open sequence.
+    """
+    if isinstance(source, fmindex.FMIndex):
+        return motif.iter_indexed(source, pattern, cursor)
+    return scan(source, cursor)
+
+def take_page(hits, limit: int):
+    """
+    Take up to `limit` hits and return (page, next_cursor). The cursor is a position,
+    so hits sharing a start (e.g. both strands of a palindrome) always stay on one page.
+    """
+    page = []
+    for hit in hits:
+        if len(page) >= limit and hit[0] != page[-1][0]:
+            return page, hit[0]
+        page.append(hit)
+    return page, None
+
+def motif_options(payload: MotifRequest) -> dict:
+    return {
+        "use_regex": payload.use_regex,
+        "max_errors": payload.max_mismatches,
+        "both_strands": payload.both_strands,
+        "iupac": payload.iupac,
+        "indels": payload.allow_indels,
+    }
+
+def ndjson_matches(source, hits, limit: Optional[int]):
+    """
+    Encode hits as NDJSON lines and close their source once done; the last line
+    is a summary (or an error, if the search was aborted midway).
+    """
+    returned = 0
+    last_start = next_cursor = None
+    try:
+        for hit in hits:
+            # as in take_page, hits sharing a start are never split
+            if limit is not None and returned >= limit and hit[0] != last_start:
+                next_cursor = hit[0]
+                break
+            yield json.dumps(motif.format_hit(hit)) + "\n"
+            returned += 1
+            last_start = hit[0]
+        yield json.dumps({"done": True, "returned": returned, "next_cursor": next_cursor}) + "\n"
+    except motif.MotifError as e:
+        yield json.dumps({"done": False, "returned": returned, "error": str(e)}) + "\n"
+    finally:
+        hits.close()
+        source.close()
+
+class CompressJob(BaseModel):
+    codec: str = compression.DEFAULT_CODEC
+    block_size: int = Field(compression.BLOCK_SIZE, ge=1 << 12, le=1 << 24)
+
+class KmerJob(BaseModel):
+    k: int = Field(6, ge=1, le=analysis.MAX_K)
+    top: int = Field(20, ge=1, le=1000)
+
+class WindowJob(BaseModel):
+    window: int = Field(1000, ge=2, le=MAX_REGION)
+    step: Optional[int] = Field(None, ge=1, le=MAX_REGION)
+    max_points: int = Field(1000, ge=10, le=10000)
+
+class MotifJob(MotifRequest):
+    limit: int = Field(DEFAULT_MOTIF_LIMIT, ge=1, le=MAX_MOTIF_LIMIT)
+
+class JobRequest(BaseModel):
+    kind: Literal["compress", "verify", "kmers", "windows", "motif"]
+    params: dict = {}
+
+def job_params(kind: str, params: dict):
+    """
+    Validate the options of a compress, kmers, windows or motif job (or batch operation)
+    and return (options model, task keyword arguments). Raises 422 for invalid options
+    and 400 for an unknown codec or invalid motif.
+    """
+    try:
+        if kind == "compress":
+            model = CompressJob(**params)
+            compression.get_codec(model.codec).check_block_size(model.block_size)
+            return model, model.model_dump()
+        if kind == "kmers":
+            model = KmerJob(**params)
+            return model, model.model_dump()
+        if kind == "windows":
+            model = WindowJob(**params)
+            return model, model.model_dump()
+        model = MotifJob(**params)
+        pattern = model.pattern.upper()
+        if not pattern:
+            raise HTTPException(status_code=400, detail="Pattern must not be empty.")
+        options = motif_options(model)
+        # validate now rather than in the worker
+        motif.scanner(pattern, **options)
+        return model, {"pattern": pattern, "options": options, "limit": model.limit, "start": model.cursor or 0}
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    except (compression.CodecError, motif.MotifError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def job_call(seq_id: str, kind: str, params: dict):
+    """
+    What a job of `kind` on a sequence runs: (validated params, task function and
+    arguments, on_done callback). Raises 404 / 4xx like the matching endpoint.
+    """
+    original_file = resolve_or_404(seq_id).raw
+    on_done = None
+    if kind == "verify":
+        model = None
+        args = (tasks.decompress, resolve_compressed_or_404(seq_id).compressed, original_file, True)
+    else:
+        model, options = job_params(kind, params)
+        if kind == "compress":
+            args = (tasks.compress, original_file, options["codec"], options["block_size"])
+            on_done = lambda result: finish_compress(original_file)
+        elif kind == "kmers":
+            args = (tasks.kmers, original_file, options["k"], options["top"])
+        elif kind == "windows":
+            args = (tasks.windows, original_file, options["window"], options["step"], options["max_points"])
+        else:
+            args = (tasks.motif_scan, original_file, options["pattern"], options["options"], options["limit"],
+                    options["start"])
+    return (model.model_dump() if model is not None else {}), args, on_done
+
+def submit_or_503(seq_id: str, kind: str, params: dict, args: tuple, on_done=None) -> dict:
+    try:
+        return jobs.submit(kind, seq_id, params, *args, on_done=on_done)
+    except jobs.QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except BrokenProcessPool:
+        raise HTTPException(status_code=503, detail="Job workers were restarted; retry later.")
+
+def runs_as_job(seq_id: str, sequence_file: str) -> bool:
+    """
+    True when work on the whole sequence is too long for a request: more than
+    jobs.INLINE_MAX_LENGTH bases. Such endpoints answer with a job (see `run_as_job`).
+    """
+    return stats.get(seq_id, sequence_file).length > jobs.INLINE_MAX_LENGTH
+
+def run_as_job(seq_id: str, kind: str, params: dict) -> JSONResponse:
+    """
+    Hand an endpoint's work on a large sequence to a background job instead of
+    holding an API thread: 202 with the job, whose result is the endpoint's response
+    without `id` and `message`.
+    """
+    params, args, on_done = job_call(seq_id, kind, params)
+    return job_accepted(submit_or_503(seq_id, kind, params, args, on_done))
+
+@router.post("/{seq_id}/jobs", status_code=202)
+def submit_job(seq_id: str, payload: JobRequest):
+    """
+    Run compress, verify (decompress and check every block), kmers, windows or motif
+    (a full scan from `cursor`: total plus the first `limit` matches) as a background job in the
+    worker pool. `params` takes the options of the matching endpoint. Sequences of
+    up to jobs.INLINE_MAX_LENGTH bases are processed right away; the job comes back
+    finished. Poll GET /jobs/{job_id} for status, progress and the result.
+    """
+    params, args, on_done = job_call(seq_id, payload.kind, payload.params)
+    if not runs_as_job(seq_id, resolve_or_404(seq_id).raw):
+        return jobs.run_inline(payload.kind, seq_id, params, *args, on_done=on_done)
+    return submit_or_503(seq_id, payload.kind, params, args, on_done)
+
+@router.get("/{seq_id}/similar")
+@retry_if_replaced
+def similar_sequences(seq_id: str, top: int = Query(10, ge=1, le=1000)):
+    """
+    Find the stored sequences most similar to this one, with estimated Jaccard similarity
+    of their k-mer sets and average nucleotide identity (ANI), from MinHash sketches.
+    Candidates come from the LSH index, so the corpus is never compared pairwise;
+    sequences with identical content come first (jaccard 1).
+    """
+    sequence_file = resolve_or_404(seq_id).raw
+    content_hash = stats.get(seq_id, sequence_file).content_hash
+    # sequences catalogued before sketches existed are sketched on first use
+    sk = catalog.get_sketch(content_hash) or catalog.scan_sketch(content_hash, sequence_file)
+
+    candidates = catalog.sketch_candidates(sketch.buckets(sk.signature), exclude=content_hash)
+    ranked = [(content_hash, sk.kmers, 1.0)] + sketch.rank(sk.signature, candidates, top)
+    found = catalog.ids_by_hash(digest for digest, _, _ in ranked)
+
+    matches = []
+    for digest, kmers, jaccard in ranked:
+        ani = sketch.ani(jaccard)
+        for entry in found.get(digest, []):
+            if entry["id"] != seq_id:
+                matches.append({**entry, "kmers": kmers, "jaccard": round(jaccard, 4),
+                                "ani": round(ani, 4) if ani is not None else None})
+
+    return {
+        "id": seq_id,
+        "k": sketch.K,
+        "kmers": sk.kmers,
+        "candidates": len(candidates),
+        "returned": min(len(matches), top),
+        "matches": matches[:top],
+        "message": "Similar sequences found" if matches else "No similar sequences found"
+    }
+
+# most sequences or ids in one batch request
+MAX_BATCH = 10_000
+
+# batch uploads stored per catalog transaction
+BATCH_COMMIT = 100
+
+class BatchSequence(BaseModel):
+    sequence: str
+    name: Optional[str] = None
+
+class BatchUpload(BaseModel):
+    sequences: List[BatchSequence] = Field(..., min_length=1, max_length=MAX_BATCH)
+
+@router.post("/batch")
+def batch_upload(payload: BatchUpload):
+    """
+    Upload many sequences in one request. Items are validated, hashed and written in
+    parallel, then stored (identical content is shared, as for single uploads) up to
+    BATCH_COMMIT per catalog transaction. Results stream back as NDJSON, one line per
+    item in request order (`id` and `length`, or the `error` of an invalid item, which
+    does not stop the others), ending with a summary line.
+    """
+    return StreamingResponse(batch_upload_lines(payload.sequences), media_type="application/x-ndjson")
+
+def prepare_upload(item: BatchSequence):
+    # runs in the batch's threads: validate, summarize and write a temporary blob
+    seq = validate_payload(item.sequence)
+    summary = catalog.summarize(seq)
+    return seq, summary, storage.write_blob(seq, summary[2])
+
+def store_uploads(items: List[BatchSequence], prepared: list) -> List[dict]:
+    """
+    Store prepared uploads, (index, seq, summary, tmp), in one catalog transaction;
+    returns their result lines (every item fails if the transaction does).
+    """
+    lines = []
+    try:
+        with catalog.transaction():
+            for index, seq, summary, tmp in prepared:
+                seq_id = storage.new_id()
+                storage.store(seq_id, summary, tmp=tmp, data=seq, name=items[index].name)
+                lines.append({"index": index, "id": seq_id, "name": items[index].name, "length": len(seq)})
+    except Exception as e:
+        for line in lines:
+            storage.forget(line["id"])
+        storage.remove_files([tmp for _, _, _, tmp in prepared if tmp])
+        return [{"index": index, "error": str(e) or type(e).__name__} for index, _, _, _ in prepared]
+    return lines
+
+def batch_upload_lines(items: List[BatchSequence]):
+    pool = ThreadPoolExecutor(max_workers=jobs.WORKERS)
+    futures = [pool.submit(prepare_upload, item) for item in items]
+    done = failed = 0
+    try:
+        for first in range(0, len(items), BATCH_COMMIT):
+            lines, prepared = [], []
+            for index in range(first, min(first + BATCH_COMMIT, len(items))):
+                try:
+                    prepared.append((index, *futures[index].result()))
+                except HTTPException as e:
+                    lines.append({"index": index, "error": e.detail})
+            lines += store_uploads(items, prepared)
+            done = first + BATCH_COMMIT
+            for line in sorted(lines, key=lambda line: line["index"]):
+                failed += "error" in line
+                yield json.dumps(line) + "\n"
+        yield json.dumps({"done": True, "count": len(items) - failed, "failed": failed}) + "\n"
+    finally:
+        # the client went away: drop what was written but not stored
+        pool.shutdown(wait=True, cancel_futures=True)
+        storage.remove_files([future.result()[2] for future in futures[done:]
+                              if not future.cancelled() and future.exception() is None and future.result()[2]])
+
+# operations a batch can run; gc and freq come from the stats cache
+BATCH_OPERATIONS = ("gc", "freq", "kmers", "windows", "motif", "compress")
+
+class BatchAnalyze(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH)
+    operations: List[Literal[BATCH_OPERATIONS]] = Field(..., min_length=1)
+    params: dict = {}
+
+@router.post("/batch/analyze")
+def batch_analyze(payload: BatchAnalyze):
+    """
+    Run several operations (gc, freq, kmers, windows, motif, compress) on many stored
+    sequences in one request; `params` maps an operation to the options of its job
+    (see POST /{seq_id}/jobs). Each sequence is read once, with every requested
+    analysis fused into that single pass (gc and freq need no read at all), and ids
+    sharing content are analyzed once. The work is spread over the job worker pool
+    in groups of up to jobs.INLINE_MAX_LENGTH bases; a batch that small in total runs
+    inline. Results stream back as NDJSON, one line per id as its sequence finishes
+    (`results` by operation, or an `error`), ending with a summary line.
+    """
+    operations = {}
+    for name in payload.operations:
+        if name not in ("gc", "freq"):
+            operations[name] = job_params(name, payload.params.get(name, {}))[1]
+    return StreamingResponse(batch_analyze_lines(payload.ids, set(payload.operations), operations),
+                             media_type="application/x-ndjson")
+
+def group_by_size(raws: List[str], lengths: dict, limit: int):
+    """
+    Split `raws` into consecutive groups of at most `limit` bases (a larger sequence is a group of its own).
+    """
+    group, size = [], 0
+    for raw in raws:
+        if group and size + lengths[raw] > limit:
+            yield group
+            group, size = [], 0
+        group.append(raw)
+        size += lengths[raw]
+    if group:
+        yield group
+
+def batch_analyze_lines(ids: List[str], names: set, operations: dict):
+    failed = 0
+    # ids sharing content share a raw file: analyze it once
+    entries = {}
+    for index, seq_id in enumerate(ids):
+        artifacts = storage.resolve(seq_id)
+        seq_stats = stats.get(seq_id, artifacts.raw) if artifacts is not None else None
+        if seq_stats is None or seq_stats.length == 0:
+            failed += 1
+            yield json.dumps({"index": index, "id": seq_id,
+                              "error": NOT_FOUND if seq_stats is None else "Sequence file is empty."}) + "\n"
+            continue
+        entries.setdefault(artifacts.raw, []).append((index, seq_id, seq_stats))
+
+    def lines(raw, result, error):
+        nonlocal failed
+        if error is None and "compress" in operations:
+            try:
+                finish_compress(raw)
+            except tasks.TaskError as e:
+                error = str(e)
+        for index, seq_id, seq_stats in entries[raw]:
+            if error is not None:
+                failed += 1
+                yield json.dumps({"index": index, "id": seq_id, "error": error}) + "\n"
+                continue
+            results = {}
+            if "gc" in names:
+                results["gc"] = gc_summary(seq_stats)
+            if "freq" in names:
+                results["freq"] = freq_summary(seq_stats)
+            for name in operations:
+                results[name] = result[name]
+            yield json.dumps({"index": index, "id": seq_id, "length": seq_stats.length,
+                              "results": results}) + "\n"
+
+    if not operations:
+        for raw in entries:
+            yield from lines(raw, {}, None)
+    else:
+        lengths = {raw: group[0][2].length for raw, group in entries.items()}
+        groups = group_by_size(list(entries), lengths, jobs.INLINE_MAX_LENGTH)
+        calls = ((tuple(group), tasks.analyze_many, (group, operations)) for group in groups)
+        inline = sum(lengths.values()) <= jobs.INLINE_MAX_LENGTH
+        for group, outcomes, error in jobs.run_batch(calls, inline=inline):
+            for raw, (result, item_error) in zip(group, outcomes or [(None, error)] * len(group)):
+                yield from lines(raw, result, item_error)
+    yield json.dumps({"done": True, "count": len(ids) - failed, "failed": failed}) + "\n"
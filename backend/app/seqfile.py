@@ -0,0 +1,407 @@
+"""
+On-disk sequence formats.
+
+`.gv2` is the native format: A/C/G/T packed at 2 bits per base behind a small
+header, with any other symbol (N runs, IUPAC codes) kept in an exception table.
+Files are accessed through `mmap`, so slicing and streaming never load or copy
+the whole sequence.
+
+    header      <4s Q I I>   magic b"GV2\\x01", length, crc32 of the text, exception count
+    payload     ceil(length / 4) bytes, 4 bases per byte, first base in the high bits
+    exceptions  <Q Q B 7x>   start, run length, symbol (one entry per run)
+
+Plain `.txt` files (one ASCII base per byte) are read through the same interface.
+"""
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+from app import metrics
+
+PACKED_EXT = ".gv2"
+TEXT_EXT = ".txt"
+
+MAGIC = b"GV2\x01"
+_HEADER = struct.Struct("<4sQII")
+# one exception table entry, <Q Q B 7x>
+_EXCEPTION = np.dtype({"names": ["start", "run", "symbol"], "formats": ["<u8", "<u8", "u1"],
+                       "offsets": [0, 8, 16], "itemsize": 24})
+
+# default chunk size (in bases) for streaming; a multiple of 4 so chunks align with packed bytes
+CHUNK_SIZE = 1 << 22
+
+BASES = b"ACGT"
+
+# byte value -> 2-bit code; anything that is not A/C/G/T is stored as an exception
+_ENCODE = np.zeros(256, dtype=np.uint8)
+_IS_BASE = np.zeros(256, dtype=bool)
+for _code, _base in enumerate(BASES):
+    _ENCODE[_base] = _code
+    _IS_BASE[_base] = True
+
+_BASES_ARRAY = np.frombuffer(BASES, dtype=np.uint8)
+
+# packed byte -> its four ASCII bases
+_UNPACK = np.array(
+    [[BASES[(b >> shift) & 3] for shift in (6, 4, 2, 0)] for b in range(256)],
+    dtype=np.uint8,
+)
+
+_WHITESPACE = b" \t\r\n"
+
+
+class FormatError(ValueError):
+    pass
+
+
+def pack_bases(data):
+    """
+    Pack ASCII bases at 2 bits per base; non-ACGT symbols pack as A and the last byte is padded with A.
+    """
+    codes = base_codes(data)
+    pad = -len(codes) % 4
+    if pad:
+        codes = np.concatenate((codes, np.zeros(pad, dtype=np.uint8)))
+    codes = codes.reshape(-1, 4)
+    packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | (codes[:, 2] << 2) | codes[:, 3]
+    return packed.astype(np.uint8).tobytes()
+
+
+def unpack_bases(packed, length, exceptions=()):
+    """
+    Inverse of pack_bases: return `length` ASCII bases, overlaying (start, run, symbol) exception runs.
+    """
+    out = _UNPACK[np.frombuffer(packed, dtype=np.uint8)].reshape(-1)[:length]
+    for start, run, symbol in exceptions:
+        out[start:start + run] = symbol
+    return out.tobytes()
+
+
+def base_codes(data):
+    """
+    Map ASCII bases to 2-bit codes (A=0, C=1, G=2, T=3) as a uint8 array; non-ACGT map to 0.
+    """
+    return _ENCODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def base_mask(data):
+    """
+    Boolean array that is True where ASCII `data` holds A, C, G or T.
+    """
+    return _IS_BASE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def codes_to_bases(codes):
+    """
+    Inverse of base_codes for an array of 2-bit codes.
+    """
+    return _BASES_ARRAY[np.asarray(codes, dtype=np.uint8)].tobytes()
+
+
+def exception_table(data, offset=0):
+    """
+    The runs of non-ACGT symbols in ASCII `data` as a structured array of
+    (start, run, symbol) entries, laid out like the `.gv2` exception table.
+    """
+    arr = np.frombuffer(data, dtype=np.uint8)
+    idx = np.flatnonzero(~_IS_BASE[arr])
+    if idx.size == 0:
+        return np.zeros(0, dtype=_EXCEPTION)
+    symbols = arr[idx]
+    # a new run starts wherever positions stop being consecutive or the symbol changes
+    breaks = np.flatnonzero((np.diff(idx) != 1) | (np.diff(symbols) != 0)) + 1
+    run_starts = np.concatenate(([0], breaks))
+    run_ends = np.concatenate((breaks, [idx.size]))
+    table = np.zeros(run_starts.size, dtype=_EXCEPTION)
+    table["start"] = idx[run_starts] + offset
+    table["run"] = run_ends - run_starts
+    table["symbol"] = symbols[run_starts]
+    return table
+
+
+def exception_runs(data, offset=0):
+    """
+    Return (start, run, symbol) for every run of non-ACGT symbols in ASCII `data`.
+    """
+    table = exception_table(data, offset)
+    return list(zip(table["start"].tolist(), table["run"].tolist(), table["symbol"].tolist()))
+
+
+def byte_histogram(data, hist=None):
+    """
+    Add the byte-value histogram of ASCII `data` to `hist` (256 int64 counters, created if None).
+    """
+    if hist is None:
+        hist = np.zeros(256, dtype=np.int64)
+    hist += np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    return hist
+
+
+def histogram_counts(hist):
+    """
+    Turn a byte histogram (or None, for no data) into {symbol: count}, always including A, C, G and T.
+    """
+    totals = {chr(b): 0 for b in BASES}
+    return _merge_counts(totals, hist) if hist is not None else totals
+
+
+def _map(f):
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        return None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _merge_counts(totals, hist):
+    for value in np.flatnonzero(hist):
+        symbol = chr(value)
+        totals[symbol] = totals.get(symbol, 0) + int(hist[value])
+    return totals
+
+
+class PackedSequence:
+    """
+    Read-only, memory-mapped view of a `.gv2` file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = _map(self._file)
+        if self._mm is None or len(self._mm) < _HEADER.size:
+            self.close()
+            raise FormatError(f"{path}: truncated header")
+        magic, self.length, self.crc32, n_exceptions = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise FormatError(f"{path}: not a {PACKED_EXT} file")
+        self._nbytes = (self.length + 3) // 4
+        table_offset = _HEADER.size + self._nbytes
+        if len(self._mm) < table_offset + n_exceptions * _EXCEPTION.itemsize:
+            self.close()
+            raise FormatError(f"{path}: truncated")
+        self._payload = np.frombuffer(self._mm, dtype=np.uint8, count=self._nbytes, offset=_HEADER.size)
+        table = np.frombuffer(self._mm, dtype=_EXCEPTION, count=n_exceptions, offset=table_offset)
+        # copied out, so no view of the table keeps the map alive
+        self._exc_starts = table["start"].astype(np.int64)
+        self._exc_ends = self._exc_starts + table["run"].astype(np.int64)
+        self._exc_symbols = table["symbol"].copy()
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._payload = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # a numpy view is still alive somewhere; the map is released with it
+                pass
+            self._mm = None
+        self._file.close()
+
+    def slice(self, start, end):
+        """
+        Return bases [start, end) as uppercase ASCII bytes.
+        """
+        start = max(0, start)
+        end = min(self.length, end)
+        if start >= end:
+            return b""
+        first = start // 4
+        out = _UNPACK[self._payload[first:(end + 3) // 4]].reshape(-1)
+        out = out[start - 4 * first:end - 4 * first]
+        # overlay exception runs that overlap the window
+        lo = np.searchsorted(self._exc_ends, start, side="right")
+        hi = np.searchsorted(self._exc_starts, end, side="left")
+        if hi > lo:
+            a = np.maximum(self._exc_starts[lo:hi], start) - start
+            b = np.minimum(self._exc_ends[lo:hi], end) - start
+            runs = b - a
+            # covered positions, run after run: the k-th is k shifted by its run's start minus the positions before that run
+            firsts = np.repeat(a - np.cumsum(runs) + runs, runs)
+            out[firsts + np.arange(int(runs.sum()))] = np.repeat(self._exc_symbols[lo:hi], runs)
+        metrics.BYTES_READ.inc(end - start, source="sequence")
+        return out.tobytes()
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        for offset in range(start, end, chunk_size):
+            yield self.slice(offset, min(offset + chunk_size, end))
+
+    def read_text(self):
+        return self.slice(0, self.length).decode("ascii")
+
+    def verify(self):
+        crc = 0
+        for chunk in self.iter_chunks():
+            crc = zlib.crc32(chunk, crc)
+        return crc == self.crc32
+
+
+class TextSequence:
+    """
+    Memory-mapped view of a plain `.txt` sequence with the same interface as PackedSequence.
+    Trailing whitespace is ignored and bases are uppercased as they are read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = _map(self._file)
+        length = len(self._mm) if self._mm is not None else 0
+        while length and self._mm[length - 1] in _WHITESPACE:
+            length -= 1
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def slice(self, start, end):
+        start = max(0, start)
+        end = min(self.length, end)
+        if start >= end:
+            return b""
+        metrics.BYTES_READ.inc(end - start, source="sequence")
+        return self._mm[start:end].upper()
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        for offset in range(start, end, chunk_size):
+            yield self.slice(offset, min(offset + chunk_size, end))
+
+    def read_text(self):
+        return self.slice(0, self.length).decode("ascii")
+
+
+def open_sequence(path):
+    """
+    Open a stored sequence (`.gv2` or `.txt`) for reading.
+    """
+    if path.endswith(PACKED_EXT):
+        return PackedSequence(path)
+    return TextSequence(path)
+
+
+class PackedWriter:
+    """
+    Incrementally write a `.gv2` file from chunks of ASCII bases. Exception runs are
+    spilled to a temporary file next to it until the payload is complete, so memory
+    stays bounded however many runs there are.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(b"\0" * _HEADER.size)
+        self._pending = b""
+        self._spill = None
+        self._spilled = 0
+        # the last run, which the next chunk may extend
+        self._last_run = np.zeros(0, dtype=_EXCEPTION)
+        self.length = 0
+        self.crc32 = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        """
+        Stop writing without finalizing the header; the caller removes the file.
+        """
+        if self._spill is not None:
+            self._spill.close()
+        self._file.close()
+
+    def _record_exceptions(self, chunk):
+        table = exception_table(chunk, self.length)
+        if table.size == 0:
+            return
+        last = self._last_run
+        if last.size and last["start"][0] + last["run"][0] == table["start"][0] \
+                and last["symbol"][0] == table["symbol"][0]:
+            table["start"][0] = last["start"][0]
+            table["run"][0] += last["run"][0]
+        elif last.size:
+            # concatenating drops the padding, so cast back to the on-disk layout
+            table = np.concatenate((last, table)).astype(_EXCEPTION)
+        if table.size > 1:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.path)))
+            self._spill.write(table[:-1].tobytes())
+            self._spilled += table.size - 1
+        self._last_run = table[-1:].copy()
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        chunk = chunk.upper()
+        self.crc32 = zlib.crc32(chunk, self.crc32)
+        self._record_exceptions(chunk)
+        self.length += len(chunk)
+        data = self._pending + chunk
+        usable = len(data) - len(data) % 4
+        if usable:
+            self._file.write(pack_bases(data[:usable]))
+        self._pending = data[usable:]
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._pending:
+            self._file.write(pack_bases(self._pending))
+            self._pending = b""
+        if self._spill is not None:
+            self._spill.seek(0)
+            shutil.copyfileobj(self._spill, self._file, 1 << 20)
+            self._spill.close()
+        self._file.write(self._last_run.tobytes())
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, self.length, self.crc32, self._spilled + self._last_run.size))
+        # on disk before the caller renames it into place
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+def write_packed(path, chunks):
+    """
+    Write an iterable of ASCII chunks (or a single bytes object) to `path` as `.gv2`.
+    Returns the number of bases written.
+    """
+    if isinstance(chunks, (bytes, bytearray)):
+        chunks = [chunks]
+    with PackedWriter(path) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    return writer.length
@@ -0,0 +1,135 @@
+"""
+MinHash sketches for corpus-wide similarity search.
+
+Every sequence gets a one-permutation MinHash signature of its canonical k-mers,
+computed in the same pass that writes or scans it: k-mer hashes are split into
+BINS bins by their top bits and each bin keeps its smallest hash. Two signatures
+estimate the Jaccard similarity of the sequences' k-mer sets as the fraction of
+bins holding the same value, and from it the average nucleotide identity with
+the Mash distance. The catalog stores each signature (8 * BINS bytes) and its
+LSH buckets: BANDS bands of ROWS bins each, hashed into one bucket key per band,
+so candidates are the sequences sharing at least one bucket rather than the
+whole corpus. Pairs with a Jaccard similarity of J share a bucket with
+probability 1 - (1 - J**ROWS)**BANDS (about 40% at J = 0.3 and 98% at J = 0.5).
+"""
+import hashlib
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from app import analysis, seqfile
+
+# k-mer size (as in Mash); canonical k-mers, so both strands sketch alike
+K = 21
+
+BINS = 256
+BANDS = 64
+ROWS = BINS // BANDS
+
+_BIN_BITS = int(math.log2(BINS))
+_VALUE_MASK = np.uint64((1 << (64 - _BIN_BITS)) - 1)
+
+# value of a bin no k-mer hashed into
+EMPTY = np.uint64(np.iinfo(np.uint64).max)
+
+Sketch = namedtuple("Sketch", ["kmers", "signature"])
+
+
+def _mix(x):
+    # splitmix64 finalizer: a fast, well-spread 64-bit hash of the k-mer codes
+    x = x ^ (x >> np.uint64(30))
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+class Sketcher:
+    """
+    Build a sketch from consecutive chunks of a sequence (`update`, then `sketch`).
+    """
+
+    def __init__(self):
+        self._signature = np.full(BINS, EMPTY, dtype=np.uint64)
+        self._kmers = 0
+        self._tail = b""
+
+    def update(self, data):
+        if not data:
+            return
+        data = self._tail + data
+        codes = analysis.canonical_kmer_codes(seqfile.base_codes(data), seqfile.base_mask(data), K)
+        # k-mers ending in the previous chunk were counted there: keep the last k - 1 bases
+        self._tail = data[max(len(data) - K + 1, 0):]
+        if len(codes) == 0:
+            return
+        hashes = _mix(codes)
+        np.minimum.at(self._signature, (hashes >> np.uint64(64 - _BIN_BITS)).astype(np.intp),
+                      hashes & _VALUE_MASK)
+        self._kmers += len(codes)
+
+    def sketch(self):
+        return Sketch(self._kmers, self._signature.copy())
+
+
+def sketch_chunks(chunks):
+    sketcher = Sketcher()
+    for chunk in chunks:
+        sketcher.update(chunk)
+    return sketcher.sketch()
+
+
+def to_bytes(signature):
+    return signature.astype("<u8").tobytes()
+
+
+def from_bytes(blob):
+    return np.frombuffer(blob, dtype="<u8").astype(np.uint64)
+
+
+def buckets(signature):
+    """
+    LSH bucket keys (signed 64-bit, for SQLite) of a signature; bands of empty bins are skipped.
+    """
+    keys = []
+    for band, rows in enumerate(signature.reshape(BANDS, ROWS)):
+        if (rows == EMPTY).all():
+            continue
+        digest = hashlib.blake2b(band.to_bytes(2, "little") + to_bytes(rows), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+def jaccard(signature, others):
+    """
+    Estimated Jaccard similarity of `signature` with every row of `others` (n x BINS):
+    equal non-empty bins over the bins not empty in both.
+    """
+    filled = signature != EMPTY
+    other_filled = others != EMPTY
+    same = ((others == signature) & filled).sum(axis=1)
+    used = (filled | other_filled).sum(axis=1)
+    return np.divide(same, used, out=np.zeros(len(others)), where=used > 0)
+
+
+def ani(jaccard, k=K):
+    """
+    Average nucleotide identity from a Jaccard estimate (1 - Mash distance); None for J = 0.
+    """
+    if jaccard <= 0:
+        return None
+    return 1 + math.log(2 * jaccard / (1 + jaccard)) / k
+
+
+def rank(signature, candidates, top):
+    """
+    The `top` candidates most similar to `signature`, best first, as (key, kmers, jaccard);
+    `candidates` are (key, kmers, signature) tuples. Candidates sharing no bin are dropped.
+    """
+    if not candidates:
+        return []
+    scores = jaccard(signature, np.stack([c[2] for c in candidates]))
+    order = sorted(range(len(candidates)), key=lambda i: (-scores[i], candidates[i][0]))
+    return [(candidates[i][0], candidates[i][1], float(scores[i])) for i in order[:top] if scores[i] > 0]
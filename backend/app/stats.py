@@ -0,0 +1,68 @@
+"""
+Per-sequence statistics cache.
+
+Symbol counts (and from them GC and N counts) are computed in the same pass
+that writes or scans a sequence and stored in the catalog keyed by content hash.
+A bounded in-memory LRU sits in front of the catalog, so repeat analysis calls
+are a dictionary lookup plus the stat `storage.resolve` already does; no
+sequence data is read. Write paths call `invalidate`; entries are also checked
+against the raw file they were computed from (files are never rewritten in place,
+an update points the id at another file), so updates by another worker are picked up.
+"""
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from app import catalog, metrics
+from app.config import DATA_DIR
+
+# number of sequences whose stats are kept in memory
+CACHE_SIZE = int(os.environ.get("GENOVISTA_STATS_CACHE", "4096"))
+
+Stats = namedtuple("Stats", ["content_hash", "length", "counts", "raw"])
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def gc_count(stats):
+    return stats.counts.get("G", 0) + stats.counts.get("C", 0)
+
+
+def n_count(stats):
+    return stats.counts.get("N", 0)
+
+
+def get(seq_id, raw):
+    """
+    Return the Stats of `seq_id`, whose raw file is `raw`.
+    Served from memory when cached, else from the catalog; the file itself is
+    only scanned for entries catalogued before stats were kept.
+    """
+    with _lock:
+        stats = _cache.get(seq_id)
+        if stats is not None and stats.raw == raw:
+            _cache.move_to_end(seq_id)
+            metrics.CACHE_LOOKUPS.inc(cache="stats", result="hit")
+            return stats
+    row = catalog.get_stats(seq_id)
+    if row is None or row["counts"] is None or row["filename"] != os.path.relpath(raw, DATA_DIR):
+        row = catalog.scan_stats(seq_id, raw)
+        metrics.CACHE_LOOKUPS.inc(cache="stats", result="miss")
+    else:
+        metrics.CACHE_LOOKUPS.inc(cache="stats", result="catalog")
+    stats = Stats(row["content_hash"], row["length"], row["counts"], raw)
+    with _lock:
+        _cache[seq_id] = stats
+        _cache.move_to_end(seq_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return stats
+
+
+def invalidate(seq_id):
+    """
+    Drop the cached stats of `seq_id` after its content changed or it was deleted.
+    """
+    with _lock:
+        _cache.pop(seq_id, None)
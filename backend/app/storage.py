@@ -0,0 +1,500 @@
+"""
+Sequence storage and id resolution.
+
+New sequences are stored in the packed `.gv2` format (see `app/seqfile.py`) as
+content-addressed blobs: `data/blobs/ab/cd/<sha256>.gv2`, named after the content
+hash, with the compressed artifact and motif index next to it. Ids are references
+(catalog rows pointing at a blob), so identical uploads share one blob and one
+compressed artifact. Blobs are written to a temporary file, fsynced and renamed
+into place, and never modified afterwards; updating an id points it at another
+blob. Placing a blob and adding its reference happen inside one catalog
+transaction. A blob that lost its last reference is deleted only after that
+transaction committed and the in-memory index moved on, under a fresh reference
+check, so concurrent writers cannot delete a blob that is being shared and new
+readers never get the old path. A reader that resolved the old path just before
+opening it sees FileNotFoundError and resolves again (see `retry_if_replaced` in
+the sequences router). Remove leftovers of crashed writers with:
+
+    python -m app.storage gc
+
+gc keeps every blob named by a catalog row or a reference file (see `app/catalog.py`),
+and refuses to run on an empty or freshly rebuilt catalog unless forced.
+
+Sequences stored per id by earlier versions (sharded `data/ab/cd/abcd1234.gv2`,
+flat `id.txt`, legacy `id_*.txt`) keep resolving. Move them into the blob store
+(sharing identical content) with `python -m app.storage dedupe`, convert `.txt`
+files to `.gv2` in shards with `python -m app.storage migrate`, or only move them
+into shards, unchanged, with `python -m app.storage reshard`.
+
+Ids are mapped to their raw and compressed (.gvz or legacy .gz) artifacts through
+an in-memory index, populated from the catalog on cold start and kept current by
+the write paths, so no request has to scan the data folder.
+"""
+import argparse
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from app import catalog, compression, fmindex, seqfile
+from app.config import BLOB_DIR, DATA_DIR
+
+# number of two-character directory levels used for per-id sequences (0 = flat)
+SHARD_DEPTH = int(os.environ.get("GENOVISTA_SHARD_DEPTH", "2"))
+
+# temporary files older than this (seconds) are left over by crashed writers
+STALE_TMP_AGE = 3600
+
+Artifacts = namedtuple("Artifacts", ["raw", "compressed"])
+
+
+class GarbageCollectionRefused(Exception):
+    pass
+
+
+_index = {}
+_lock = threading.Lock()
+_loaded = False
+
+
+def new_id():
+    """
+    Generate a fresh sequence id.
+    """
+    return str(uuid.uuid4())[:8]
+
+
+def shard_dir(seq_id):
+    """
+    Directory that holds `seq_id` in the sharded layout.
+    """
+    if len(seq_id) < 2 * SHARD_DEPTH:
+        return DATA_DIR
+    parts = [seq_id[2 * i:2 * i + 2] for i in range(SHARD_DEPTH)]
+    return os.path.join(DATA_DIR, *parts)
+
+
+def raw_path_for(seq_id, create=True, ext=seqfile.PACKED_EXT):
+    """
+    Canonical path of the raw file for `seq_id`; creates the shard directory by default.
+    """
+    directory = shard_dir(seq_id)
+    if create:
+        os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{seq_id}{ext}")
+
+
+def blob_path(digest, create=True):
+    """
+    Path of the blob holding the content with sha256 `digest`; creates its directory by default.
+    """
+    directory = os.path.join(BLOB_DIR, digest[:2], digest[2:4])
+    if create:
+        os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, digest + seqfile.PACKED_EXT)
+
+
+def is_blob(path):
+    blobs = os.path.abspath(BLOB_DIR)
+    return os.path.commonpath([os.path.abspath(path), blobs]) == blobs
+
+
+def _fsync_dir(directory):
+    # make a rename durable; directories cannot be opened on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def new_tmp():
+    """
+    Fresh temporary path inside the blob store (same file system, so it can be renamed into place).
+    """
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    return os.path.join(BLOB_DIR, f"{uuid.uuid4().hex}.gv2.tmp")
+
+
+def write_blob(data, digest):
+    """
+    Write an in-memory sequence to a temporary `.gv2` file for `store`; returns its
+    path, or None when a blob with this content already exists.
+    """
+    if os.path.exists(blob_path(digest, create=False)):
+        return None
+    tmp = new_tmp()
+    try:
+        seqfile.write_packed(tmp, data)
+    except BaseException:
+        remove_files([tmp])
+        raise
+    return tmp
+
+
+def store(seq_id, summary, tmp=None, data=None, name=None, mtime=None):
+    """
+    Point `seq_id` at the blob of its content and record it in the catalog. `summary`
+    is the catalog summary of the content; `tmp` a finished temporary `.gv2` file
+    (see `new_tmp`, `write_blob`) or None, in which case `data` is written if the blob
+    does not exist yet. When the blob exists, identical content is already stored
+    and `tmp` is simply dropped. A blob the id referenced before is deleted once no
+    id references it, after the (outermost) transaction commits. `mtime` is the
+    write time recorded for the id (default: now). Returns the blob path.
+    """
+    blob = blob_path(summary[2])
+    with catalog.transaction():
+        row = catalog.get(seq_id)
+        if os.path.exists(blob):
+            remove_files([tmp] if tmp else [])
+        else:
+            if tmp is None:
+                tmp = write_blob(data, summary[2])
+            os.replace(tmp, blob)
+            _fsync_dir(os.path.dirname(blob))
+        compressed = _artifacts(blob).compressed
+        catalog.record(seq_id, blob, compressed=compressed is not None, name=name, summary=summary, mtime=mtime)
+        catalog.after_commit(lambda: remember(seq_id, blob, compressed))
+        if row is not None:
+            previous = os.path.join(DATA_DIR, row["filename"])
+            if previous != blob:
+                catalog.after_commit(lambda: release(previous))
+    return blob
+
+
+def release(raw):
+    """
+    Delete the raw file `raw` and its derived files if no id references it any more.
+    Runs inside a catalog transaction (the caller's, or its own); write paths call it
+    through `catalog.after_commit`, once readers no longer resolve to `raw`.
+    """
+    with catalog.transaction():
+        if catalog.references(raw) == 0:
+            remove_files([raw] + derived_paths(raw))
+            return True
+    return False
+
+
+def delete(seq_id, raw):
+    """
+    Remove `seq_id` (stored at `raw`) from the catalog and delete its file if that was
+    its last reference.
+    """
+    with catalog.transaction():
+        row = catalog.get(seq_id)
+        if row is not None:
+            # the id may have been updated since `raw` was resolved
+            raw = os.path.join(DATA_DIR, row["filename"])
+        catalog.remove(seq_id)
+        catalog.after_commit(lambda: forget(seq_id))
+        catalog.after_commit(lambda: release(raw))
+
+
+def compressed_path(raw):
+    """
+    Path of the compressed artifact written for a raw file (`id.gv2` -> `id.gvz`).
+    """
+    return os.path.splitext(raw)[0] + compression.COMPRESSED_EXT
+
+
+def compressed_candidates(raw):
+    """
+    Every compressed artifact a raw file may have: the current container and the legacy `id.txt.gz`.
+    """
+    return [compressed_path(raw), os.path.splitext(raw)[0] + seqfile.TEXT_EXT + ".gz"]
+
+
+def index_path(raw):
+    """
+    Path of the motif index built for a raw file (`id.gv2` -> `id.gvi`).
+    """
+    return os.path.splitext(raw)[0] + fmindex.INDEX_EXT
+
+
+def derived_paths(raw):
+    """
+    Every file derived from a raw file's content: compressed artifacts and the motif index.
+    """
+    return compressed_candidates(raw) + [index_path(raw)]
+
+
+def _artifacts(raw):
+    for compressed in compressed_candidates(raw):
+        if os.path.exists(compressed):
+            return Artifacts(raw, compressed)
+    return Artifacts(raw, None)
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _ensure_loaded():
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        for seq_id, filename, compressed in catalog.entries():
+            raw = os.path.join(DATA_DIR, filename)
+            _index[seq_id] = Artifacts(raw, compressed_path(raw) if compressed else None)
+        _loaded = True
+
+
+def _lookup(seq_id):
+    """
+    Slow path for ids missing from (or stale in) the index: catalog row, then canonical locations.
+    Each candidate costs a single stat, never a directory scan.
+    """
+    candidates = []
+    row = catalog.get(seq_id)
+    if row:
+        candidates.append(os.path.join(DATA_DIR, row["filename"]))
+    candidates.append(raw_path_for(seq_id, create=False))
+    candidates.append(raw_path_for(seq_id, create=False, ext=seqfile.TEXT_EXT))
+    candidates.append(os.path.join(DATA_DIR, f"{seq_id}{seqfile.TEXT_EXT}"))
+    for raw in candidates:
+        if os.path.exists(raw):
+            return _artifacts(raw)
+    return None
+
+
+def resolve(seq_id):
+    """
+    Return the Artifacts for `seq_id`, or None if no raw sequence exists.
+    """
+    _ensure_loaded()
+    with _lock:
+        artifacts = _index.get(seq_id)
+    if artifacts is not None and os.path.exists(artifacts.raw):
+        return artifacts
+    # unknown or stale (e.g. written by another worker): fall back to O(1) lookups
+    artifacts = _lookup(seq_id)
+    with _lock:
+        if artifacts is None:
+            _index.pop(seq_id, None)
+        else:
+            _index[seq_id] = artifacts
+    return artifacts
+
+
+def refresh(seq_id):
+    """
+    Re-stat the artifacts of `seq_id` and update the index.
+    """
+    with _lock:
+        _index.pop(seq_id, None)
+    return resolve(seq_id)
+
+
+def remember(seq_id, raw, compressed=None):
+    """
+    Record the current artifacts of `seq_id` after a write.
+    """
+    _ensure_loaded()
+    with _lock:
+        _index[seq_id] = Artifacts(raw, compressed)
+
+
+def mark_compressed(raw):
+    """
+    Record the compressed artifact just written for the raw file `raw` for every id
+    stored there. Compression runs without holding the catalog lock, so the sequence
+    may have been replaced or deleted meanwhile: when no id references `raw` any more,
+    the artifact is dropped and False is returned.
+    """
+    compressed = compressed_path(raw)
+    with catalog.transaction():
+        ids = catalog.ids_at(raw)
+        if not ids:
+            remove_files([compressed])
+            return False
+        # drop a legacy gzip artifact so the file keeps a single compressed artifact
+        remove_files(compressed_candidates(raw)[1:])
+        catalog.set_compressed(raw, True)
+        _ensure_loaded()
+        with _lock:
+            for seq_id in ids:
+                _index[seq_id] = Artifacts(raw, compressed)
+    return True
+
+
+def forget(seq_id):
+    """
+    Drop `seq_id` from the index after a delete.
+    """
+    with _lock:
+        _index.pop(seq_id, None)
+
+
+def _move(seq_id, old_raw, new_raw, compressed):
+    for old, new in zip(compressed_candidates(old_raw), compressed_candidates(new_raw)):
+        if os.path.exists(old):
+            os.replace(old, new)
+    # the index is rebuilt on demand at the new location
+    remove_files([index_path(old_raw)])
+    # moving a file is not a write of the id
+    catalog.record(seq_id, new_raw, compressed=compressed, mtime=catalog.get(seq_id)["mtime"])
+
+
+def reshard():
+    """
+    Move flat and legacy files into the sharded layout, keeping their format.
+    Returns the number of sequences moved.
+    """
+    moved = 0
+    for seq_id, filename, compressed in list(catalog.entries()):
+        old_raw = os.path.join(DATA_DIR, filename)
+        new_raw = raw_path_for(seq_id, ext=os.path.splitext(old_raw)[1])
+        if is_blob(old_raw) or old_raw == new_raw or not os.path.exists(old_raw):
+            continue
+        os.replace(old_raw, new_raw)
+        _move(seq_id, old_raw, new_raw, compressed)
+        moved += 1
+    with _lock:
+        _index.clear()
+    return moved
+
+
+def migrate():
+    """
+    Convert every `.txt` sequence to `.gv2` in the sharded layout, verifying each
+    file's checksum before removing the original. Returns the number converted.
+    """
+    converted = 0
+    for seq_id, filename, compressed in list(catalog.entries()):
+        old_raw = os.path.join(DATA_DIR, filename)
+        if not old_raw.endswith(seqfile.TEXT_EXT) or not os.path.exists(old_raw):
+            continue
+        new_raw = raw_path_for(seq_id)
+        tmp = new_raw + ".tmp"
+        with seqfile.open_sequence(old_raw) as text:
+            seqfile.write_packed(tmp, text.iter_chunks())
+        with seqfile.PackedSequence(tmp) as packed:
+            if not packed.verify():
+                raise seqfile.FormatError(f"{tmp}: checksum mismatch after conversion")
+        os.replace(tmp, new_raw)
+        os.remove(old_raw)
+        _move(seq_id, old_raw, new_raw, compressed)
+        converted += 1
+    with _lock:
+        _index.clear()
+    return converted
+
+
+def dedupe():
+    """
+    Move every per-id sequence into the blob store, so ids with identical content
+    share one blob; `.txt` files are converted to `.gv2` (checksum-verified) on the
+    way and a compressed artifact, `.gvz` or legacy `.txt.gz`, moves along unless the
+    blob already has one. Returns the number of ids moved.
+    """
+    moved = 0
+    for seq_id, filename, _ in list(catalog.entries()):
+        old_raw = os.path.join(DATA_DIR, filename)
+        if is_blob(old_raw) or not os.path.exists(old_raw):
+            continue
+        summary = catalog.scan_file(old_raw)
+        blob = blob_path(summary[2])
+        tmp = None
+        if not os.path.exists(blob):
+            tmp = new_tmp()
+            with seqfile.open_sequence(old_raw) as stored:
+                seqfile.write_packed(tmp, stored.iter_chunks())
+            with seqfile.PackedSequence(tmp) as packed:
+                if not packed.verify():
+                    remove_files([tmp])
+                    raise seqfile.FormatError(f"{tmp}: checksum mismatch after conversion")
+        if _artifacts(blob).compressed is None:
+            for old, new in zip(compressed_candidates(old_raw), compressed_candidates(blob)):
+                if os.path.exists(old):
+                    os.replace(old, new)
+                    break
+        store(seq_id, summary, tmp=tmp, mtime=catalog.get(seq_id)["mtime"])
+        moved += 1
+    with _lock:
+        _index.clear()
+    return moved
+
+
+def collect_garbage(min_age=STALE_TMP_AGE, force=False):
+    """
+    Delete blobs no id references (with their derived files), derived files whose
+    blob is gone, and temporary files older than `min_age` seconds. A blob counts
+    as referenced while a catalog row or a reference file names it. Unless `force`,
+    raises GarbageCollectionRefused when the catalog is empty or was rebuilt less
+    than `min_age` seconds ago, since a catalog that lost its rows would otherwise
+    take every blob with it. Returns the number of files removed.
+    """
+    now = time.time()
+    if not force:
+        if catalog.count() == 0:
+            raise GarbageCollectionRefused("The catalog is empty; rebuild it or pass force.")
+        rebuilt = catalog.rebuilt_at()
+        if rebuilt is not None and now - rebuilt < min_age:
+            raise GarbageCollectionRefused("The catalog was just rebuilt; check it or pass force.")
+    referenced = {os.path.normpath(filename) for _, filename, _, _ in catalog.refs()}
+    removed = 0
+    for root, _, files in os.walk(BLOB_DIR):
+        for file in files:
+            path = os.path.join(root, file)
+            if file.endswith(".tmp"):
+                try:
+                    stale = now - os.path.getmtime(path) > min_age
+                except FileNotFoundError:
+                    continue
+                if stale:
+                    remove_files([path])
+                    removed += 1
+            elif file.endswith(seqfile.PACKED_EXT):
+                if os.path.relpath(path, DATA_DIR) not in referenced and release(path):
+                    removed += 1
+            else:
+                raw = os.path.join(root, file.split(".", 1)[0] + seqfile.PACKED_EXT)
+                with catalog.transaction():
+                    if not os.path.exists(raw) and os.path.exists(path):
+                        remove_files([path])
+                        removed += 1
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the GENOVISTA on-disk layout.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("reshard", help="move flat and legacy sequence files into shard directories")
+    sub.add_parser("migrate", help="convert .txt sequences to the packed .gv2 format")
+    sub.add_parser("dedupe", help="move per-id sequences into the content-addressed blob store")
+    gc = sub.add_parser("gc", help="delete unreferenced blobs and stale temporary files")
+    gc.add_argument("--force", action="store_true", help="run even on an empty or just rebuilt catalog")
+    args = parser.parse_args(argv)
+    catalog.init()
+    if args.command == "reshard":
+        count = reshard()
+        print(f"Moved {count} sequences into {SHARD_DEPTH}-level shards")
+    elif args.command == "migrate":
+        count = migrate()
+        print(f"Converted {count} sequences to {seqfile.PACKED_EXT}")
+    elif args.command == "dedupe":
+        count = dedupe()
+        print(f"Moved {count} sequences into {os.path.abspath(BLOB_DIR)}")
+    elif args.command == "gc":
+        try:
+            count = collect_garbage(force=args.force)
+        except GarbageCollectionRefused as e:
+            raise SystemExit(f"Refused: {e}")
+        print(f"Removed {count} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+CPU-heavy sequence tasks.
+
+Plain functions of file paths and parameters that return JSON-ready dicts, so the
+same code serves the synchronous endpoints and background jobs (see `app/jobs.py`),
+where they run in worker processes. Each takes a trailing `progress` (None when
+run inline) and reads sequences through `jobs.track`, so jobs report progress and
+can be cancelled between chunks. Invalid input raises TaskError. `analyze` runs
+several analyses (and compression) in a single pass over a sequence.
+"""
+import os
+import time
+import uuid
+import zlib
+
+from app import analysis, compression, fmindex, jobs, motif, seqfile, storage
+
+EMPTY = "Sequence file is empty."
+
+
+class TaskError(ValueError):
+    pass
+
+
+def mb_per_s(num_bytes, seconds):
+    return round(num_bytes / 1e6 / max(seconds, 1e-9), 3)
+
+
+def _open(raw, progress, passes=1):
+    stored = jobs.track(seqfile.open_sequence(raw), progress, passes)
+    if len(stored) == 0:
+        stored.close()
+        raise TaskError(EMPTY)
+    return stored
+
+
+def _compressed_tmp(raw):
+    compressed_file = storage.compressed_path(raw)
+    return compressed_file, f"{compressed_file}.{uuid.uuid4().hex[:8]}.tmp"
+
+
+def compress(raw, codec=compression.DEFAULT_CODEC, block_size=compression.BLOCK_SIZE, progress=None):
+    """
+    Compress a stored sequence into its `.gvz` artifact. The container is written to a
+    temporary file first, so a failed or cancelled run never leaves a partial artifact.
+    """
+    compressed_file, tmp = _compressed_tmp(raw)
+    started = time.perf_counter()
+    with _open(raw, progress) as stored:
+        try:
+            original_size = compression.compress_file(tmp, stored.iter_chunks(), codec, block_size)
+            os.replace(tmp, compressed_file)
+        except BaseException:
+            storage.remove_files([tmp])
+            raise
+    elapsed = time.perf_counter() - started
+    return _compress_result(compressed_file, codec, block_size, original_size, elapsed)
+
+
+def _compress_result(compressed_file, codec, block_size, original_size, elapsed):
+    compressed_size = os.path.getsize(compressed_file)
+    return {
+        "codec": codec,
+        "block_size": block_size,
+        "original_size_bytes": original_size,
+        "compressed_size_bytes": compressed_size,
+        "compression_ratio": round(compressed_size / original_size, 3),
+        "bits_per_base": round(compressed_size * 8 / original_size, 3),
+        "compress_mb_per_s": mb_per_s(original_size, elapsed),
+        "compressed_file": os.path.basename(compressed_file),
+    }
+
+
+def decompress(compressed_file, raw, verify=True, progress=None):
+    """
+    Decompress a `.gvz` artifact (codec detected from its header), verifying every
+    block against its checksum and the stored original. With verify=False only the
+    first block is decompressed, for the preview.
+    """
+    started = time.perf_counter()
+    lossless = False
+    decompressed = None
+    with compression.open_compressed(compressed_file) as reader:
+        codec = reader.codec
+        length = reader.length
+        preview = reader.read_region(0, 101).decode("ascii")
+        if verify or length is None:
+            lossless, decompressed = verify_blocks(reader, raw, progress)
+            length = decompressed
+    elapsed = time.perf_counter() - started
+
+    return {
+        "sequence_preview": preview[:100] + ("..." if length > 100 else ""),
+        "length": length,
+        "codec": codec,
+        "decompress_mb_per_s": mb_per_s(decompressed, elapsed) if decompressed is not None else None,
+        "lossless_verification": lossless,
+    }
+
+
+def verify_blocks(reader, original_file, progress=None):
+    """
+    Stream the compressed blocks, checking each against its stored checksum and
+    against the matching slice of the original. Returns (lossless, decompressed length).
+    """
+    stored = None
+    if os.path.exists(original_file):
+        stored = jobs.track(seqfile.open_sequence(original_file), progress)
+    lossless = stored is not None
+    offset = 0
+    try:
+        for text, crc in reader.iter_blocks():
+            block_crc = zlib.crc32(text)
+            if crc is not None and crc != block_crc:
+                lossless = False
+            if lossless and zlib.crc32(stored.slice(offset, offset + len(text))) != block_crc:
+                lossless = False
+            offset += len(text)
+        if stored is not None:
+            lossless = lossless and offset == len(stored)
+    finally:
+        if stored is not None:
+            stored.close()
+    return lossless, offset
+
+
+def kmers(raw, k=6, top=20, progress=None):
+    """
+    K-mer spectrum of a stored sequence (see `analysis.kmer_summary`).
+    """
+    with _open(raw, progress) as stored:
+        totals = analysis.kmer_counts(stored, k)
+    return analysis.kmer_summary(totals, k, top)
+
+
+def windows(raw, window=1000, step=None, max_points=1000, progress=None):
+    """
+    Sliding-window profile plus whole-sequence CpG observed/expected.
+    """
+    # the profile and the CpG summary each read the sequence once
+    with _open(raw, progress, passes=2) as stored:
+        profile = analysis.window_profile(stored, window, step or window, max_points)
+        cpg = analysis.cpg_summary(stored)
+        length = len(stored)
+    return {"length": length, **profile, "cpg": cpg}
+
+
+def build_index(raw, index_file, progress=None):
+    """
+    Build the FM-index of a stored sequence and write it to `index_file` (see `fmindex.build`).
+    """
+    started = time.perf_counter()
+    with _open(raw, progress) as stored:
+        length = len(stored)
+        try:
+            fmindex.build(stored, index_file)
+        except ValueError as e:
+            raise TaskError(str(e))
+    return {
+        "length": length,
+        "index_size_bytes": os.path.getsize(index_file),
+        "build_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def motif_scan(raw, pattern, options, limit=1000, start=0, progress=None):
+    """
+    Scan a sequence for a motif from `start` to the end (`options` are the keyword arguments
+    of `motif.scanner`): the total number of matches and the first `limit` of them.
+    """
+    try:
+        scan = motif.scanner(pattern, **options)
+        matches = _Matches(limit)
+        with _open(raw, progress) as stored:
+            matches.take(scan(stored, start))
+    except motif.MotifError as e:
+        raise TaskError(str(e))
+    return matches.summary()
+
+
+class _Compressor:
+    """
+    Fused-pass consumer writing the chunks it is fed to a `.gvz` container.
+    """
+
+    overlap = 0
+
+    def __init__(self, fileobj, codec, block_size):
+        self.writer = compression.CompressedWriter(fileobj, codec, block_size)
+        self.elapsed = 0.0
+
+    def update(self, chunk):
+        started = time.perf_counter()
+        self.writer.write(chunk.data[chunk.fresh:])
+        self.elapsed += time.perf_counter() - started
+
+
+class _Matches:
+    """
+    Count motif hits, keeping the first `limit`. With a chunk scan (see
+    `motif.chunk_scan`) it is also a fused-pass consumer, feeding the scan every chunk.
+    """
+
+    def __init__(self, limit, scan=None):
+        self.limit = limit
+        self.scan = scan
+        self.overlap = scan.overlap if scan is not None else 0
+        self.total = 0
+        self.matches = []
+
+    def take(self, hits):
+        for hit in hits:
+            if self.total < self.limit:
+                self.matches.append(motif.format_hit(hit))
+            self.total += 1
+
+    def update(self, chunk):
+        self.take(self.scan.feed(chunk.data, chunk.offset, chunk.fresh))
+
+    def summary(self):
+        if self.scan is not None:
+            self.take(self.scan.finish())
+            self.scan = None
+        return {"total_matches": self.total, "returned": len(self.matches), "matches": self.matches}
+
+
+def analyze(raw, operations, progress=None):
+    """
+    Run several analyses of a stored sequence in one pass over it. `operations` maps
+    "kmers", "windows", "motif" and "compress" to the keyword arguments of the task
+    of the same name (motif: pattern, options, limit); returns their results by name.
+    Every chunk is read and decoded once and fed to each analysis (see
+    `analysis.fused_pass`); only a regex motif, which needs the whole text, is
+    searched after the pass.
+    """
+    kmer_params = operations.get("kmers")
+    window_params = operations.get("windows")
+    motif_params = operations.get("motif")
+    compress_params = operations.get("compress")
+
+    regex = None
+    matches = None
+    if motif_params is not None:
+        try:
+            regex = motif.scanner(motif_params["pattern"], **motif_params["options"])
+        except motif.MotifError as e:
+            raise TaskError(str(e))
+        scan = motif.chunk_scan(motif_params["pattern"], **motif_params["options"])
+        matches = _Matches(motif_params["limit"], scan)
+        if scan is not None:
+            regex = None
+
+    results = {}
+    started = time.perf_counter()
+    with _open(raw, progress, passes=2 if regex else 1) as stored:
+        length = len(stored)
+        consumers = []
+        if kmer_params is not None:
+            counter = analysis.KmerCounter(kmer_params["k"])
+            consumers.append(counter)
+        if window_params is not None:
+            profiler = analysis.WindowProfiler(length, window_params["window"],
+                                               window_params.get("step") or window_params["window"],
+                                               window_params["max_points"])
+            cpg = analysis.CpgCounter()
+            consumers += [profiler, cpg]
+        if matches is not None and regex is None:
+            consumers.append(matches)
+
+        if compress_params is not None:
+            codec, block_size = compress_params["codec"], compress_params["block_size"]
+            compressed_file, tmp = _compressed_tmp(raw)
+            try:
+                with open(tmp, "wb") as f_out:
+                    compressor = _Compressor(f_out, codec, block_size)
+                    analysis.fused_pass(stored, consumers + [compressor])
+                    compressor.writer.close()
+                os.replace(tmp, compressed_file)
+            except BaseException:
+                storage.remove_files([tmp])
+                raise
+            results["compress"] = _compress_result(compressed_file, codec, block_size,
+                                                   compressor.writer.length, compressor.elapsed)
+        elif consumers:
+            analysis.fused_pass(stored, consumers)
+
+        if regex is not None:
+            try:
+                matches.take(regex(stored))
+            except motif.MotifError as e:
+                raise TaskError(str(e))
+    elapsed = time.perf_counter() - started
+
+    if kmer_params is not None:
+        results["kmers"] = analysis.kmer_summary(counter.totals, kmer_params["k"], kmer_params["top"])
+    if window_params is not None:
+        results["windows"] = {"length": length, **profiler.profile(), "cpg": cpg.summary()}
+    if matches is not None:
+        results["motif"] = matches.summary()
+    return {"length": length, "read_mb_per_s": mb_per_s(length, elapsed), **results}
+
+
+def analyze_many(raws, operations, progress=None):
+    """
+    `analyze` every sequence of `raws` (one worker call for a group of small
+    sequences); returns a (result, error) pair per sequence.
+    """
+    outcomes = []
+    for raw in raws:
+        try:
+            outcomes.append((analyze(raw, operations, progress), None))
+        except (TaskError, compression.CodecError, OSError) as e:
+            outcomes.append((None, str(e)))
+    return outcomes
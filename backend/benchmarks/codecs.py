@@ -0,0 +1,77 @@
+"""
+Benchmark every registered compression codec on synthetic genomes.
+
+Run from backend/:
+
+    python -m benchmarks.codecs
+    python -m benchmarks.codecs --sizes 1000000 --kinds repetitive --codecs gzip-9 2bit-lzma cm12 --out codecs.json
+
+Reports ratio, bits/base and compress/decompress throughput per codec, genome
+kind and size. Results are deterministic for a given --seed (timings aside).
+"""
+import argparse
+import io
+import json
+import time
+
+from app import compression
+from benchmarks.genomes import GENERATORS
+
+
+def run_codec(data, codec, block_size=compression.BLOCK_SIZE):
+    buf = io.BytesIO()
+    started = time.perf_counter()
+    writer = compression.CompressedWriter(buf, codec, block_size)
+    writer.write(data)
+    writer.close()
+    compress_s = time.perf_counter() - started
+
+    size = buf.tell()
+    buf.seek(0)
+    started = time.perf_counter()
+    restored = b"".join(compression.CompressedReader(buf).iter_chunks())
+    decompress_s = time.perf_counter() - started
+
+    return {
+        "codec": codec,
+        "compressed_bytes": size,
+        "ratio": round(size / len(data), 4),
+        "bits_per_base": round(size * 8 / len(data), 4),
+        "compress_mb_per_s": round(len(data) / 1e6 / compress_s, 3),
+        "decompress_mb_per_s": round(len(data) / 1e6 / decompress_s, 3),
+        "lossless": restored == data,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark GENOVISTA compression codecs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--kinds", nargs="+", choices=sorted(GENERATORS), default=["random", "repetitive"])
+    parser.add_argument("--codecs", nargs="+", default=list(compression.CODECS))
+    parser.add_argument("--block-size", type=int, default=compression.BLOCK_SIZE,
+                        help="bases per independently compressed block")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'genome':<12}{'size':>12}  {'codec':<14}{'bits/base':>10}{'comp MB/s':>11}{'decomp MB/s':>13}")
+    for kind in args.kinds:
+        for size in args.sizes:
+            data = GENERATORS[kind](size, seed=args.seed)
+            for codec in args.codecs:
+                row = run_codec(data, codec, args.block_size)
+                row.update({"genome": kind, "length": size, "seed": args.seed, "block_size": args.block_size})
+                results.append(row)
+                flag = "" if row["lossless"] else "  LOSSY!"
+                print(f"{kind:<12}{size:>12}  {codec:<14}{row['bits_per_base']:>10.3f}"
+                      f"{row['compress_mb_per_s']:>11.2f}{row['decompress_mb_per_s']:>13.2f}{flag}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Benchmark every /sequences endpoint on synthetic genomes through FastAPI's TestClient.
+
+Run from backend/:
+
+    python -m benchmarks.endpoints
+    python -m benchmarks.endpoints --sizes 1000 1000000 100000000 --kinds random --out endpoints.json
+    python -m benchmarks.endpoints --out new.json --compare endpoints.json --threshold 0.25
+
+Each genome is streamed in through POST /sequences/ingest and then hit by every
+endpoint in turn (the ones that modify or delete it last). Calls are repeated
+--repeat times: `cold` is the first call (empty stats cache, no FM-index) and
+`warm` the fastest of the others. MB/s is bases processed per second. Peak
+memory is measured with tracemalloc in a separate pass (it slows Python down,
+so it never affects the timings); it covers Python and numpy allocations in this
+process, not job worker processes. Endpoints that send the whole sequence as
+JSON are skipped above --max-json bases. Endpoints that hand a large sequence to a
+job (202) are timed until the job is done.
+
+The server state lives in a temporary data directory (GENOVISTA_DATA_DIR), so
+the benchmark never touches real data. With --compare, endpoints whose warm
+time grew by more than --threshold against an earlier --out file are listed
+and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.genomes import GENERATORS
+
+# bases per chunk of a streamed request body
+STREAM_CHUNK = 1 << 20
+
+# bases returned by the region endpoints
+REGION = 1_000_000
+
+MOTIF = "GATC"
+
+JOB_DONE = ("done", "failed", "cancelled")
+
+
+def iter_body(data):
+    view = memoryview(data)
+    for start in range(0, len(view), STREAM_CHUNK):
+        yield bytes(view[start:start + STREAM_CHUNK])
+
+
+def checked(response, *ok):
+    if response.status_code not in (ok or (200,)):
+        raise RuntimeError(f"{response.request.method} {response.request.url.path}: "
+                           f"{response.status_code} {response.text[:200]}")
+    return response
+
+
+def ingest(client, data):
+    items = checked(client.post("/sequences/ingest", content=iter_body(data))).json()["items"]
+    return items[0]["id"]
+
+
+def wait_job(client, job):
+    while job["status"] not in JOB_DONE:
+        time.sleep(0.01)
+        job = checked(client.get(f"/jobs/{job['id']}")).json()
+    if job["status"] != "done":
+        raise RuntimeError(f"job {job['id']} {job['status']}: {job.get('error')}")
+    return job
+
+
+def finished(client, response):
+    """
+    The response of an endpoint, waiting for the job it handed large sequences to (202).
+    """
+    if checked(response, 200, 202).status_code == 202:
+        wait_job(client, response.json())
+    return response
+
+
+def motif(client, seq_id, **options):
+    return finished(client, client.post(f"/sequences/{seq_id}/motif",
+                                        json={"pattern": MOTIF, "count_only": True, **options}))
+
+
+def cases(data, max_json, batch_items):
+    """
+    (endpoint, bases processed per call, setup, call) for one genome, in run order.
+    `setup(client, seq_id)` runs untimed before every call and its result is passed to `call`.
+    """
+    size = len(data)
+    region = min(size, REGION)
+    text = data.decode("ascii")
+    part = max(size // batch_items, 1)
+    parts = [text[start:start + part] for start in range(0, size, part)][:batch_items]
+    batch_ids = []
+
+    def batch_upload(client, seq_id, _):
+        lines = checked(client.post("/sequences/batch", json={"sequences": [{"sequence": p} for p in parts]}))
+        batch_ids[:] = [item["id"] for item in map(json.loads, lines.text.splitlines()) if "id" in item]
+
+    def batch_analyze(client, seq_id, _):
+        ids = batch_ids or [seq_id]
+        checked(client.post("/sequences/batch/analyze", json={
+            "ids": ids,
+            "operations": ["gc", "freq", "kmers", "windows", "motif"],
+            "params": {"motif": {"pattern": MOTIF}},
+        }))
+
+    def job(client, seq_id, _):
+        wait_job(client, checked(client.post(f"/sequences/{seq_id}/jobs",
+                                             json={"kind": "kmers", "params": {"k": 8}}), 202).json())
+
+    def fresh_copy(client, seq_id):
+        return ingest(client, data)
+
+    small = size <= max_json
+    yield "list", None, None, lambda c, i, _: checked(c.get("/sequences/"))
+    if small:
+        yield "upload", size, None, lambda c, i, _: checked(c.post("/sequences/", json={"sequence": text}))
+    yield "ingest", size, None, lambda c, i, _: ingest(c, data)
+    if small:
+        yield "batch", sum(map(len, parts)), None, batch_upload
+        yield "batch/analyze", sum(map(len, parts)), None, batch_analyze
+        yield "get", size, None, lambda c, i, _: checked(c.get(f"/sequences/{i}"))
+    yield "download", size, None, lambda c, i, _: checked(c.get(f"/sequences/{i}", params={"download": True}))
+    yield "region", region, None, lambda c, i, _: checked(
+        c.get(f"/sequences/{i}/region", params={"start": 1, "end": region}))
+    yield "gc", size, None, lambda c, i, _: checked(c.get(f"/sequences/{i}/gc"))
+    yield "freq", size, None, lambda c, i, _: checked(c.get(f"/sequences/{i}/freq"))
+    yield "kmers", size, None, lambda c, i, _: finished(c, c.get(f"/sequences/{i}/kmers", params={"k": 8}))
+    yield "windows", size, None, lambda c, i, _: finished(c, c.get(f"/sequences/{i}/windows"))
+    yield "motif scan", size, None, lambda c, i, _: motif(c, i, use_index=False)
+    yield "motif approx", size, None, lambda c, i, _: motif(c, i, max_mismatches=1)
+    yield "motif regex", size, None, lambda c, i, _: motif(c, i, pattern="GA[AT]TC", use_regex=True)
+    yield "index", size, None, lambda c, i, _: finished(c, c.post(f"/sequences/{i}/index"))
+    yield "motif exact", size, None, lambda c, i, _: motif(c, i)
+    yield "compress", size, None, lambda c, i, _: finished(c, c.post(f"/sequences/{i}/compress"))
+    yield "decompress", size, None, lambda c, i, _: finished(c, c.get(f"/sequences/{i}/decompress"))
+    yield "region compressed", region, None, lambda c, i, _: checked(
+        c.get(f"/sequences/{i}/region", params={"start": 1, "end": region, "source": "compressed"}))
+    yield "jobs", size, None, job
+    yield "similar", size, None, lambda c, i, _: checked(c.get(f"/sequences/{i}/similar"))
+    if small:
+        yield "put", size, None, lambda c, i, _: checked(c.put(f"/sequences/{i}", json={"sequence": text}))
+    yield "put stream", size, None, lambda c, i, _: checked(c.put(f"/sequences/{i}/stream", content=iter_body(data)))
+    yield "delete", size, fresh_copy, lambda c, i, copy: checked(c.delete(f"/sequences/{copy}"))
+
+
+def run_genome(client, data, args, memory):
+    """
+    Time (or, with memory=True, measure the peak allocation of) every case on one genome.
+    """
+    seq_id = ingest(client, data)
+    rows = {}
+    for endpoint, bases, setup, call in cases(data, args.max_json, args.batch_items):
+        times, peak = [], 0
+        for _ in range(1 if memory else args.repeat):
+            arg = setup(client, seq_id) if setup else None
+            if memory:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            call(client, seq_id, arg)
+            times.append(time.perf_counter() - started)
+            if memory:
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+        rows[endpoint] = {"bases": bases, "times": times, "peak_bytes": peak}
+    return rows
+
+
+def summarize(kind, size, timed, measured):
+    results = []
+    for endpoint, row in timed.items():
+        cold = row["times"][0]
+        warm = min(row["times"][1:]) if len(row["times"]) > 1 else cold
+        bases = row["bases"]
+        results.append({
+            "genome": kind,
+            "length": size,
+            "endpoint": endpoint,
+            "bases": bases,
+            "cold_s": round(cold, 6),
+            "warm_s": round(warm, 6),
+            "mb_per_s": round(bases / 1e6 / warm, 3) if bases and warm > 0 else None,
+            "peak_mb": round(measured[endpoint]["peak_bytes"] / 1e6, 3) if measured else None,
+        })
+    return results
+
+
+def compare(results, old_path, threshold):
+    """
+    Rows whose warm time grew by more than `threshold` (a fraction) against an earlier run.
+    """
+    with open(old_path) as f:
+        old = {(r["genome"], r["length"], r["endpoint"]): r for r in json.load(f)["results"]}
+    slower = []
+    for row in results:
+        before = old.get((row["genome"], row["length"], row["endpoint"]))
+        if before and before["warm_s"] > 0 and row["warm_s"] > before["warm_s"] * (1 + threshold):
+            slower.append((row, before))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the GENOVISTA /sequences endpoints.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000],
+                        help="genome lengths in bases (up to 500000000)")
+    parser.add_argument("--kinds", nargs="+", choices=sorted(GENERATORS), default=["random", "repetitive"])
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per endpoint")
+    parser.add_argument("--max-json", type=int, default=10_000_000,
+                        help="largest genome sent or fetched as one JSON body (upload, batch, get, put)")
+    parser.add_argument("--batch-items", type=int, default=100,
+                        help="pieces the genome is cut into for the batch endpoints")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="earlier --out file to check for slowdowns")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown (fraction of the earlier warm time) reported by --compare")
+    args = parser.parse_args(argv)
+
+    # the app reads its data directory at import time
+    data_dir = tempfile.TemporaryDirectory(prefix="genovista-bench-")
+    os.environ["GENOVISTA_DATA_DIR"] = data_dir.name
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    results = []
+    print(f"{'genome':<12}{'size':>12}  {'endpoint':<19}{'cold s':>10}{'warm s':>10}{'MB/s':>10}{'peak MB':>10}")
+    with data_dir, TestClient(app) as client:
+        for kind in args.kinds:
+            for size in args.sizes:
+                data = GENERATORS[kind](size, seed=args.seed)
+                timed = run_genome(client, data, args, memory=False)
+                measured = None
+                if not args.no_memory:
+                    tracemalloc.start()
+                    try:
+                        measured = run_genome(client, data, args, memory=True)
+                    finally:
+                        tracemalloc.stop()
+                for row in summarize(kind, size, timed, measured):
+                    results.append(row)
+                    rate = f"{row['mb_per_s']:>10.2f}" if row["mb_per_s"] is not None else f"{'-':>10}"
+                    peak = f"{row['peak_mb']:>10.2f}" if row["peak_mb"] is not None else f"{'-':>10}"
+                    print(f"{kind:<12}{size:>12}  {row['endpoint']:<19}{row['cold_s']:>10.4f}"
+                          f"{row['warm_s']:>10.4f}{rate}{peak}")
+
+    if args.out:
+        meta = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with open(args.out, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.out}")
+
+    if args.compare:
+        slower = compare(results, args.compare, args.threshold)
+        for row, before in slower:
+            print(f"SLOWER {row['genome']} {row['length']} {row['endpoint']}: "
+                  f"{before['warm_s']:.4f}s -> {row['warm_s']:.4f}s")
+        print(f"{len(slower)} endpoint(s) slower than {args.compare} by more than {args.threshold:.0%}")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Seeded synthetic genomes for benchmarks.
+
+Every generator is deterministic for a given seed and builds the sequence in
+chunks, so even 500 Mb genomes only need one byte per base plus a chunk of
+scratch space.
+"""
+import numpy as np
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+# bases generated per step
+CHUNK = 1 << 24
+
+
+def random_genome(length, seed=0, gc=0.5):
+    """
+    Independent bases with the given GC fraction.
+    """
+    rng = np.random.default_rng(seed)
+    out = np.empty(length, dtype=np.uint8)
+    for start in range(0, length, CHUNK):
+        n = min(CHUNK, length - start)
+        u = rng.random(n, dtype=np.float32)
+        strong = u < gc
+        # within each class pick the base with a second coin flip
+        flip = rng.integers(0, 2, size=n, dtype=np.uint8)
+        codes = np.where(strong, 1 + flip, 3 * flip)
+        out[start:start + n] = BASES[codes]
+    return out.tobytes()
+
+
+def repetitive_genome(length, seed=0, repeat_len=300, families=50, repeat_fraction=0.5, mutation_rate=0.02):
+    """
+    Random background where `repeat_fraction` of the genome is covered by mutated
+    copies of a few repeat families (a crude model of interspersed repeats).
+    """
+    rng = np.random.default_rng(seed)
+    genome = np.frombuffer(random_genome(length, seed=seed + 1), dtype=np.uint8).copy()
+    slots = length // repeat_len
+    if slots == 0:
+        return genome.tobytes()
+    consensus = BASES[rng.integers(0, 4, size=(families, repeat_len), dtype=np.uint8)]
+    tiled = genome[:slots * repeat_len].reshape(slots, repeat_len)
+    chosen = np.flatnonzero(rng.random(slots) < repeat_fraction)
+    for start in range(0, chosen.size, CHUNK // repeat_len):
+        rows = chosen[start:start + CHUNK // repeat_len]
+        copies = consensus[rng.integers(0, families, size=rows.size)]
+        mutate = rng.random(copies.shape, dtype=np.float32) < mutation_rate
+        copies[mutate] = BASES[rng.integers(0, 4, size=int(mutate.sum()), dtype=np.uint8)]
+        tiled[rows] = copies
+    return genome.tobytes()
+
+
+def tandem_genome(length, seed=0, unit_len=12, mutation_rate=0.01):
+    """
+    A single short unit repeated end to end with point mutations (satellite-like DNA).
+    """
+    rng = np.random.default_rng(seed)
+    unit = BASES[rng.integers(0, 4, size=unit_len, dtype=np.uint8)]
+    genome = np.resize(unit, length)
+    mutate = np.flatnonzero(rng.random(length, dtype=np.float32) < mutation_rate)
+    genome[mutate] = BASES[rng.integers(0, 4, size=mutate.size, dtype=np.uint8)]
+    return genome.tobytes()
+
+
+GENERATORS = {
+    "random": random_genome,
+    "gc-rich": lambda length, seed=0: random_genome(length, seed=seed, gc=0.65),
+    "repetitive": repetitive_genome,
+    "tandem": tandem_genome,
+}
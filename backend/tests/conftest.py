@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+import pytest
+
+# the app reads its data directory at import time, so point it at a scratch
+# directory before any test module imports it
+os.environ.setdefault("GENOVISTA_DATA_DIR", tempfile.mkdtemp(prefix="genovista-tests-"))
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def upload(client):
+    def upload(sequence):
+        response = client.post("/sequences/", json={"sequence": sequence})
+        assert response.status_code == 200, response.text
+        return response.json()["id"]
+    return upload
@@ -0,0 +1,126 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from app import analysis, seqfile
+
+COMPLEMENT = {"A": "T", "C": "G", "G": "C", "T": "A"}
+
+
+def sequence(length, seed=0):
+    rng = np.random.default_rng(seed)
+    # GC-rich with a few N runs and IUPAC codes, so k-mers and windows hit every case
+    data = np.frombuffer(b"ACGTGC", dtype=np.uint8)[rng.integers(0, 6, size=length)].copy()
+    for start in rng.integers(0, length, size=4):
+        data[start:start + rng.integers(1, 30)] = ord("N")
+    data[rng.integers(0, length, size=6)] = ord("Y")
+    return data.tobytes().decode("ascii")
+
+
+@pytest.fixture
+def stored(tmp_path):
+    opened = []
+
+    def stored(text):
+        path = str(tmp_path / f"seq{len(opened)}.gv2")
+        seqfile.write_packed(path, [text.encode("ascii")])
+        opened.append(seqfile.open_sequence(path))
+        return opened[-1]
+
+    yield stored
+    for s in opened:
+        s.close()
+
+
+def code(kmer):
+    value = 0
+    for base in kmer:
+        value = value * 4 + "ACGT".index(base)
+    return value
+
+
+def brute_kmers(text, k):
+    return Counter(text[i:i + k] for i in range(len(text) - k + 1) if set(text[i:i + k]) <= set("ACGT"))
+
+
+@pytest.mark.parametrize("k", [1, 3, 7])
+@pytest.mark.parametrize("chunk_size", [5, 97, 1 << 16])
+def test_kmer_counts_match_brute_force(stored, k, chunk_size):
+    text = sequence(3000, seed=k)
+    totals = analysis.kmer_counts(stored(text), k, chunk_size)
+    expected = brute_kmers(text, k)
+    assert int(totals.sum()) == sum(expected.values())
+    assert {analysis.kmer_string(c, k): int(totals[c]) for c in np.flatnonzero(totals)} == expected
+
+
+def test_canonical_codes_match_brute_force():
+    text = sequence(500, seed=9)
+    for k in (1, 2, 5, 8, 13, 21, 32):
+        data = text.encode("ascii")
+        got = analysis.canonical_kmer_codes(seqfile.base_codes(data), seqfile.base_mask(data), k)
+        expected = []
+        for kmer in (text[i:i + k] for i in range(len(text) - k + 1)):
+            if set(kmer) <= set("ACGT"):
+                reverse = "".join(COMPLEMENT[b] for b in reversed(kmer))
+                expected.append(min(code(kmer), code(reverse)))
+        assert got.tolist() == expected
+
+
+def test_top_kmers_are_ordered_by_count_then_kmer(stored):
+    text = sequence(2000, seed=3)
+    summary = analysis.kmer_summary(analysis.kmer_counts(stored(text), 4), 4, top=15)
+    expected = sorted(brute_kmers(text, 4).items(), key=lambda item: (-item[1], item[0]))[:15]
+    assert [(row["kmer"], row["count"]) for row in summary["top"]] == expected
+    assert summary["distinct_kmers"] == len(brute_kmers(text, 4))
+
+
+def ratio(num, den, scale=1.0, digits=4):
+    return round(num / den * scale, digits) if den else None
+
+
+def brute_profile(text, window, step, max_points):
+    window = min(window, len(text))
+    starts = range(0, len(text) - window + 1, step)
+    factor = math.ceil(len(starts) / max_points)
+    buckets = [starts[i:i + factor] for i in range(0, len(starts), factor)]
+    gc, skew, cpg = [], [], []
+    for bucket in buckets:
+        g = c = valid = cg = 0
+        for s in bucket:
+            part = text[s:s + window]
+            g += part.count("G")
+            c += part.count("C")
+            valid += sum(part.count(b) for b in "ACGT")
+            cg += part.count("CG")
+        gc.append(ratio(g + c, valid, 100, 3))
+        skew.append(ratio(g - c, g + c))
+        cpg.append(ratio(cg * valid, c * g))
+    return {
+        "start": [b[0] + 1 for b in buckets],
+        "end": [b[-1] + window for b in buckets],
+        "gc_percent": gc,
+        "gc_skew": skew,
+        "cpg_obs_exp": cpg,
+    }
+
+
+@pytest.mark.parametrize("window, step, max_points", [
+    (50, 50, 1000), (50, 7, 1000), (64, 3, 40), (10, 25, 1000), (5000, 1, 10),
+])
+@pytest.mark.parametrize("chunk_size", [13, 1 << 16])
+def test_window_profile_matches_brute_force(stored, window, step, max_points, chunk_size):
+    text = sequence(2500, seed=window)
+    profile = analysis.window_profile(stored(text), window, step, max_points, chunk_size)
+    expected = brute_profile(text, window, step, max_points)
+    for column in expected:
+        assert profile[column] == expected[column], column
+
+
+def test_cpg_summary_matches_brute_force(stored):
+    text = sequence(4000, seed=11)
+    summary = analysis.cpg_summary(stored(text), chunk_size=31)
+    valid = sum(text.count(b) for b in "ACGT")
+    assert summary["CG_count"] == text.count("CG")
+    assert summary["obs_exp"] == ratio(text.count("CG") * valid, text.count("C") * text.count("G"))
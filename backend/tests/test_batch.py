@@ -0,0 +1,98 @@
+import json
+import os
+
+import pytest
+
+from app import jobs, storage
+from app.routers import sequences
+
+
+def ndjson(response):
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_upload_reports_each_item(client):
+    items = [{"sequence": "ACGTACGT", "name": "a"}, {"sequence": "ACGXX"}, {"sequence": "ggccaa"},
+             {"sequence": "ACGTACGT", "name": "copy"}, {"sequence": "AC-GT"}]
+    lines = ndjson(client.post("/sequences/batch", json={"sequences": items}))
+    results, summary = lines[:-1], lines[-1]
+    assert [line["index"] for line in results] == list(range(len(items)))
+    assert [("error" in line) for line in results] == [False, True, False, False, True]
+    assert summary == {"done": True, "count": 3, "failed": 2}
+    assert results[0]["name"] == "a" and results[0]["length"] == 8
+    assert client.get(f"/sequences/{results[2]['id']}").json()["sequence"] == "GGCCAA"
+    # identical content is stored once
+    assert storage.resolve(results[0]["id"]).raw == storage.resolve(results[3]["id"]).raw
+
+
+def test_failed_commit_fails_its_items_only(client, monkeypatch):
+    store = storage.store
+    monkeypatch.setattr(sequences, "BATCH_COMMIT", 2)
+
+    def failing(seq_id, summary, tmp=None, data=None, name=None, mtime=None):
+        if name == "bad":
+            raise OSError("disk full")
+        return store(seq_id, summary, tmp=tmp, data=data, name=name, mtime=mtime)
+
+    monkeypatch.setattr(storage, "store", failing)
+    items = [{"sequence": "AAAC"}, {"sequence": "AAAG"}, {"sequence": "AAAT", "name": "bad"}, {"sequence": "AACA"}]
+    lines = ndjson(client.post("/sequences/batch", json={"sequences": items}))
+    assert [line.get("error") for line in lines[:-1]] == [None, None, "disk full", "disk full"]
+    assert lines[-1] == {"done": True, "count": 2, "failed": 2}
+    for line in lines[:2]:
+        assert client.get(f"/sequences/{line['id']}").status_code == 200
+    # nothing of the failed transaction is left behind
+    leftovers = [f for f in os.listdir(storage.BLOB_DIR) if f.endswith(".tmp")]
+    assert leftovers == []
+
+
+def test_batch_analyze_matches_single_endpoints(client, upload):
+    first = upload("ACGTTGCACGCGAATT" * 40)
+    second = upload("GGGGCCCCATAT" * 30)
+    ids = [first, "nosuchid", second, first]
+    params = {"kmers": {"k": 3, "top": 5}, "windows": {"window": 50, "step": 25},
+              "motif": {"pattern": "CGCG"}}
+    lines = ndjson(client.post("/sequences/batch/analyze", json={
+        "ids": ids, "operations": ["gc", "freq", "kmers", "windows", "motif"], "params": params}))
+    assert lines[-1] == {"done": True, "count": 3, "failed": 1}
+    by_index = {line["index"]: line for line in lines[:-1]}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert by_index[1]["error"] == sequences.NOT_FOUND
+    for index, seq_id in enumerate(ids):
+        if index == 1:
+            continue
+        results = by_index[index]["results"]
+        gc = client.get(f"/sequences/{seq_id}/gc").json()
+        assert results["gc"]["GC_percent"] == gc["GC_percent"]
+        assert results["freq"]["counts"] == client.get(f"/sequences/{seq_id}/freq").json()["counts"]
+        kmers = client.get(f"/sequences/{seq_id}/kmers", params={"k": 3, "top": 5}).json()
+        assert results["kmers"]["top"] == kmers["top"]
+        windows = client.get(f"/sequences/{seq_id}/windows", params={"window": 50, "step": 25}).json()
+        assert results["windows"]["gc_percent"] == windows["gc_percent"]
+        motif = client.post(f"/sequences/{seq_id}/motif", json={"pattern": "CGCG"}).json()
+        assert results["motif"]["total_matches"] == motif["total_matches"]
+
+
+def test_batch_analyze_in_the_worker_pool(client, upload, monkeypatch):
+    # every sequence above the inline limit: groups go to the process pool
+    monkeypatch.setattr(jobs, "INLINE_MAX_LENGTH", 100)
+    ids = [upload("ACGT" * 50 + "G" * n) for n in range(1, 4)]
+    lines = ndjson(client.post("/sequences/batch/analyze", json={
+        "ids": ids, "operations": ["kmers"], "params": {"kmers": {"k": 2}}}))
+    assert lines[-1] == {"done": True, "count": 3, "failed": 0}
+    assert sorted(line["index"] for line in lines[:-1]) == [0, 1, 2]
+    for line in lines[:-1]:
+        assert line["results"]["kmers"]["total_kmers"] == line["length"] - 1
+
+
+@pytest.mark.parametrize("params, status", [
+    ({"kmers": {"k": 99}}, 422),
+    ({"motif": {"pattern": "AC(GT", "use_regex": True}, "kmers": {}}, 400),
+])
+def test_batch_analyze_checks_params_up_front(client, upload, params, status):
+    seq_id = upload("ACGTACGT")
+    response = client.post("/sequences/batch/analyze", json={
+        "ids": [seq_id], "operations": list(params), "params": params})
+    assert response.status_code == status
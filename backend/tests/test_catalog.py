@@ -0,0 +1,63 @@
+import os
+
+from app import catalog
+from app.config import DATA_DIR
+
+
+def all_pages(client, limit, **params):
+    items, offset = [], 0
+    while True:
+        page = client.get("/sequences/", params={"limit": limit, "offset": offset, **params}).json()
+        items += page["items"]
+        offset += limit
+        if offset >= page["total"]:
+            return items, page["total"]
+
+
+def test_pages_cover_the_catalog_once(client, upload):
+    for length in (7, 3, 11, 5, 9):
+        upload("A" * length)
+    items, total = all_pages(client, 2, sort="id", order="asc")
+    ids = [item["id"] for item in items]
+    assert len(ids) == total == catalog.count()
+    assert ids == sorted(ids)
+
+
+def test_sort_by_length(client, upload):
+    for length in (40, 10, 30):
+        upload("C" * length)
+    for order in ("asc", "desc"):
+        items, _ = all_pages(client, 1000, sort="length", order=order)
+        lengths = [item["length"] for item in items]
+        assert lengths == sorted(lengths, reverse=order == "desc")
+
+
+def test_newest_first_by_default(client, upload):
+    upload("GATTACA")
+    newest = upload("TACAGAT")
+    page = client.get("/sequences/", params={"limit": 1}).json()
+    assert page["items"][0]["id"] == newest
+    assert page["limit"] == 1 and page["offset"] == 0
+
+
+def test_invalid_paging_is_rejected(client):
+    assert client.get("/sequences/", params={"limit": 0}).status_code == 422
+    assert client.get("/sequences/", params={"offset": -1}).status_code == 422
+    assert client.get("/sequences/", params={"sort": "name"}).status_code == 422
+
+
+def test_rebuild_command_indexes_legacy_files(client, upload, capsys):
+    seq_id = upload("ACGTACGTAC")
+    legacy = os.path.join(DATA_DIR, "legacyid0001.txt")
+    with open(legacy, "w") as f:
+        f.write("TTTTGGGG")
+    try:
+        catalog.main(["rebuild"])
+        assert f"Indexed {catalog.count()} sequences" in capsys.readouterr().out
+        assert catalog.get("legacyid0001")["length"] == 8
+        assert catalog.get(seq_id)["length"] == 10
+        assert client.get("/sequences/legacyid0001").json()["sequence"] == "TTTTGGGG"
+    finally:
+        os.remove(legacy)
+        catalog.rebuild()
+    assert catalog.get("legacyid0001") is None
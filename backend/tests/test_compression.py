@@ -0,0 +1,134 @@
+import gzip
+import io
+import zlib
+
+import numpy as np
+import pytest
+
+from app import compression, tasks
+
+
+def sequence(length, seed=0):
+    rng = np.random.default_rng(seed)
+    data = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, size=length)].copy()
+    # a run of N and a few IUPAC codes exercise the codecs' exception handling
+    data[length // 3:length // 3 + 50] = ord("N")
+    data[rng.integers(0, length, size=5)] = ord("R")
+    return data.tobytes()
+
+
+def compressed(data, codec, block_size):
+    buf = io.BytesIO()
+    writer = compression.CompressedWriter(buf, codec, block_size)
+    for start in range(0, len(data), 1000):
+        writer.write(data[start:start + 1000])
+    writer.close()
+    buf.seek(0)
+    return buf
+
+
+@pytest.mark.parametrize("codec", list(compression.CODECS))
+def test_round_trip(codec):
+    data = sequence(5000)
+    reader = compression.CompressedReader(compressed(data, codec, 1 << 12))
+    assert reader.codec == codec
+    assert reader.length == len(data)
+    assert b"".join(reader.iter_chunks()) == data
+
+
+@pytest.mark.parametrize("codec", ["gzip-6", "2bit", "cm2"])
+def test_region_reads_match_slices(codec):
+    data = sequence(20000, seed=1)
+    reader = compression.CompressedReader(compressed(data, codec, 1 << 12))
+    for start, end in [(0, 1), (4095, 4097), (100, 12000), (19999, 20000), (0, 20000), (5000, 5000)]:
+        assert reader.read_region(start, end) == data[start:end]
+
+
+def test_block_checksums():
+    data = sequence(10000, seed=2)
+    reader = compression.CompressedReader(compressed(data, "2bit-lzma", 1 << 12))
+    for text, crc in reader.iter_blocks():
+        assert zlib.crc32(text) == crc
+
+
+def test_legacy_gzip_is_read_sequentially():
+    data = sequence(3000, seed=3)
+    reader = compression.CompressedReader(io.BytesIO(gzip.compress(data)))
+    assert reader.codec == "gzip"
+    assert reader.length is None
+    assert reader.read_region(10, 2500) == data[10:2500]
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(compression.CodecError):
+        compression.CompressedReader(io.BytesIO(b"GVZ\x01" + b"\0" * 32))
+
+
+@pytest.mark.parametrize("codec", ["cm2", "cm12"])
+def test_context_models_refuse_large_blocks(codec):
+    with pytest.raises(compression.CodecError):
+        compression.CompressedWriter(io.BytesIO(), codec, compression.CM_MAX_BLOCK_SIZE + 1)
+    # other codecs take any block size
+    compression.CompressedWriter(io.BytesIO(), "gzip-1", compression.CM_MAX_BLOCK_SIZE + 1)
+
+
+def test_reader_refuses_an_oversized_context_model_block():
+    buf = compressed(sequence(5000), "cm2", 1 << 12)
+    data = bytearray(buf.getvalue())
+    # the first block header follows the file header and the codec name
+    offset = compression._HEADER.size + len("cm2")
+    data[offset:offset + 4] = (compression.CM_MAX_BLOCK_SIZE + 1).to_bytes(4, "little")
+    reader = compression.CompressedReader(io.BytesIO(bytes(data)))
+    with pytest.raises(compression.CodecError):
+        reader.read_region(0, 10)
+
+
+def test_compress_endpoint_checks_the_block_size(client, upload):
+    seq_id = upload("ACGT" * 100)
+    response = client.post(f"/sequences/{seq_id}/compress",
+                           params={"codec": "cm12", "block_size": compression.CM_MAX_BLOCK_SIZE * 2})
+    assert response.status_code == 400
+    response = client.post(f"/sequences/{seq_id}/jobs",
+                           json={"kind": "compress", "params": {"codec": "cm12", "block_size": 1 << 24}})
+    assert response.status_code == 400
+
+
+def test_missing_block_index_is_rejected():
+    data = compressed(sequence(5000), "gzip-1", 1 << 12).getvalue()
+    with pytest.raises(compression.CodecError):
+        compression.CompressedReader(io.BytesIO(data[:-4]))
+
+
+def test_unknown_codec_in_header_is_rejected():
+    data = compressed(sequence(5000), "zlib-1", 1 << 12).getvalue()
+    with pytest.raises(compression.CodecError):
+        compression.CompressedReader(io.BytesIO(data.replace(b"zlib-1", b"zlib-7", 1)))
+
+
+def test_verification_catches_a_corrupted_block(tmp_path):
+    data = sequence(10000, seed=4)
+    original = tmp_path / "original.txt"
+    original.write_bytes(data)
+    raw = bytearray(compressed(data, "2bit", 1 << 12).getvalue())
+    reader = compression.CompressedReader(io.BytesIO(bytes(raw)))
+    assert tasks.verify_blocks(reader, str(original)) == (True, len(data))
+    # flip a bit in the stored checksum of the second block
+    _, second = reader.blocks[1]
+    raw[second + 8] ^= 1
+    reader = compression.CompressedReader(io.BytesIO(bytes(raw)))
+    assert tasks.verify_blocks(reader, str(original)) == (False, len(data))
+
+
+@pytest.mark.parametrize("codec", list(compression.CODECS))
+def test_compress_endpoint_round_trip(client, upload, codec):
+    text = sequence(3000, seed=5).decode("ascii").replace("N", "A").replace("R", "G")
+    seq_id = upload(text)
+    response = client.post(f"/sequences/{seq_id}/compress", params={"codec": codec, "block_size": 1 << 12})
+    assert response.status_code == 200, response.text
+    assert response.json()["codec"] == codec
+    restored = client.get(f"/sequences/{seq_id}/decompress").json()
+    assert restored["codec"] == codec
+    assert restored["lossless_verification"] is True
+    region = client.get(f"/sequences/{seq_id}/region", params={"start": 990, "end": 2100, "source": "compressed"})
+    # regions are 1-based and inclusive
+    assert region.json()["sequence"] == text[989:2100]
@@ -0,0 +1,33 @@
+import pytest
+
+
+@pytest.fixture
+def seq_id(upload):
+    return upload("ACGTACGTAA")
+
+
+@pytest.mark.parametrize("header, body, content_range", [
+    ("bytes=2-5", "GTAC", "bytes 2-5/10"),
+    ("bytes=7-", "TAA", "bytes 7-9/10"),
+    ("bytes=-2", "AA", "bytes 8-9/10"),
+    ("bytes=8-100", "AA", "bytes 8-9/10"),
+])
+def test_byte_ranges(client, seq_id, header, body, content_range):
+    response = client.get(f"/sequences/{seq_id}", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.text == body
+    assert response.headers["content-range"] == content_range
+
+
+@pytest.mark.parametrize("header", ["items=0-4", "bytes=0-1,4-5", "bytes=5-2", "bytes=x-", "bytes=-"])
+def test_unsupported_ranges_get_the_full_sequence(client, seq_id, header):
+    response = client.get(f"/sequences/{seq_id}", headers={"Range": header})
+    assert response.status_code == 200
+    assert response.text == "ACGTACGTAA"
+
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=10-12", "bytes=-0"])
+def test_unsatisfiable_ranges(client, seq_id, header):
+    response = client.get(f"/sequences/{seq_id}", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */10"
@@ -0,0 +1,56 @@
+import gzip
+import zlib
+
+import numpy as np
+import pytest
+
+from app import ingest
+
+
+def decompress(body, chunk_size, limit=ingest.MAX_BODY):
+    decoder = ingest.Decompressor(limit)
+    pieces = []
+    for start in range(0, len(body), chunk_size):
+        pieces.extend(decoder.feed(body[start:start + chunk_size]))
+    pieces.append(decoder.flush())
+    return pieces
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, 1 << 20])
+def test_gzip_members_in_any_chunking(chunk_size):
+    rng = np.random.default_rng(0)
+    parts = [np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, size=n)].tobytes() for n in (1, 5000, 20000)]
+    body = b"".join(gzip.compress(part) for part in parts)
+    assert b"".join(decompress(body, chunk_size)) == b"".join(parts)
+
+
+def test_plain_body_passes_through():
+    assert b"".join(decompress(b">x\nACGT\n", 3)) == b">x\nACGT\n"
+    assert decompress(b"A", 1) == [b"A"]
+
+
+def test_output_is_produced_in_bounded_pieces():
+    body = gzip.compress(b"A" * (3 * ingest.DECOMPRESS_STEP + 5))
+    pieces = decompress(body, len(body))
+    assert max(map(len, pieces)) <= ingest.DECOMPRESS_STEP
+    assert sum(map(len, pieces)) == 3 * ingest.DECOMPRESS_STEP + 5
+
+
+def test_decompression_bomb_is_stopped():
+    # about 100 MB of A in roughly 100 KB of gzip
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    block = b"A" * (1 << 20)
+    body = b"".join(compressor.compress(block) for _ in range(100)) + compressor.flush()
+    decoder = ingest.Decompressor(limit=10 << 20)
+    with pytest.raises(ingest.IngestError):
+        for _ in decoder.feed(body):
+            pass
+    assert decoder.total <= (10 << 20) + ingest.DECOMPRESS_STEP
+
+
+def test_invalid_and_truncated_gzip():
+    with pytest.raises(ingest.IngestError):
+        decompress(ingest.GZIP_MAGIC + b"\x08\x00not deflate data", 4)
+    with pytest.raises(ingest.IngestError):
+        decompress(gzip.compress(b"ACGT" * 1000)[:-10], 64)
+
@@ -0,0 +1,143 @@
+import os
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app import jobs, storage, tasks
+from app.routers import sequences
+
+ORIGINAL = "ACGT" * 50
+
+
+@pytest.fixture
+def replaced_during_compress(monkeypatch):
+    """
+    Make the next compression replace the content of an id right after it has read
+    the sequence, as a concurrent PUT would.
+    """
+    target = {}
+    compress = tasks.compress
+
+    def racing(raw, *args, **kwargs):
+        result = compress(raw, *args, **kwargs)
+        sequences.update_sequence(target["id"], sequences.SequenceUpdate(sequence="GGGG"))
+        return result
+
+    monkeypatch.setattr(tasks, "compress", racing)
+    return target
+
+
+def listed(client, seq_id):
+    items = client.get("/sequences/", params={"limit": 1000}).json()["items"]
+    return next(item for item in items if item["id"] == seq_id)
+
+
+def test_compress_job_finishing_after_an_update(client, upload, replaced_during_compress):
+    seq_id = upload(ORIGINAL)
+    old_blob = storage.resolve(seq_id).raw
+    replaced_during_compress["id"] = seq_id
+
+    job = client.post(f"/sequences/{seq_id}/jobs", json={"kind": "compress"}).json()
+    assert job["status"] == "failed"
+    assert job["error"] == sequences.SEQUENCE_CHANGED
+
+    assert client.get(f"/sequences/{seq_id}").json()["sequence"] == "GGGG"
+    assert listed(client, seq_id)["compressed"] is False
+    assert listed(client, seq_id)["length"] == 4
+    # the artifact of the replaced content is not left behind
+    assert not os.path.exists(storage.compressed_path(old_blob))
+
+
+def test_compress_job_keeps_other_ids_of_the_content(client, upload, replaced_during_compress):
+    seq_id = upload(ORIGINAL + "A")
+    sharer = upload(ORIGINAL + "A")
+    replaced_during_compress["id"] = seq_id
+
+    job = client.post(f"/sequences/{seq_id}/jobs", json={"kind": "compress"}).json()
+    assert job["status"] == "done"
+
+    assert client.get(f"/sequences/{seq_id}").json()["sequence"] == "GGGG"
+    assert listed(client, seq_id)["compressed"] is False
+    assert listed(client, sharer)["compressed"] is True
+    restored = client.get(f"/sequences/{sharer}/decompress").json()
+    assert restored["lossless_verification"] is True
+    assert restored["length"] == len(ORIGINAL) + 1
+
+
+def test_compress_endpoint_reports_a_concurrent_update(client, upload, replaced_during_compress):
+    seq_id = upload(ORIGINAL + "C")
+    replaced_during_compress["id"] = seq_id
+    response = client.post(f"/sequences/{seq_id}/compress")
+    assert response.status_code == 409
+    assert client.get(f"/sequences/{seq_id}").json()["sequence"] == "GGGG"
+
+
+def test_compress_job_marks_every_id_of_the_content(client, upload):
+    first = upload(ORIGINAL + "G")
+    second = upload(ORIGINAL + "G")
+    job = client.post(f"/sequences/{first}/jobs", json={"kind": "compress"}).json()
+    assert job["status"] == "done"
+    assert listed(client, first)["compressed"] is True
+    assert listed(client, second)["compressed"] is True
+    assert client.get(f"/sequences/{second}/region", params={"start": 3, "end": 10, "source": "compressed"}).json()[
+        "sequence"] == (ORIGINAL + "G")[2:10]
+
+
+class StuckPool:
+    """
+    Stands in for the process pool: jobs are accepted but never start.
+    """
+
+    def submit(self, *args):
+        return Future()
+
+
+class BrokenPool:
+    def submit(self, *args):
+        raise BrokenProcessPool("a worker died")
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+def task(progress):
+    return None
+
+
+def test_failed_submit_frees_its_queue_slot(monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_QUEUED", 1)
+    for _ in range(3):
+        monkeypatch.setattr(jobs, "_pool", BrokenPool())
+        with pytest.raises(BrokenProcessPool):
+            jobs.submit("broken", "x", {}, task)
+        # the broken pool is dropped so the next job starts a fresh one
+        assert jobs._pool is None
+    failed = [job for job in jobs.list_jobs(3) if job["kind"] == "broken"]
+    assert [job["status"] for job in failed] == ["failed"] * 3
+
+
+def test_queue_limit_holds_under_concurrent_submits(monkeypatch):
+    monkeypatch.setattr(jobs, "_pool", StuckPool())
+    monkeypatch.setattr(jobs, "MAX_QUEUED", 5)
+    accepted = []
+    refused = []
+
+    def submit():
+        try:
+            accepted.append(jobs.submit("stuck", "x", {}, task))
+        except jobs.QueueFull:
+            refused.append(1)
+
+    threads = [threading.Thread(target=submit) for _ in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert len(accepted) == 5
+        assert len(refused) == 35
+    finally:
+        for job in accepted:
+            jobs._finish(jobs._jobs[job["id"]], status="cancelled")
@@ -0,0 +1,66 @@
+import pytest
+
+from app import jobs
+
+
+@pytest.fixture
+def pending_jobs(monkeypatch):
+    """
+    Every sequence counts as large; submitted jobs never start.
+    """
+    submitted = []
+
+    def submit(kind, seq_id, params, fn, *args, on_done=None):
+        submitted.append((kind, fn.__name__, args))
+        return jobs.view(jobs._new_job(kind, seq_id, params)["id"])
+
+    monkeypatch.setattr(jobs, "submit", submit)
+    monkeypatch.setattr(jobs, "INLINE_MAX_LENGTH", 0)
+    return submitted
+
+
+@pytest.mark.parametrize("method, path, params, kind", [
+    ("post", "compress", {"codec": "2bit"}, "compress"),
+    ("get", "kmers", {"k": 4, "top": 5}, "kmers"),
+    ("get", "windows", {"window": 10}, "windows"),
+])
+def test_large_sequences_run_as_jobs(client, upload, pending_jobs, method, path, params, kind):
+    seq_id = upload("ACGT" * 100)
+    response = getattr(client, method)(f"/sequences/{seq_id}/{path}", params=params)
+    assert response.status_code == 202
+    job = response.json()
+    assert response.headers["location"] == f"/jobs/{job['id']}"
+    assert (job["kind"], job["seq_id"], job["status"]) == (kind, seq_id, "queued")
+    assert [submitted[0] for submitted in pending_jobs] == [kind]
+
+
+def test_large_verify_runs_as_job(client, upload, pending_jobs, monkeypatch):
+    seq_id = upload("ACGT" * 100)
+    monkeypatch.setattr(jobs, "INLINE_MAX_LENGTH", 1 << 20)
+    assert client.post(f"/sequences/{seq_id}/compress").status_code == 200
+    monkeypatch.setattr(jobs, "INLINE_MAX_LENGTH", 0)
+    # the preview only reads the first block
+    assert client.get(f"/sequences/{seq_id}/decompress", params={"verify": False}).status_code == 200
+    response = client.get(f"/sequences/{seq_id}/decompress")
+    assert response.status_code == 202
+    assert response.json()["kind"] == "verify"
+
+
+def test_large_motif_scan_keeps_the_cursor(client, upload, pending_jobs):
+    seq_id = upload("ACGT" * 100)
+    response = client.post(f"/sequences/{seq_id}/motif",
+                           json={"pattern": "ACG", "use_index": False, "cursor": 40, "limit": 5, "stream": True})
+    assert response.status_code == 202
+    kind, name, args = pending_jobs[0]
+    assert (kind, name) == ("motif", "motif_scan")
+    assert args[1] == "ACG" and args[-2:] == (5, 40)
+    assert response.json()["params"]["cursor"] == 40
+
+
+def test_motif_job_scans_from_the_cursor(client, upload):
+    seq_id = upload("ACGT" * 100)
+    job = client.post(f"/sequences/{seq_id}/jobs",
+                      json={"kind": "motif", "params": {"pattern": "ACG", "cursor": 40, "limit": 3}}).json()
+    assert job["status"] == "done"
+    assert job["result"]["total_matches"] == 90
+    assert [m["start"] for m in job["result"]["matches"]] == [41, 45, 49]
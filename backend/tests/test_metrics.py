@@ -0,0 +1,73 @@
+import marshal
+import re
+
+from app import metrics, profiling
+
+
+def sample(text, name, **labels):
+    """
+    Value of the sample `name` whose labels include `labels`, or None.
+    """
+    for line in text.splitlines():
+        match = re.fullmatch(r"(\w+)(?:\{(.*)\})? (\S+)", line)
+        if match is None or match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', match.group(2) or ""))
+        if all(found.get(key) == value for key, value in labels.items()):
+            return float(match.group(3))
+    return None
+
+
+def test_requests_are_counted_by_route_template(client, upload):
+    seq_id = upload("ACGTACGTGG")
+    client.get(f"/sequences/{seq_id}/gc")
+    client.get("/sequences/nosuchid/gc")
+    client.get("/no/such/route")
+    response = client.get("/metrics")
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    text = response.text
+    assert "# TYPE genovista_http_request_duration_seconds histogram" in text
+    assert sample(text, "genovista_http_request_duration_seconds_count",
+                  method="GET", route="/sequences/{seq_id}/gc", status="200") >= 1
+    assert sample(text, "genovista_http_request_duration_seconds_count",
+                  method="GET", route="/sequences/{seq_id}/gc", status="404") >= 1
+    assert sample(text, "genovista_http_request_duration_seconds_count", route="unmatched", status="404") >= 1
+    # ids never become label values
+    assert seq_id not in text
+
+
+def test_reads_and_cache_lookups_are_counted(client, upload):
+    seq_id = upload("ACGT" * 100)
+    before = client.get("/metrics").text
+    client.get(f"/sequences/{seq_id}/region", params={"start": 1, "end": 200})
+    for _ in range(2):
+        client.get(f"/sequences/{seq_id}/gc")
+    after = client.get("/metrics").text
+    read = sample(after, "genovista_read_bytes_total", source="sequence")
+    assert read - (sample(before, "genovista_read_bytes_total", source="sequence") or 0) >= 200
+    assert sample(after, "genovista_cache_lookups_total", cache="stats", result="hit") is not None
+
+
+def test_profiling_is_off_by_default(client, upload):
+    seq_id = upload("ACGTAC")
+    response = client.get(f"/sequences/{seq_id}/gc", params={"profile": 1})
+    assert response.json()["id"] == seq_id
+    assert "x-profiled-status" not in response.headers
+
+
+def test_profiled_request_returns_a_report(client, upload, monkeypatch):
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    seq_id = upload("ACGTAC")
+    response = client.get(f"/sequences/{seq_id}/kmers", params={"k": 2, "profile": 1})
+    assert response.status_code == 200
+    assert response.headers["x-profiled-status"] == "200"
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "cumulative" in response.text and "kmer_counts" in response.text
+
+    response = client.get("/sequences/nosuchid/gc", headers={"X-Profile": "pstats"})
+    assert response.headers["x-profiled-status"] == "404"
+    stats = marshal.loads(response.content)
+    assert any(name == "calculate_gc_content" for _, _, name in stats)
+
+    response = client.get(f"/sequences/{seq_id}/gc", params={"profile": 0})
+    assert response.json()["id"] == seq_id
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app import fmindex, jobs
+from app.routers import sequences
+
+
+def genome(length, seed):
+    rng = np.random.default_rng(seed)
+    return np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, size=length)].tobytes().decode()
+
+
+@pytest.fixture
+def pending_jobs(monkeypatch):
+    """
+    Background builds are recorded as jobs that never start, so they stay running.
+    """
+    submitted = []
+
+    def submit(kind, seq_id, params, fn, *args, on_done=None):
+        if kind == "index":
+            submitted.append(args)
+        return jobs.view(jobs._new_job(kind, seq_id, params)["id"])
+
+    monkeypatch.setattr(jobs, "submit", submit)
+    monkeypatch.setattr(jobs, "INLINE_MAX_LENGTH", 0)
+    monkeypatch.setattr(sequences, "_index_builds", {})
+    return submitted
+
+
+def test_small_sequences_are_indexed_inline(client, upload):
+    seq_id = upload(genome(5000, 0))
+    response = client.post(f"/sequences/{seq_id}/index")
+    assert response.status_code == 200
+    assert response.json()["length"] == 5000
+    hit = client.post(f"/sequences/{seq_id}/motif", json={"pattern": "ACGTA"}).json()
+    assert hit["indexed"] is True
+
+
+def test_one_build_per_content(client, upload, pending_jobs):
+    first = upload(genome(3000, 1))
+    twin = upload(genome(3000, 1))
+    response = client.post(f"/sequences/{first}/index")
+    assert response.status_code == 202
+    again = client.post(f"/sequences/{twin}/index")
+    assert again.status_code == 202
+    assert again.json()["id"] == response.json()["id"]
+    # searches while the build runs scan (as jobs, at this size) instead of starting more builds
+    for seq_id in (first, twin):
+        assert client.post(f"/sequences/{seq_id}/motif", json={"pattern": "ACG"}).json()["kind"] == "motif"
+    assert len(pending_jobs) == 1
+
+
+def test_concurrent_builds_are_limited(client, upload, pending_jobs, monkeypatch):
+    monkeypatch.setattr(fmindex, "MAX_BUILDS", 2)
+    ids = [upload(genome(2000, seed)) for seed in (10, 11, 12)]
+    assert client.post(f"/sequences/{ids[0]}/index").status_code == 202
+    client.post(f"/sequences/{ids[1]}/motif", json={"pattern": "ACG"})
+    assert client.post(f"/sequences/{ids[2]}/index").status_code == 503
+    assert len(pending_jobs) == 2
+
+    # a finished build frees its slot
+    build = sequences._index_builds[next(iter(sequences._index_builds))]
+    jobs._finish(jobs._jobs[build])
+    assert client.post(f"/sequences/{ids[2]}/index").status_code == 202
@@ -0,0 +1,47 @@
+import numpy as np
+
+from app import fmindex, motif
+
+
+def genome(length, seed):
+    rng = np.random.default_rng(seed)
+    return np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, size=length)].tobytes().decode()
+
+
+def pages(client, seq_id, pattern, limit):
+    hits, cursor = [], 0
+    while cursor is not None:
+        page = client.post(f"/sequences/{seq_id}/motif",
+                           json={"pattern": pattern, "limit": limit, "cursor": cursor}).json()
+        hits += [(m["start"], m["end"]) for m in page["matches"]]
+        cursor = page["next_cursor"]
+    return page, hits
+
+
+def test_index_pages_match_a_scan(client, upload, monkeypatch):
+    seq_id = upload(genome(20000, 3))
+    assert client.post(f"/sequences/{seq_id}/index").status_code == 200
+    scanned = client.post(f"/sequences/{seq_id}/motif",
+                          json={"pattern": "AC", "use_index": False, "limit": 100000}).json()
+
+    calls = []
+    locate = fmindex.FMIndex.locate
+    monkeypatch.setattr(fmindex.FMIndex, "locate", lambda self, p: calls.append(p) or locate(self, p))
+    monkeypatch.setattr(motif, "_located_cache", motif.OrderedDict())
+    monkeypatch.setattr(motif, "_located_bytes", 0)
+    last, hits = pages(client, seq_id, "AC", 97)
+    assert last["indexed"] is True
+    assert hits == [(m["start"], m["end"]) for m in scanned["matches"]]
+    # every page after the first is served from the cached positions
+    assert len(calls) == 1
+
+
+def test_oversized_results_are_not_cached(client, upload, monkeypatch):
+    seq_id = upload(genome(5000, 4))
+    client.post(f"/sequences/{seq_id}/index")
+    monkeypatch.setattr(motif, "_located_cache", motif.OrderedDict())
+    monkeypatch.setattr(motif, "_located_bytes", 0)
+    monkeypatch.setattr(motif, "LOCATE_CACHE_BYTES", 16)
+    _, hits = pages(client, seq_id, "A", 500)
+    assert len(hits) == genome(5000, 4).count("A")
+    assert not motif._located_cache
@@ -0,0 +1,172 @@
+import itertools
+import time
+
+import numpy as np
+import pytest
+
+from app import motif, seqfile
+
+
+class Stored:
+    """
+    In-memory stand-in for an open sequence file.
+    """
+
+    def __init__(self, text):
+        self.text = text.encode("ascii")
+
+    def __len__(self):
+        return len(self.text)
+
+    def slice(self, start, end):
+        return self.text[max(start, 0):end]
+
+    def iter_chunks(self, chunk_size=seqfile.CHUNK_SIZE, start=0, end=None):
+        end = len(self.text) if end is None else end
+        for offset in range(start, end, chunk_size):
+            yield self.text[offset:min(offset + chunk_size, end)]
+
+
+def genome(length, seed, alphabet="ACGT"):
+    rng = np.random.default_rng(seed)
+    return "".join(rng.choice(list(alphabet), size=length))
+
+
+def matches(a, b):
+    # text symbol vs pattern code; N in the text never matches
+    return a in "ACGT" and bool(motif.IUPAC_MASKS[a] & motif.IUPAC_MASKS[b])
+
+
+def complement(pattern):
+    pairs = dict(zip("ACGTRYSWKMBDHVN", "TGCAYRSWMKVHDBN"))
+    return "".join(pairs[ch] for ch in reversed(pattern))
+
+
+def edit_distance(pattern, text):
+    previous = list(range(len(text) + 1))
+    for i, ch in enumerate(pattern, start=1):
+        current = [i]
+        for j, t in enumerate(text, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (not matches(t, ch))))
+        previous = current
+    return previous[-1]
+
+
+def brute_mismatches(text, pattern, k, strands):
+    hits = []
+    for strand, masks in strands:
+        for i in range(len(text) - len(masks) + 1):
+            window = text[i:i + len(masks)]
+            distance = sum(not matches(t, p) for t, p in zip(window, masks))
+            if distance <= k:
+                hits.append((i, i + len(masks), window, strand, distance))
+    return sorted(hits)
+
+
+def brute_edits(text, pattern, k, strands):
+    # best (first lowest) end of every run of consecutive ends within k edits,
+    # with the rightmost start among its best alignments
+    hits = []
+    for strand, masks in strands:
+        m = len(masks)
+        best_at = {}
+        for end in range(1, len(text) + 1):
+            starts = range(max(0, end - m - k), end + 1)
+            distances = [(edit_distance(masks, text[s:end]), -s) for s in starts]
+            distance, start = min(distances)
+            if distance <= k:
+                best_at[end] = (distance, -start)
+        for _, run in itertools.groupby(enumerate(sorted(best_at)), lambda p: p[1] - p[0]):
+            ends = [end for _, end in run]
+            end = min(ends, key=lambda e: (best_at[e][0], e))
+            distance, start = best_at[end]
+            hits.append((start, end, text[start:end], strand, distance))
+    return sorted(hits)
+
+
+def strands_of(pattern, both):
+    return [("+", pattern)] + ([("-", complement(pattern))] if both else [])
+
+
+def scan(text, pattern, chunk_size, start=0, **options):
+    found = motif.iter_approximate(Stored(text), pattern, start=start, chunk_size=chunk_size, **options)
+    return list(found)
+
+
+def test_literal_matches_find():
+    text = genome(3000, 0) + "ACACACAC"
+    expected = [i for i in range(len(text)) if text.startswith("ACA", i)]
+    for chunk_size in (1, 2, 7, 64, 4096):
+        found = motif.iter_literal(Stored(text), "ACA", chunk_size=chunk_size)
+        assert [hit[0] for hit in found] == expected
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_mismatches_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    text = genome(400, seed, "ACGTN" if seed % 3 == 0 else "ACGT")
+    pattern = genome(int(rng.integers(3, 9)), seed + 100, "ACGTRYN" if seed % 2 else "ACGT")
+    k = int(rng.integers(1, len(pattern)))
+    both = bool(seed % 2)
+    expected = brute_mismatches(text, pattern, k, strands_of(pattern, both))
+    for chunk_size in (1, 5, 16, 1000):
+        assert scan(text, pattern, chunk_size, max_errors=k, both_strands=both, iupac=True) == expected
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_edits_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    text = genome(150, seed, "ACGTN" if seed % 4 == 0 else "ACGT")
+    pattern = genome(int(rng.integers(3, 7)), seed + 100)
+    k = int(rng.integers(1, len(pattern)))
+    both = bool(seed % 2)
+    expected = brute_edits(text, pattern, k, strands_of(pattern, both))
+    assert scan(text, pattern, 1000, max_errors=k, both_strands=both, indels=True) == expected
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_edits_do_not_depend_on_chunks_or_cursor(seed):
+    rng = np.random.default_rng(seed)
+    text = genome(int(rng.integers(50, 600)), seed, "ACGTN" if seed % 5 == 0 else "ACGT")
+    pattern = genome(int(rng.integers(3, 9)), seed + 1000)
+    k = int(rng.integers(1, len(pattern)))
+    options = {"max_errors": k, "indels": True, "both_strands": bool(seed % 2)}
+    whole = scan(text, pattern, len(text), **options)
+    for chunk_size in (1, 2, 3, 7, 16, 33):
+        assert scan(text, pattern, chunk_size, **options) == whole
+    for cursor in sorted({0, 1, len(text) // 3, len(text) // 2, len(text) - 1} | {h[0] for h in whole[::5]}):
+        expected = [hit for hit in whole if hit[0] >= cursor]
+        for chunk_size in (4, 16, len(text)):
+            assert scan(text, pattern, chunk_size, start=cursor, **options) == expected
+
+
+def test_edits_in_long_repeats_resume_exactly():
+    # a run of matching ends can cover a whole repeat, far longer than the pattern
+    text = genome(100, 1) + "A" * 500 + genome(100, 2)
+    options = {"max_errors": 1, "indels": True}
+    whole = scan(text, "AAAA", len(text), **options)
+    for cursor in (150, 400, 600):
+        assert scan(text, "AAAA", 64, start=cursor, **options) == [hit for hit in whole if hit[0] >= cursor]
+
+
+@pytest.mark.parametrize("pattern", ["GA[AT]TC", "A{2,5}C", "(AC|GT)+", "AC.{0,5}GT", "(?=AC)A", "A*", "G.*?T"])
+@pytest.mark.parametrize("start", [0, 517])
+def test_windowed_regex_matches_a_full_search(pattern, start):
+    text = genome(20_000, 7)
+    compiled = motif.check_regex(pattern)
+    found = [(s, e) for s, e, _ in motif.iter_regex(Stored(text), compiled, start)]
+    assert found == [m.span() for m in compiled.finditer(text.encode("ascii"), start)]
+
+
+@pytest.mark.parametrize("pattern", ["[AC]*[AG]*X", "A$", r"\bACG", "(A+)+", "(A|AA)+"])
+def test_regex_that_cannot_be_bounded_is_rejected(pattern):
+    with pytest.raises(motif.MotifError):
+        motif.check_regex(pattern)
+
+
+def test_backtracking_regex_stops_at_the_time_limit():
+    compiled = motif.check_regex("[ACGT]*X")
+    started = time.monotonic()
+    with pytest.raises(motif.MotifError, match="time limit"):
+        list(motif.iter_regex(Stored(genome(300_000, 8)), compiled, time_limit=0.5))
+    assert time.monotonic() - started < 1.5
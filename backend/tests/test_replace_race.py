@@ -0,0 +1,45 @@
+import threading
+import time
+
+from app import storage
+
+
+def test_reads_during_replacement_never_miss(client, upload):
+    contents = ["ACGT" * 5000, "GGCA" * 5000]
+    seq_id = upload(contents[0])
+    stop = threading.Event()
+    failures = []
+
+    def replace():
+        turn = 0
+        while not stop.is_set():
+            turn += 1
+            response = client.put(f"/sequences/{seq_id}", json={"sequence": contents[turn % 2]})
+            if response.status_code != 200:
+                failures.append(("put", response.status_code))
+
+    def read():
+        try:
+            check()
+        except Exception as e:
+            failures.append(("read", repr(e)))
+
+    def check():
+        while not stop.is_set():
+            for path in ("", "/gc", "/region?start=1&end=8"):
+                response = client.get(f"/sequences/{seq_id}{path}")
+                if response.status_code != 200:
+                    failures.append((path, response.status_code))
+            response = client.get(f"/sequences/{seq_id}", params={"download": True})
+            if response.status_code != 200 or response.text not in contents:
+                failures.append(("download", response.status_code))
+
+    threads = [threading.Thread(target=replace)] + [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(3)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert failures == []
+    assert storage.resolve(seq_id) is not None
@@ -0,0 +1,62 @@
+import gzip
+import os
+
+from app import catalog, storage
+from app.config import DATA_DIR
+
+
+def write_text(path, sequence):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(sequence)
+
+
+def test_an_id_does_not_resolve_to_a_longer_id_it_prefixes(client):
+    short = storage.new_id()
+    long = short + "0"
+    write_text(os.path.join(DATA_DIR, f"{long}.txt"), "GGGG")
+    assert storage.resolve(short) is None
+    write_text(os.path.join(DATA_DIR, f"{short}.txt"), "AAAA")
+    assert storage.resolve(short).raw == os.path.join(DATA_DIR, f"{short}.txt")
+    assert storage.resolve(long).raw == os.path.join(DATA_DIR, f"{long}.txt")
+    assert client.get(f"/sequences/{short}").json()["sequence"] == "AAAA"
+
+
+def test_raw_file_wins_over_its_compressed_artifact(client):
+    seq_id = storage.new_id()
+    raw = os.path.join(DATA_DIR, f"{seq_id}.txt")
+    write_text(raw, "ACGTACGT")
+    with gzip.open(raw + ".gz", "wt") as f:
+        f.write("ACGTACGT")
+    artifacts = storage.resolve(seq_id)
+    assert artifacts.raw == raw
+    assert artifacts.compressed == raw + ".gz"
+
+
+def test_files_written_by_another_worker_are_found(client, upload):
+    # content no other test uploads, so the blob is this id's alone
+    seq_id = upload("".join("ACGT"[int(c, 16) % 4] for c in storage.new_id() * 8))
+    assert storage.resolve(seq_id) is not None
+    # another worker deletes and writes behind this process's index
+    catalog.remove(seq_id)
+    storage.remove_files([storage.resolve(seq_id).raw])
+    assert storage.resolve(seq_id) is None
+    raw = storage.raw_path_for(seq_id, ext=".txt")
+    write_text(raw, "TTTT")
+    assert storage.resolve(seq_id).raw == raw
+
+
+def test_reshard_moves_flat_files_into_shard_directories(client):
+    seq_id = storage.new_id()
+    flat = os.path.join(DATA_DIR, f"{seq_id}.txt")
+    write_text(flat, "CCCCGGGG")
+    with gzip.open(flat + ".gz", "wt") as f:
+        f.write("CCCCGGGG")
+    catalog.record(seq_id, flat, compressed=True)
+    storage.reshard()
+    artifacts = storage.resolve(seq_id)
+    assert artifacts.raw == storage.raw_path_for(seq_id, ext=".txt")
+    assert os.path.dirname(artifacts.raw) == storage.shard_dir(seq_id) != DATA_DIR
+    assert artifacts.compressed == artifacts.raw + ".gz"
+    assert not os.path.exists(flat) and not os.path.exists(flat + ".gz")
+    assert client.get(f"/sequences/{seq_id}").json()["sequence"] == "CCCCGGGG"
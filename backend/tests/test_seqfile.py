@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+from app import seqfile
+
+
+def random_text(length, seed, ambiguous=b"NRYKM", rate=0.05):
+    rng = np.random.default_rng(seed)
+    text = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, size=length)]
+    spots = rng.random(length) < rate
+    text[spots] = np.frombuffer(ambiguous, dtype=np.uint8)[rng.integers(0, len(ambiguous), size=int(spots.sum()))]
+    # a long N run, as in assembly gaps
+    text[length // 3:length // 3 + 500] = ord("N")
+    return text.tobytes()
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 4, 1000, 1 << 20])
+def test_packed_round_trip_with_exceptions(tmp_path, chunk):
+    text = random_text(20_001, chunk)
+    path = str(tmp_path / "seq.gv2")
+    seqfile.write_packed(path, (text[i:i + chunk] for i in range(0, len(text), chunk)))
+    with seqfile.PackedSequence(path) as stored:
+        assert len(stored) == len(text)
+        assert stored.verify()
+        assert stored.slice(0, len(text)) == text
+        for start, end in [(0, 1), (6665, 7300), (6999, 7001), (19_990, 20_010), (5, 5)]:
+            assert stored.slice(start, end) == text[start:end]
+        assert b"".join(stored.iter_chunks(chunk_size=4096)) == text
+
+
+def test_runs_spanning_chunks_are_merged(tmp_path):
+    path = str(tmp_path / "seq.gv2")
+    seqfile.write_packed(path, [b"ACNN", b"NN", b"NRRA", b"N"])
+    with seqfile.PackedSequence(path) as stored:
+        assert stored.read_text() == "ACNNNNNRRAN"
+        assert list(zip(stored._exc_starts, stored._exc_ends)) == [(2, 7), (7, 9), (10, 11)]
+
+
+def test_alternating_ambiguity_codes(tmp_path):
+    text = b"RY" * 50_000
+    path = str(tmp_path / "seq.gv2")
+    seqfile.write_packed(path, (text[i:i + 4096] for i in range(0, len(text), 4096)))
+    with seqfile.PackedSequence(path) as stored:
+        assert len(stored._exc_starts) == len(text)
+        assert stored.slice(0, len(text)) == text
+        assert stored.slice(777, 9999) == text[777:9999]
+
+
+def test_truncated_files_are_rejected(tmp_path):
+    path = str(tmp_path / "seq.gv2")
+    seqfile.write_packed(path, b"ACGTNNAC")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 1)
+    with pytest.raises(seqfile.FormatError):
+        seqfile.PackedSequence(path)
+
+
+def test_text_files_read_like_packed_ones(tmp_path):
+    path = tmp_path / "seq.txt"
+    path.write_bytes(b"acgtnRY\n")
+    with seqfile.open_sequence(str(path)) as stored:
+        assert len(stored) == 7
+        assert stored.read_text() == "ACGTNRY"
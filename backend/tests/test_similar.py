@@ -0,0 +1,66 @@
+import numpy as np
+
+from app import analysis, seqfile, sketch
+
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def random_sequence(length, seed):
+    rng = np.random.default_rng(seed)
+    return np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, size=length)].tobytes().decode("ascii")
+
+
+def mutate(text, rate, seed):
+    rng = np.random.default_rng(seed)
+    data = bytearray(text, "ascii")
+    for pos in rng.choice(len(data), size=int(len(data) * rate), replace=False):
+        data[pos] = b"ACGT"[(b"ACGT".index(data[pos]) + rng.integers(1, 4)) % 4]
+    return data.decode("ascii")
+
+
+def canonical_kmers(text):
+    data = text.encode("ascii")
+    return set(analysis.canonical_kmer_codes(seqfile.base_codes(data), seqfile.base_mask(data), sketch.K).tolist())
+
+
+def test_similar_sequences_are_ranked_by_similarity(client, upload):
+    base = random_sequence(20000, seed=130)
+    query = upload(base)
+    copy = upload(base)
+    reverse = upload(base.translate(COMPLEMENT)[::-1])
+    close = upload(mutate(base, 0.005, seed=1))
+    far = upload(mutate(base, 0.015, seed=2))
+    unrelated = upload(random_sequence(20000, seed=131))
+
+    result = client.get(f"/sequences/{query}/similar", params={"top": 50}).json()
+    ids = [match["id"] for match in result["matches"]]
+    # identical content comes first; a reverse complement has the same canonical k-mers
+    assert set(ids[:2]) == {copy, reverse}
+    assert [m["jaccard"] for m in result["matches"][:2]] == [1.0, 1.0]
+    assert ids.index(close) < ids.index(far)
+    assert unrelated not in ids
+    assert query not in ids
+    jaccards = [match["jaccard"] for match in result["matches"]]
+    assert jaccards == sorted(jaccards, reverse=True)
+    by_id = {match["id"]: match for match in result["matches"]}
+    assert abs(by_id[close]["ani"] - 0.995) < 0.005
+    assert abs(by_id[far]["ani"] - 0.985) < 0.01
+
+    result = client.get(f"/sequences/{query}/similar", params={"top": 1}).json()
+    assert result["returned"] == 1 and result["matches"][0]["id"] in {copy, reverse}
+
+
+def test_sketch_estimates_jaccard():
+    base = random_sequence(50000, seed=132)
+    for rate in (0.002, 0.01, 0.02):
+        other = mutate(base, rate, seed=3)
+        a, b = canonical_kmers(base), canonical_kmers(other)
+        exact = len(a & b) / len(a | b)
+        first = sketch.sketch_chunks([base.encode("ascii")])
+        second = sketch.sketch_chunks([other.encode("ascii")])
+        estimate = float(sketch.jaccard(first.signature, second.signature[None])[0])
+        assert abs(estimate - exact) < 0.08
+
+
+def test_similar_of_unknown_id(client):
+    assert client.get("/sequences/nosuchid/similar").status_code == 404
@@ -0,0 +1,57 @@
+import pytest
+
+from app import catalog, stats, storage
+
+
+@pytest.fixture
+def no_scans(monkeypatch):
+    """
+    Fail the test if any stats are computed by reading a sequence file.
+    """
+    def scan(seq_id, path):
+        raise AssertionError(f"{seq_id} was scanned")
+
+    monkeypatch.setattr(catalog, "scan_stats", scan)
+
+
+def test_counts_are_served_without_reading_the_sequence(client, upload, no_scans):
+    seq_id = upload("GGGCCCAT")
+    for _ in range(2):
+        gc = client.get(f"/sequences/{seq_id}/gc").json()
+        assert gc["G_count"] == 3 and gc["C_count"] == 3
+        assert gc["GC_percent"] == 75.0
+    assert client.get(f"/sequences/{seq_id}/freq").json()["counts"] == {"A": 1, "T": 1, "C": 3, "G": 3}
+
+
+def test_update_replaces_cached_counts(client, upload):
+    seq_id = upload("GGGG")
+    assert client.get(f"/sequences/{seq_id}/gc").json()["GC_percent"] == 100.0
+    client.put(f"/sequences/{seq_id}", json={"sequence": "AATT"})
+    assert client.get(f"/sequences/{seq_id}/gc").json()["GC_percent"] == 0.0
+    assert client.get(f"/sequences/{seq_id}/freq").json()["length"] == 4
+
+
+def test_delete_drops_cached_counts(client, upload):
+    seq_id = upload("GCGCAT")
+    assert client.get(f"/sequences/{seq_id}/gc").status_code == 200
+    client.delete(f"/sequences/{seq_id}")
+    assert client.get(f"/sequences/{seq_id}/gc").status_code == 404
+    assert client.get(f"/sequences/{seq_id}/freq").status_code == 404
+
+
+def test_update_by_another_worker_is_picked_up(client, upload):
+    seq_id = upload("CCCCCCCC")
+    assert client.get(f"/sequences/{seq_id}/gc").json()["GC_percent"] == 100.0
+    # another worker writes the id without touching this process's cache
+    storage.store(seq_id, catalog.summarize("ATATATAT"), data=b"ATATATAT")
+    assert stats._cache[seq_id].raw != storage.resolve(seq_id).raw
+    assert client.get(f"/sequences/{seq_id}/gc").json()["GC_percent"] == 0.0
+
+
+def test_cache_is_bounded(client, upload, monkeypatch):
+    monkeypatch.setattr(stats, "CACHE_SIZE", 2)
+    ids = [upload("ACGT" * n) for n in (1, 2, 3)]
+    for seq_id in ids:
+        client.get(f"/sequences/{seq_id}/gc")
+    assert list(stats._cache)[-2:] == ids[1:]
+    assert len(stats._cache) == 2
@@ -0,0 +1,109 @@
+import gzip
+import os
+
+import pytest
+
+from app import catalog, storage
+from app.config import DATA_DIR
+
+
+@pytest.fixture
+def shared(client, upload):
+    """
+    Two ids sharing a blob and one with its own; returns (ids, blobs).
+    """
+    ids = [upload("ACGT" * 50), upload("ACGT" * 50), upload("GGCC" * 50)]
+    return ids, {storage.resolve(seq_id).raw for seq_id in ids}
+
+
+def test_lost_catalog_is_rebuilt_from_reference_files(client, shared):
+    ids, blobs = shared
+    for suffix in ("", "-wal", "-shm"):
+        storage.remove_files([catalog.CATALOG_PATH + suffix])
+    # a missing catalog is rebuilt on start
+    catalog.init()
+    for seq_id in ids:
+        assert os.path.join(DATA_DIR, catalog.get(seq_id)["filename"]) in blobs
+        assert client.get(f"/sequences/{seq_id}").status_code == 200
+    with pytest.raises(storage.GarbageCollectionRefused):
+        storage.collect_garbage()
+    storage.collect_garbage(force=True)
+    assert all(os.path.exists(blob) for blob in blobs)
+
+
+def test_gc_refuses_an_empty_catalog(client, shared):
+    ids, blobs = shared
+    with catalog.transaction() as conn:
+        conn.execute("DELETE FROM sequences")
+    try:
+        with pytest.raises(storage.GarbageCollectionRefused):
+            storage.collect_garbage()
+        # forced, the reference files still keep every blob
+        storage.collect_garbage(force=True)
+        assert all(os.path.exists(blob) for blob in blobs)
+    finally:
+        catalog.rebuild()
+    assert all(catalog.get(seq_id) is not None for seq_id in ids)
+
+
+def test_deleted_ids_stay_deleted(client, upload):
+    seq_id = upload("TTTACG" * 40)
+    blob = storage.resolve(seq_id).raw
+    assert client.delete(f"/sequences/{seq_id}").status_code == 200
+    assert not os.path.exists(catalog.ref_path(seq_id))
+    assert not os.path.exists(blob)
+    catalog.rebuild()
+    assert catalog.get(seq_id) is None
+
+
+def test_duplicate_upload_leaves_the_blob_alone(client, upload):
+    first = upload("CCGGTA" * 40)
+    blob = storage.resolve(first).raw
+    os.utime(blob, (1_000_000, 1_000_000))
+    second = upload("CCGGTA" * 40)
+    assert storage.resolve(second).raw == blob
+    assert os.path.getmtime(blob) == 1_000_000
+    # the newer id lists first, and the first keeps its own upload time
+    assert catalog.get(second)["mtime"] > catalog.get(first)["mtime"] > 1_000_000
+    items = client.get("/sequences/", params={"sort": "mtime", "order": "desc"}).json()["items"]
+    ids = [item["id"] for item in items]
+    assert ids.index(second) < ids.index(first)
+    catalog.rebuild()
+    assert catalog.get(first)["mtime"] < catalog.get(second)["mtime"]
+
+
+def test_dedupe_keeps_legacy_gzip_of_migrated_files(client):
+    seq_id = storage.new_id()
+    text = os.path.join(DATA_DIR, f"{seq_id}.txt")
+    with open(text, "w") as f:
+        f.write("ACGTTGCA" * 64)
+    with gzip.open(text + ".gz", "wt") as f:
+        f.write("ACGTTGCA" * 64)
+    catalog.record(seq_id, text, compressed=True)
+    storage.migrate()
+    storage.dedupe()
+    artifacts = storage.refresh(seq_id)
+    assert storage.is_blob(artifacts.raw)
+    assert artifacts.compressed is not None and os.path.exists(artifacts.compressed)
+    assert catalog.get(seq_id)["compressed"]
+    response = client.get(f"/sequences/{seq_id}/decompress")
+    assert response.status_code == 200
+    assert response.json()["lossless_verification"] is True
+
+
+def test_migrate_converts_text_files_to_packed(client, capsys):
+    seq_id = storage.new_id()
+    sequence = "ACGTNNNNNRYKMacgt" * 30 + "N" * 200
+    text = storage.raw_path_for(seq_id, ext=".txt")
+    with open(text, "w") as f:
+        f.write(sequence)
+    catalog.record(seq_id, text)
+    before = client.get(f"/sequences/{seq_id}/freq").json()
+    storage.main(["migrate"])
+    assert "Converted" in capsys.readouterr().out
+    artifacts = storage.refresh(seq_id)
+    assert artifacts.raw == storage.raw_path_for(seq_id)
+    assert not os.path.exists(text)
+    assert catalog.get(seq_id)["filename"].endswith(".gv2")
+    assert client.get(f"/sequences/{seq_id}").json()["sequence"] == sequence.upper()
+    assert client.get(f"/sequences/{seq_id}/freq").json() == before
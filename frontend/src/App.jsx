@@ -8,6 +8,9 @@ import FreqCard from './components/FreqCard'
 import MotifSearchCard from './components/MotifSearchCard'
 import { api } from './lib/api'
 
+// sequences fetched per page of the list
+const PAGE_SIZE = 100
+
 export default function App() {
   const [seqId, setSeqId] = useState('')
   const [seqPreview, setSeqPreview] = useState('')
@@ -15,20 +18,40 @@ export default function App() {
   const [seqFullLoading, setSeqFullLoading] = useState(false)
   const [editState, setEditState] = useState({ mode: 'create' })
   const [items, setItems] = useState([])
+  const [total, setTotal] = useState(0)
   const [loadingList, setLoadingList] = useState(false)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   const loadList = async () => {
     setLoadingList(true)
     try {
-      const data = await api.listSequences()
-      setItems(data.items || [])
+      // reload as many sequences as are shown (the API returns at most 1000 at once)
+      const data = await api.listSequences(0, Math.min(Math.max(items.length, PAGE_SIZE), 1000))
+      const loaded = data.items || []
+      setItems(loaded)
+      setTotal(data.total ?? loaded.length)
       // keep selection if still exists
-      if (seqId && !(data.items || []).some(x => x.id === seqId)) { setSeqId(''); setSeqPreview(''); setSeqFull('') }
+      if (seqId && loaded.length >= (data.total ?? 0) && !loaded.some(x => x.id === seqId)) { setSeqId(''); setSeqPreview(''); setSeqFull('') }
     } finally {
       setLoadingList(false)
     }
   }
 
+  const loadMore = async () => {
+    setLoadingMore(true)
+    try {
+      const data = await api.listSequences(items.length, PAGE_SIZE)
+      // uploads since the last page shift the offsets: skip ids already listed
+      setItems(prev => {
+        const seen = new Set(prev.map(x => x.id))
+        return [...prev, ...(data.items || []).filter(x => !seen.has(x.id))]
+      })
+      setTotal(data.total ?? total)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   useEffect(() => { loadList() }, [])
 
   const selectSequence = async (it) => {
@@ -60,9 +83,12 @@ export default function App() {
           <div style={{marginTop:12}}>
             <SequenceList
               items={items}
+              total={total}
               selectedId={seqId}
               onSelect={selectSequence}
               onRefresh={loadList}
+              onLoadMore={loadMore}
+              loadingMore={loadingMore}
               onViewUpdate={async (it)=>{
                 // enter edit mode: fetch full DNA, prefill form
                 setSeqId(''); setSeqPreview(''); setSeqFull('')
@@ -1,10 +1,13 @@
 import React, { useState } from 'react'
 import { api } from '../lib/api'
 
+const CODECS = ['gzip-1', 'gzip-6', 'gzip-9', 'zlib-1', 'zlib-6', 'zlib-9', 'lzma', 'bz2', '2bit', '2bit-huffman', '2bit-lzma', 'cm2', 'cm12']
+
 export default function CompressCard({ seqId }) {
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
   const [result, setResult] = useState(null)
+  const [codec, setCodec] = useState('gzip-9')
 
   const doCompress = async () => {
     setError('')
@@ -12,7 +15,7 @@ export default function CompressCard({ seqId }) {
     if (!seqId) { setError('Upload or select a sequence first.'); return }
     try {
       setLoading(true)
-      const data = await api.compress(seqId)
+      const data = await api.compress(seqId, codec)
       setResult(data)
     } catch (e) {
       setError(e.message)
@@ -24,13 +27,19 @@ export default function CompressCard({ seqId }) {
   return (
     <div className="card">
       <h2>Compress</h2>
+      <div className="field">
+        <label>Codec</label>
+        <select value={codec} onChange={(e) => setCodec(e.target.value)} disabled={loading}>
+          {CODECS.map(c => <option key={c} value={c}>{c}</option>)}
+        </select>
+      </div>
       <button className="btn" onClick={doCompress} disabled={loading || !seqId}>
-        {loading ? 'Compressing...' : 'Compress .txt → .gz'}
+        {loading ? 'Compressing...' : 'Compress'}
       </button>
       {error && <div className="error">{error}</div>}
       {result && (
         <div className="success">
-          Ratio: {result.compression_ratio} • {result.compressed_file}
+          Ratio: {result.compression_ratio} • {result.bits_per_base} bits/base • {result.compressed_file}
         </div>
       )}
     </div>
@@ -25,12 +25,12 @@ export default function DecompressCard({ seqId }) {
     <div className="card">
       <h2>Decompress & Verify</h2>
       <button className="btn" onClick={doDecompress} disabled={loading || !seqId}>
-        {loading ? 'Decompressing...' : 'Decompress .gz'}
+        {loading ? 'Decompressing...' : 'Decompress'}
       </button>
       {error && <div className="error">{error}</div>}
       {result && (
         <div className="success">
-          Length: {result.length} • Lossless: {String(result.lossless_verification)}
+          Length: {result.length} • Codec: {result.codec} • Lossless: {String(result.lossless_verification)}
           <div className="muted">{result.sequence_preview}</div>
         </div>
       )}
@@ -4,6 +4,9 @@ import { api } from '../lib/api'
 export default function MotifSearchCard({ seqId }) {
   const [pattern, setPattern] = useState('ATG')
   const [useRegex, setUseRegex] = useState(false)
+  const [mismatches, setMismatches] = useState(0)
+  const [bothStrands, setBothStrands] = useState(false)
+  const [iupac, setIupac] = useState(false)
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
   const [result, setResult] = useState(null)
@@ -14,7 +17,8 @@ export default function MotifSearchCard({ seqId }) {
     if (!seqId) { setError('Upload or select a sequence first.'); return }
     try {
       setLoading(true)
-      const data = await api.motif(seqId, pattern, useRegex)
+      const options = useRegex ? {} : { max_mismatches: Number(mismatches), both_strands: bothStrands, iupac }
+      const data = await api.motif(seqId, pattern, useRegex, options)
       setResult(data)
     } catch (e) {
       setError(e.message)
@@ -34,6 +38,16 @@ export default function MotifSearchCard({ seqId }) {
         <label className="checkbox">
           <input type="checkbox" checked={useRegex} onChange={(e) => setUseRegex(e.target.checked)} /> Use regex
         </label>
+        <label className="checkbox">
+          <input type="checkbox" checked={bothStrands} disabled={useRegex} onChange={(e) => setBothStrands(e.target.checked)} /> Both strands
+        </label>
+        <label className="checkbox">
+          <input type="checkbox" checked={iupac} disabled={useRegex} onChange={(e) => setIupac(e.target.checked)} /> IUPAC codes
+        </label>
+      </div>
+      <div className="field">
+        <label>Max mismatches</label>
+        <input type="number" min="0" max="10" value={mismatches} disabled={useRegex} onChange={(e) => setMismatches(e.target.value)} />
       </div>
       <button className="btn" onClick={run} disabled={loading || !seqId}>
         {loading ? 'Searching...' : 'Search'}
@@ -41,10 +55,10 @@ export default function MotifSearchCard({ seqId }) {
       {error && <div className="error">{error}</div>}
       {result && (
         <div className="success">
-          Total matches: {result.total_matches}
+          Total matches: {result.total_matches ?? `${result.returned}+`}
           <div className="muted" style={{maxHeight: 140, overflow: 'auto'}}>
             {result.matches.map((m, i) => (
-              <div key={i}>[{m.start}-{m.end}] {m.match}</div>
+              <div key={i}>[{m.start}-{m.end}] {m.match}{m.strand ? ` (${m.strand}, d=${m.distance})` : ''}</div>
             ))}
           </div>
         </div>
@@ -1,13 +1,13 @@
 import React from 'react'
 
-export default function SequenceList({ items, selectedId, onSelect, onRefresh, onViewUpdate, onDelete }) {
+export default function SequenceList({ items, total, selectedId, onSelect, onRefresh, onLoadMore, loadingMore, onViewUpdate, onDelete }) {
   return (
     <div className="card" style={{minWidth: 440}}>
       <div style={{display:'flex',justifyContent:'space-between',alignItems:'center',marginBottom:8}}>
         <h2 style={{margin:0}}>Sequences</h2>
         <button className="btn" onClick={onRefresh}>Refresh</button>
       </div>
-      <div className="muted" style={{marginBottom:8}}>{items.length} items</div>
+      <div className="muted" style={{marginBottom:8}}>{total > items.length ? `${items.length} of ${total}` : items.length} items</div>
       <div style={{display:'grid',gap:8}}>
         {items.map(it => (
           <div key={it.id} className="btn" onClick={() => onSelect(it)} style={{
@@ -18,7 +18,7 @@ export default function SequenceList({ items, selectedId, onSelect, onRefresh, o
               <div style={{fontFamily:'ui-monospace, SFMono-Regular, Menlo, monospace', whiteSpace:'nowrap', overflow:'hidden', textOverflow:'ellipsis'}}>
                 {it.preview || '(empty)'}
               </div>
-              <div className="muted" style={{fontSize:12}}>{it.length ?? '?'} bp {it.compressed ? '• gz' : ''}</div>
+              <div className="muted" style={{fontSize:12}}>{it.name ? `${it.name} • ` : ''}{it.length ?? '?'} bp {it.compressed ? '• gz' : ''}</div>
             </div>
             <div style={{display:'flex', gap:6}} onClick={(e)=>e.stopPropagation()}>
               <button className="btn" onClick={()=>onViewUpdate?.(it)}>Edit</button>
@@ -27,6 +27,11 @@ export default function SequenceList({ items, selectedId, onSelect, onRefresh, o
           </div>
         ))}
         {items.length===0 && <div className="muted">No sequences yet.</div>}
+        {total > items.length && (
+          <button className="btn" onClick={onLoadMore} disabled={loadingMore}>
+            {loadingMore ? 'Loading…' : `Load more (${total - items.length} left)`}
+          </button>
+        )}
       </div>
     </div>
   )
@@ -20,9 +20,39 @@ async function request(path, options = {}) {
   return data
 }
 
+// POST a JSON body to an NDJSON endpoint, calling onLine for every parsed line; resolves to the last (summary) line
+async function requestLines(path, body, onLine) {
+  const res = await fetch(`${base}${path}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  })
+  if (!res.ok) {
+    let msg = res.statusText
+    try { msg = (await res.json()).detail || msg } catch {}
+    throw new Error(typeof msg === 'string' ? msg : JSON.stringify(msg))
+  }
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let last = null
+  for (;;) {
+    const { done, value } = await reader.read()
+    buffer += decoder.decode(value || new Uint8Array(), { stream: !done })
+    const lines = buffer.split('\n')
+    buffer = done ? '' : lines.pop()
+    for (const line of lines) {
+      if (!line) continue
+      last = JSON.parse(line)
+      if (onLine) onLine(last)
+    }
+    if (done) return last
+  }
+}
+
 export const api = {
   root: () => request('/'),
-  listSequences: () => request('/sequences/'),
+  listSequences: (offset=0, limit=100) => request(`/sequences/?offset=${offset}&limit=${limit}`),
   uploadSequence: (sequence) => request('/sequences/', {
     method: 'POST',
     body: JSON.stringify({ sequence })
@@ -33,12 +63,24 @@ export const api = {
     body: JSON.stringify({ sequence })
   }),
   deleteSequence: (id) => request(`/sequences/${id}`, { method: 'DELETE' }),
-  compress: (id) => request(`/sequences/${id}/compress`, { method: 'POST' }),
+  compress: (id, codec='gzip-9') => request(`/sequences/${id}/compress?codec=${encodeURIComponent(codec)}`, { method: 'POST' }),
   decompress: (id) => request(`/sequences/${id}/decompress`),
+  region: (id, start, end, source='raw') => request(`/sequences/${id}/region?start=${start}&end=${end}&source=${source}`),
   gc: (id) => request(`/sequences/${id}/gc`),
   freq: (id) => request(`/sequences/${id}/freq`),
-  motif: (id, pattern, use_regex=false) => request(`/sequences/${id}/motif`, {
+  kmers: (id, k=6, top=20) => request(`/sequences/${id}/kmers?k=${k}&top=${top}`),
+  similar: (id, top=10) => request(`/sequences/${id}/similar?top=${top}`),
+  windows: (id, window=1000, step=window, max_points=1000) => request(`/sequences/${id}/windows?window=${window}&step=${step}&max_points=${max_points}`),
+  motif: (id, pattern, use_regex=false, options={}) => request(`/sequences/${id}/motif`, {
     method: 'POST',
-    body: JSON.stringify({ pattern, use_regex })
-  })
+    body: JSON.stringify({ pattern, use_regex, ...options })
+  }),
+  submitJob: (id, kind, params={}) => request(`/sequences/${id}/jobs`, {
+    method: 'POST',
+    body: JSON.stringify({ kind, params })
+  }),
+  batchUpload: (sequences, onItem) => requestLines('/sequences/batch', { sequences }, onItem),
+  batchAnalyze: (ids, operations, params={}, onItem) => requestLines('/sequences/batch/analyze', { ids, operations, params }, onItem),
+  job: (jobId) => request(`/jobs/${jobId}`),
+  cancelJob: (jobId) => request(`/jobs/${jobId}`, { method: 'DELETE' })
 }